@@ -0,0 +1,243 @@
+"""
+Adaptive Model Router
+=====================
+Optional router mode (ROUTER_MODE = "adaptive") that combines the keyword
+rules in router.py with a small classifier trained on logged outcomes.
+
+With ROUTER_FEEDBACK_ENABLED (the default in adaptive mode), every answered
+query that had an embedding is logged:
+  - the query embedding (already computed for retrieval)
+  - the model the rules picked and the model actually used
+  - evaluator flags, latency and token usage
+The log is rotated to <path>.1 once it passes ROUTER_FEEDBACK_MAX_BYTES, so
+at most two files' worth is kept; training reads both.
+
+`train()` fits one logistic regression per model on those logs, predicting
+whether the answer will be "good" (no refusal / no_context flag).
+At inference the cheapest model whose predicted quality meets
+ROUTER_QUALITY_TARGET and whose average latency fits ROUTER_LATENCY_BUDGET_MS
+is chosen; otherwise the rule-based choice stands.
+
+Inference is deterministic: the weights are frozen in ROUTER_MODEL_PATH and
+only change when `python adaptive_router.py train` is run.
+
+Usage:
+  python adaptive_router.py train    # fit weights from router_feedback.jsonl
+  python adaptive_router.py report   # compare cost/latency mix: rules vs adaptive
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from config import (
+    ROUTER_FEEDBACK_PATH, ROUTER_MODEL_PATH, ROUTER_QUALITY_TARGET, ROUTER_MIN_SAMPLES,
+    ROUTER_LATENCY_BUDGET_MS, ROUTER_FEEDBACK_ENABLED, ROUTER_FEEDBACK_MAX_BYTES, MODEL_PRICES
+)
+
+# Flags that mean the answer did not meet the quality bar
+BAD_FLAGS = {"refusal", "no_context"}
+
+_router_model = None
+
+
+# --- Feedback logging ---
+
+def record_outcome(embedding, rule_model, model_used, flags, latency_ms, tokens_input, tokens_output):
+    """Append one answered query to the feedback log (no-op unless ROUTER_FEEDBACK_ENABLED)."""
+    if not ROUTER_FEEDBACK_ENABLED:
+        return
+    entry = {
+        "embedding": [round(float(x), 5) for x in np.asarray(embedding).ravel()],
+        "rule_model": rule_model,
+        "model_used": model_used,
+        "flags": flags,
+        "latency_ms": latency_ms,
+        "tokens_input": tokens_input,
+        "tokens_output": tokens_output
+    }
+    if os.path.exists(ROUTER_FEEDBACK_PATH) and os.path.getsize(ROUTER_FEEDBACK_PATH) > ROUTER_FEEDBACK_MAX_BYTES:
+        os.replace(ROUTER_FEEDBACK_PATH, ROUTER_FEEDBACK_PATH + ".1")
+    with open(ROUTER_FEEDBACK_PATH, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def load_feedback(path=ROUTER_FEEDBACK_PATH):
+    """Load logged outcomes (rotated file first), skipping failed LLM calls (no quality signal)."""
+    rows = []
+    for part in (path + ".1", path):
+        if not os.path.exists(part):
+            continue
+        with open(part) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                if row["tokens_output"] > 0:
+                    rows.append(row)
+    return rows
+
+
+# --- Training ---
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def _fit_logistic(X, y, l2=1.0, lr=0.5, iterations=500):
+    """L2-regularised logistic regression by full-batch gradient descent (deterministic)."""
+    X = np.hstack([X, np.ones((X.shape[0], 1), dtype="float32")])
+    w = np.zeros(X.shape[1], dtype="float64")
+    n = X.shape[0]
+    for _ in range(iterations):
+        grad = X.T @ (_sigmoid(X @ w) - y) / n
+        grad[:-1] += l2 * w[:-1] / n
+        w -= lr * grad
+    return w
+
+
+def _expected_cost(model, tokens_input, tokens_output):
+    """USD cost of one request given average token usage."""
+    prices = MODEL_PRICES.get(model, {"input": 0.0, "output": 0.0})
+    return (tokens_input * prices["input"] + tokens_output * prices["output"]) / 1_000_000
+
+
+def train(feedback_path=ROUTER_FEEDBACK_PATH, model_path=ROUTER_MODEL_PATH):
+    """Fit per-model quality classifiers and cost/latency stats, and save them."""
+    rows = load_feedback(feedback_path)
+    if not rows:
+        print(f"[ERROR] No feedback found at {feedback_path}")
+        return None
+
+    models, weights, samples, latency, cost = [], [], [], [], []
+    for model in sorted(MODEL_PRICES):
+        model_rows = [r for r in rows if r["model_used"] == model]
+        if not model_rows:
+            continue
+
+        X = np.array([r["embedding"] for r in model_rows], dtype="float32")
+        y = np.array([0.0 if BAD_FLAGS & set(r["flags"]) else 1.0 for r in model_rows])
+
+        models.append(model)
+        weights.append(_fit_logistic(X, y))
+        samples.append(len(model_rows))
+        latency.append(np.mean([r["latency_ms"] for r in model_rows]))
+        cost.append(_expected_cost(
+            model,
+            np.mean([r["tokens_input"] for r in model_rows]),
+            np.mean([r["tokens_output"] for r in model_rows])
+        ))
+        print(f"  {model}: {len(model_rows)} samples, {y.mean():.0%} good, "
+              f"{latency[-1]:.0f}ms avg, ${cost[-1] * 1000:.4f}/1k requests")
+
+    np.savez(
+        model_path,
+        models=np.array(models),
+        weights=np.array(weights),
+        samples=np.array(samples),
+        latency_ms=np.array(latency),
+        cost=np.array(cost)
+    )
+    print(f"Saved router model to {model_path}")
+    return model_path
+
+
+# --- Inference ---
+
+def _load_router_model():
+    """Lazy-load the trained router weights (None if not trained yet)."""
+    global _router_model
+
+    if _router_model is None and os.path.exists(ROUTER_MODEL_PATH):
+        data = np.load(ROUTER_MODEL_PATH)
+        order = np.argsort(data["cost"], kind="stable")  # cheapest model first
+        _router_model = {
+            "models": [str(m) for m in data["models"][order]],
+            "weights": data["weights"][order],
+            "samples": data["samples"][order],
+            "latency_ms": data["latency_ms"][order],
+            "cost": data["cost"][order]
+        }
+    return _router_model
+
+
+def predict_quality(embedding):
+    """Predicted probability of a good answer for each trained model."""
+    router_model = _load_router_model()
+    if router_model is None:
+        return {}
+    x = np.append(np.asarray(embedding, dtype="float64").ravel(), 1.0)
+    scores = _sigmoid(router_model["weights"] @ x)
+    return dict(zip(router_model["models"], scores.tolist()))
+
+
+def choose_model(embedding, route):
+    """
+    Refine a rule-based route using the learned classifier.
+
+    Picks the cheapest model with enough samples whose predicted quality meets
+    ROUTER_QUALITY_TARGET and whose average latency fits ROUTER_LATENCY_BUDGET_MS.
+    Falls back to the rule-based route if none does (or if the router has not
+    been trained yet).
+    """
+    router_model = _load_router_model()
+    if router_model is None or embedding is None:
+        return route
+
+    quality = predict_quality(embedding)
+    for model, samples, latency_ms in zip(router_model["models"], router_model["samples"], router_model["latency_ms"]):
+        if samples < ROUTER_MIN_SAMPLES or latency_ms > ROUTER_LATENCY_BUDGET_MS:
+            continue
+        if quality[model] >= ROUTER_QUALITY_TARGET:
+            return {
+                **route,
+                "model_used": model,
+                "predicted_quality": round(quality[model], 4)
+            }
+    return route
+
+
+# --- Benchmark ---
+
+def report(feedback_path=ROUTER_FEEDBACK_PATH):
+    """Replay logged queries and compare the model mix of rules vs adaptive routing."""
+    router_model = _load_router_model()
+    rows = load_feedback(feedback_path)
+    if router_model is None or not rows:
+        print("[ERROR] Train the router and collect feedback first.")
+        return
+
+    stats = dict(zip(router_model["models"], zip(router_model["cost"], router_model["latency_ms"])))
+
+    def summarize(label, picks):
+        known = [m for m in picks if m in stats]
+        cost = sum(stats[m][0] for m in known)
+        latency = np.mean([stats[m][1] for m in known]) if known else 0.0
+        mix = ", ".join(f"{m}: {known.count(m) / len(known):.0%}" for m in sorted(set(known))) if known else "-"
+        print(f"  {label:<9} | cost ${cost * 1000 / max(len(known), 1):.4f}/1k requests "
+              f"| avg latency {latency:.0f}ms | mix {mix}")
+
+    rule_picks = [r["rule_model"] for r in rows]
+    adaptive_picks = [
+        choose_model(np.array(r["embedding"]), {"model_used": r["rule_model"]})["model_used"]
+        for r in rows
+    ]
+
+    print(f"Replaying {len(rows)} logged queries")
+    summarize("rules", rule_picks)
+    summarize("adaptive", adaptive_picks)
+    changed = sum(a != b for a, b in zip(rule_picks, adaptive_picks))
+    print(f"  {changed} of {len(rows)} queries routed differently")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command == "train":
+        train()
+    elif command == "report":
+        report()
+    else:
+        print("Usage: python adaptive_router.py [train|report]")
@@ -0,0 +1,80 @@
+"""
+Batch Query CLI
+Sends a JSONL file of questions to the running API's /query_batch endpoint
+and writes the answers as NDJSON, in input order.
+
+Input (JSONL, one object per line, or a bare JSON string per line):
+  {"question": "How do I reset my password?", "collection": "support"}
+  "What are the pricing plans?"
+
+Usage:
+  python batch_query.py tickets.jsonl --output answers.jsonl --concurrency 8
+"""
+
+import argparse
+import json
+import sys
+import time
+
+API_URL = "http://localhost:8000/query_batch"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clearpath batch queries")
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, help="LLM calls in flight (capped by BATCH_CONCURRENCY)")
+    parser.add_argument("--url", default=API_URL)
+    args = parser.parse_args()
+
+    import httpx
+
+    with open(args.input, "rb") as f:
+        body = f.read()
+    n_items = sum(1 for line in body.splitlines() if line.strip())
+    url = args.url + (f"?concurrency={args.concurrency}" if args.concurrency else "")
+
+    print("=" * 60, file=sys.stderr)
+    print(f"Clearpath RAG - Batch Query ({n_items} queries)", file=sys.stderr)
+    print("=" * 60, file=sys.stderr)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    start = time.perf_counter()
+    done = errors = tokens = 0
+    models = {}
+
+    try:
+        with httpx.stream("POST", url, content=body, timeout=None,
+                          headers={"Content-Type": "application/x-ndjson"}) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                print(f"HTTP {resp.status_code}: {resp.text[:200]}", file=sys.stderr)
+                sys.exit(1)
+
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                out.write(line + "\n")
+                result = json.loads(line)
+                meta = result["metadata"]
+                done += 1
+                if meta["model_used"] == "none":
+                    errors += 1
+                models[meta["model_used"]] = models.get(meta["model_used"], 0) + 1
+                tokens += meta["tokens"]["input"] + meta["tokens"]["output"]
+                if done % 100 == 0 or done == n_items:
+                    print(f"  {done}/{n_items} answered ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    wall = time.perf_counter() - start
+    print("=" * 60, file=sys.stderr)
+    print(f"Answered {done} | errors {errors} | {tokens} tokens | {wall:.1f}s "
+          f"({done / wall if wall else 0:.2f} queries/s)", file=sys.stderr)
+    print(f"Models: {models}", file=sys.stderr)
+    print("=" * 60, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+End-to-End Benchmark
+Boots the FastAPI app in-process with the deterministic stub LLM
+(LLM_BACKEND=stub) and drives open-loop load at fixed QPS levels.
+
+Reports per-stage and end-to-end p50/p95/p99 latency, throughput and
+memory per QPS level, and writes the results to a JSON file that can be
+compared against a previous run.
+
+Usage:
+  python bench_e2e.py --qps 2,5,10 --duration 20 --output bench_results.json
+  python bench_e2e.py --baseline bench_results.json --threshold 0.10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clearpath end-to-end benchmark (stub LLM)")
+    parser.add_argument("--qps", default="2,5,10", help="comma-separated QPS levels")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per level")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="stub LLM delay between tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="stub LLM tokens per answer")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    return parser.parse_args()
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+
+def rss_mb():
+    """Current resident set size (falls back to the peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def one_request(client, question):
+    """Send one /query request; returns (ok, latency_ms, stages_ms)."""
+    start = time.perf_counter()
+    try:
+        resp = await client.post("/query", json={"question": question})
+        latency_ms = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            return False, latency_ms, {}
+        return True, latency_ms, resp.json()["metadata"].get("stages_ms") or {}
+    except Exception:
+        return False, (time.perf_counter() - start) * 1000, {}
+
+
+async def run_level(client, qps, duration, queries):
+    """Open-loop load: requests are sent on schedule whether or not earlier ones finished."""
+    n_requests = max(1, int(qps * duration))
+    start = time.perf_counter()
+    tasks = []
+    max_send_lag = 0.0
+
+    for i in range(n_requests):
+        delay = start + i / qps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            max_send_lag = max(max_send_lag, -delay)
+        tasks.append(asyncio.create_task(one_request(client, queries[i % len(queries)])))
+
+    results = await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+
+    latencies = [latency for ok, latency, _ in results if ok]
+    stage_values = {}
+    for ok, _, stages in results:
+        for name, ms in stages.items():
+            stage_values.setdefault(name, []).append(ms)
+
+    return {
+        "qps": qps,
+        "sent": n_requests,
+        "completed": len(latencies),
+        "errors": n_requests - len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "max_send_lag_ms": round(max_send_lag * 1000, 2),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {name: percentiles(values) for name, values in sorted(stage_values.items())},
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+async def run_benchmark(args):
+    import httpx
+    from main import app
+    from eval_harness import tests
+
+    queries = [t["query"] for t in tests]
+    levels = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # Warm up (loads the embedding model and index)
+        await one_request(client, queries[0])
+
+        for qps in [float(q) for q in args.qps.split(",")]:
+            print(f"  Running {qps:g} QPS for {args.duration:g}s...")
+            levels.append(await run_level(client, qps, args.duration, queries))
+
+    return levels
+
+
+def compare(current, baseline, threshold):
+    """Return a list of human-readable regressions vs the baseline run."""
+    regressions = []
+    baseline_levels = {level["qps"]: level for level in baseline["levels"]}
+
+    for level in current["levels"]:
+        old = baseline_levels.get(level["qps"])
+        if old is None:
+            continue
+        for p in ("p50", "p95", "p99"):
+            new_ms, old_ms = level["latency_ms"][p], old["latency_ms"][p]
+            if old_ms and new_ms > old_ms * (1 + threshold):
+                regressions.append(f"{level['qps']:g} QPS {p}: {old_ms}ms -> {new_ms}ms")
+        if level["throughput_rps"] < old["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{level['qps']:g} QPS throughput: {old['throughput_rps']} -> {level['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'QPS':>6} | {'ok/sent':>9} | {'rps':>6} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'RSS MB':>7}")
+    print("-" * 70)
+    for level in results["levels"]:
+        lat = level["latency_ms"]
+        print(f"{level['qps']:>6g} | {level['completed']:>4}/{level['sent']:<4} | {level['throughput_rps']:>6} | "
+              f"{lat['p50']:>8} | {lat['p95']:>8} | {lat['p99']:>8} | {level['rss_mb']:>7}")
+        for name, stage in level["stages_ms"].items():
+            print(f"{'':>6}   {name:<10} p50 {stage['p50']:>8}  p95 {stage['p95']:>8}  p99 {stage['p99']:>8}")
+
+
+def main():
+    args = parse_args()
+
+    # Configure the app before it is imported: stub LLM, throwaway log files
+    scratch = tempfile.mkdtemp(prefix="clearpath-bench-")
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["STUB_LLM_TOKEN_MS"] = str(args.token_ms)
+    os.environ["STUB_LLM_TOKENS"] = str(args.tokens)
+    os.environ["LOGS_PATH"] = os.path.join(scratch, "logs.json")
+    os.environ["ROUTER_FEEDBACK_PATH"] = os.path.join(scratch, "router_feedback.jsonl")
+
+    print("=" * 70)
+    print("Clearpath RAG - End-to-End Benchmark (stub LLM)")
+    print("=" * 70)
+
+    levels = asyncio.run(run_benchmark(args))
+    results = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "config": {
+            "duration_s": args.duration,
+            "stub_latency_ms": args.latency_ms,
+            "stub_token_ms": args.token_ms,
+            "stub_tokens": args.tokens
+        },
+        "levels": levels
+    }
+    print_report(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (commit {baseline.get('commit', '?')}, "
+              f"threshold {args.threshold:.0%}):")
+        for r in regressions:
+            print(f"  REGRESSION {r}")
+        if not regressions:
+            print("  No regressions.")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if args.baseline and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+History Compaction Benchmark
+Prompt tokens per turn over a long conversation, HISTORY_MODE "full"
+(last MAX_MEMORY_TURNS exchanges verbatim) against "summary" (rolling
+summary + last HISTORY_RECENT_TURNS exchanges).
+
+Uses the deterministic stub LLM (LLM_BACKEND=stub) for both the answers and
+the summaries, so no Groq key or index is needed. Each mode runs in its own
+process because HISTORY_MODE is read at import. Compaction is run right
+after each turn, as the post-response worker would.
+
+Usage:
+  python bench_history.py
+  python bench_history.py --turns 40 --answer-tokens 600
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+QUESTIONS = (
+    "How do I set up SSO for my workspace?",
+    "What about SCIM provisioning for it?",
+    "Which plans include that?",
+    "How do I export a project report?",
+    "Can I schedule it weekly?",
+    "How are webhooks retried when my endpoint is down?"
+)
+
+
+def run_conversation(turns):
+    """Prompt tokens of every turn of one conversation, plus summary tokens spent."""
+    from history_summary import compact, get_metrics
+    from llm import call_llm
+    from memory import get_or_create_conversation, add_message, get_history, prompt_history
+
+    conv_id, _ = get_or_create_conversation()
+    prompt_tokens = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        result = call_llm(question, [], "llama-3.3-70b-versatile", prompt_history(conv_id, get_history(conv_id)))
+        prompt_tokens.append(result["tokens_input"])
+        add_message(conv_id, "user", question)
+        add_message(conv_id, "assistant", result["answer"])
+        compact(conv_id)
+    return {"prompt_tokens": prompt_tokens, "summary_tokens": get_metrics()["tokens_used"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens per turn: full history vs rolling summary")
+    parser.add_argument("--turns", type=int, default=30, help="turns in the conversation")
+    parser.add_argument("--answer-tokens", type=int, default=400, help="stub LLM tokens per answer")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)  # internal: run one mode and print JSON
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_conversation(args.turns)))
+        return
+
+    results = {}
+    for mode in ("full", "summary"):
+        env = dict(os.environ, LLM_BACKEND="stub", HISTORY_MODE=mode, STUB_LLM_LATENCY_MS="0",
+                   STUB_LLM_TOKEN_MS="0", STUB_LLM_TOKENS=str(args.answer_tokens))
+        out = subprocess.check_output([sys.executable, __file__, "--mode", mode, "--turns", str(args.turns)],
+                                      env=env, text=True)
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    print("=" * 60)
+    print(f"Clearpath RAG - History Compaction Benchmark ({args.answer_tokens}-token answers)")
+    print("=" * 60)
+    print(f"{'turn':>6} | {'full (prompt tokens)':>20} | {'summary (prompt tokens)':>23}")
+    print("-" * 60)
+    marks = sorted({t for t in (1, 2, 3, 5, 10, 20, 30, 50, 100) if t <= args.turns} | {args.turns})
+    for t in marks:
+        print(f"{t:>6} | {results['full']['prompt_tokens'][t - 1]:>20} | {results['summary']['prompt_tokens'][t - 1]:>23}")
+    print("-" * 60)
+    full, summary = (sum(results[m]["prompt_tokens"]) for m in ("full", "summary"))
+    print(f"{'total':>6} | {full:>20} | {summary:>23}")
+    print(f"Summary calls (8B) used {results['summary']['summary_tokens']} tokens off the critical path")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Router Benchmark
+Checks that the compiled router gives identical classifications to the
+original rule implementation, and times both.
+
+Usage:
+  python bench_router.py
+"""
+
+import random
+import timeit
+
+from config import SIMPLE_MODEL, COMPLEX_MODEL
+from eval_harness import tests
+from router import (
+    classify_query, _classify,
+    GREETINGS, PERSONAL_QUERIES, COMPLEX_KEYWORDS, YES_NO_STARTERS
+)
+
+
+def legacy_classify_query(question):
+    """The original per-call rule implementation, kept as the reference."""
+    text = question.strip().lower()
+    words = text.split()
+    word_count = len(words)
+
+    clean_text = text.rstrip("!?.,")
+    if clean_text in GREETINGS or any(q in text for q in PERSONAL_QUERIES):
+        return {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": False}
+
+    if words and words[0] in YES_NO_STARTERS and text.endswith("?"):
+        if word_count < 10:
+            return {"classification": "simple", "model_used": SIMPLE_MODEL}
+
+    for word in words:
+        stripped = word.rstrip("?!.,")
+        if stripped in COMPLEX_KEYWORDS:
+            return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+
+    if text.count("?") >= 2:
+        return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+
+    if word_count >= 10:
+        return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+
+    return {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": True}
+
+
+def _route_key(route):
+    return route["classification"], route["model_used"], route.get("requires_context", True)
+
+
+def fuzz_queries(n=20000, seed=42):
+    """Random queries built from the rule vocabulary, punctuation and filler words."""
+    rng = random.Random(seed)
+    vocab = sorted(GREETINGS | PERSONAL_QUERIES | COMPLEX_KEYWORDS | YES_NO_STARTERS)
+    vocab += ["clearpath", "the", "pricing?", "how?", "what", "plan", "my", "sla", "?", "!", "..", "hi!", "thanks."]
+    queries = []
+    for _ in range(n):
+        words = [rng.choice(vocab) for _ in range(rng.randint(1, 14))]
+        query = " ".join(words)
+        if rng.random() < 0.5:
+            query += rng.choice(["?", "??", "!", ".", ",", " ", "?!"])
+        if rng.random() < 0.2:
+            query = query.upper()
+        queries.append(query)
+    return queries
+
+
+def check_identical(queries):
+    mismatches = [q for q in queries if _route_key(classify_query(q)) != _route_key(legacy_classify_query(q))]
+    for q in mismatches[:10]:
+        print(f"  MISMATCH: {q!r}")
+    return not mismatches
+
+
+def bench(label, fn, queries, number=2000):
+    total = timeit.timeit(lambda: [fn(q) for q in queries], number=number)
+    per_call_ns = total / (number * len(queries)) * 1e9
+    print(f"  {label:<28} {per_call_ns:8.0f} ns/query")
+    return per_call_ns
+
+
+if __name__ == "__main__":
+    queries = [t["query"] for t in tests]
+
+    print("=" * 60)
+    print("Router benchmark")
+    print("=" * 60)
+
+    ok = check_identical(queries) and check_identical(fuzz_queries())
+    print(f"Identical classifications: {'YES' if ok else 'NO'}")
+    for t in tests:
+        got = classify_query(t["query"])["classification"]
+        print(f"  {got:<8} (expected {t['expected_classification']:<8}) {t['query']}")
+
+    print(f"\nTiming over {len(queries)} eval_harness queries:")
+    legacy = bench("legacy", legacy_classify_query, queries)
+    compiled = bench("compiled (uncached)", lambda q: _classify.__wrapped__(q.strip().lower()), queries)
+    cached = bench("compiled + memoized", classify_query, queries)
+    print(f"\n  Speedup: {legacy / compiled:.1f}x uncached, {legacy / cached:.1f}x memoized")
@@ -0,0 +1,107 @@
+"""
+Serialization Benchmark
+Per-request allocations and time for building and serializing a /query
+response, old path against new, at several retrieved-chunk counts.
+
+  legacy  result dicts (text and citation fields per chunk), a pydantic
+          QueryResponse, model_dump() and json.dumps()
+  compact ChunkRef results, plain-dict response (query_response) and
+          orjson.dumps() — what /query does now
+
+The chunk store is synthetic (~1 KB of text per chunk), so no index or
+embedding model is needed.
+
+Usage:
+  python bench_serialization.py
+  python bench_serialization.py --chunks 10,100 --requests 2000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import orjson
+
+from retriever import ChunkRef
+from main import QueryResponse, MetadataInfo, TokenInfo, format_sources, query_response
+
+
+def synthetic_store(n):
+    return [
+        {"text": f"Chunk {i}. " + "Clearpath lets teams plan sprints and track issues. " * 20,
+         "document": f"doc_{i % 40}.pdf", "page": i % 30 + 1, "page_end": i % 30 + 1}
+        for i in range(n)
+    ]
+
+
+def legacy_response(store, hits):
+    chunks = [
+        {"id": idx, "text": store[idx]["text"], "document": store[idx]["document"], "page": store[idx]["page"],
+         "page_end": store[idx].get("page_end", store[idx]["page"]), "relevance_score": score}
+        for idx, score in hits
+    ]
+    sources = [{"document": c["document"], "page": c["page"], "relevance_score": c["relevance_score"]} for c in chunks]
+    response = QueryResponse(
+        answer="Use the Sprint board to plan work.",
+        metadata=MetadataInfo(
+            model_used="llama-3.3-70b-versatile", classification="complex",
+            tokens=TokenInfo(input=900, output=40), latency_ms=812,
+            chunks_retrieved=len(chunks), evaluator_flags=[]
+        ),
+        sources=sources,
+        conversation_id="conv_bench"
+    )
+    return json.dumps(response.model_dump()).encode()
+
+
+def compact_response(store, hits):
+    chunks = [ChunkRef(idx, score, store) for idx, score in hits]
+    response = query_response(
+        "Use the Sprint board to plan work.",
+        "conv_bench",
+        format_sources(chunks),
+        model_used="llama-3.3-70b-versatile", classification="complex",
+        tokens={"input": 900, "output": 40}, latency_ms=812,
+        chunks_retrieved=len(chunks), evaluator_flags=[]
+    )
+    return orjson.dumps(response)
+
+
+def measure(build, store, hits, requests):
+    """(µs per request, peak KB allocated while building one response, body bytes)."""
+    build(store, hits)  # warm-up
+    start = time.perf_counter()
+    for _ in range(requests):
+        build(store, hits)
+    us = (time.perf_counter() - start) * 1e6 / requests
+
+    tracemalloc.start()
+    body = build(store, hits)
+    peak = tracemalloc.get_traced_memory()[1] - len(body)
+    tracemalloc.stop()
+    return us, peak / 1024, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response build + serialization cost, legacy vs compact")
+    parser.add_argument("--chunks", default="10,100", help="comma-separated retrieved-chunk counts")
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per case")
+    args = parser.parse_args()
+
+    store = synthetic_store(5000)
+    print("=" * 55)
+    print("Clearpath RAG - Serialization Benchmark")
+    print("=" * 55)
+    print(f"{'chunks':>6} | {'path':>8} | {'µs/req':>8} | {'peak KB':>8} | {'body bytes':>10}")
+    print("-" * 55)
+    for n in [int(x) for x in args.chunks.split(",")]:
+        hits = [(i * 37 % len(store), round(1.0 / (1.0 + i * 0.01), 4)) for i in range(n)]
+        for name, build in (("legacy", legacy_response), ("compact", compact_response)):
+            us, peak, size = measure(build, store, hits, args.requests)
+            print(f"{n:>6} | {name:>8} | {us:>8.1f} | {peak:>8.1f} | {size:>10}")
+    print("=" * 55)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Shard Benchmark
+Search latency (p50/p95/p99) against shard count on a synthetic corpus.
+
+The corpus is random unit vectors (MiniLM dimension by default), written
+once to a memory-mapped file. For every shard count it is split into shards
+(as ingest.py would) and searched through ShardedIndex, one query at a time
+like the API does; "in-process" is a single IndexFlatL2 in this process.
+
+Sharding only helps with enough cores: each shard worker scans its part on
+its own CPU, so expect gains up to roughly the number of cores.
+
+Usage:
+  python bench_shards.py
+  python bench_shards.py --vectors 200000 --shards 1,2,4 --queries 100
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from bench_e2e import percentiles
+from shards import ShardedIndex, write_shard
+
+
+def synthetic_corpus(path, n, dim, block=100_000):
+    """Random unit vectors in a .npy memmap, generated block by block."""
+    vectors = np.lib.format.open_memmap(path, mode="w+", dtype="float32", shape=(n, dim))
+    rng = np.random.default_rng(0)
+    for start in range(0, n, block):
+        chunk = rng.standard_normal((min(block, n - start), dim), dtype="float32")
+        vectors[start:start + len(chunk)] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    vectors.flush()
+    return vectors
+
+
+def time_queries(search, queries, k):
+    search(queries[:1], k)  # warm-up
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        search(q[None, :], k)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scatter-gather search latency vs shard count")
+    parser.add_argument("--vectors", type=int, default=1_000_000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="vector dimension")
+    parser.add_argument("--shards", default="1,2,4,8", help="comma-separated shard counts")
+    parser.add_argument("--queries", type=int, default=200, help="queries timed per shard count")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_shards_")
+    print("=" * 60)
+    print(f"Clearpath RAG - Shard Benchmark ({args.vectors:,} x {args.dim}, {os.cpu_count()} CPUs)")
+    print("=" * 60)
+
+    try:
+        vectors = synthetic_corpus(os.path.join(workdir, "corpus.npy"), args.vectors, args.dim)
+        queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype="float32")
+        ids = np.arange(args.vectors, dtype="int64")
+
+        index = faiss.IndexFlatL2(args.dim)
+        index.add(vectors)
+        results = [("in-process", time_queries(index.search, queries, args.top_k))]
+        expected = index.search(queries, args.top_k)[1]
+        del index
+
+        for n in [int(x) for x in args.shards.split(",")]:
+            paths = []
+            for shard in range(n):
+                path = os.path.join(workdir, f"shard_{shard:03d}.bin")
+                write_shard(path, vectors[shard::n], ids[shard::n])
+                paths.append(path)
+
+            sharded = ShardedIndex(paths, ids % n)
+            try:
+                assert np.array_equal(sharded.search(queries, args.top_k)[1], expected), "sharded results differ"
+                results.append((f"{n} shard{'s' if n > 1 else ''}", time_queries(sharded.search, queries, args.top_k)))
+            finally:
+                sharded.close()
+                for path in paths:
+                    os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'search':>12} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    print("-" * 60)
+    for name, p in results:
+        print(f"{name:>12} | {p['p50']:>8.2f} | {p['p95']:>8.2f} | {p['p99']:>8.2f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,23 +10,186 @@ PROJECT_DIR = os.path.dirname(BASE_DIR)
 DOCS_DIR = os.path.join(PROJECT_DIR, "docs")
 FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss_index.bin")
 METADATA_PATH = os.path.join(BASE_DIR, "metadata.pkl")
-LOGS_PATH = os.path.join(BASE_DIR, "logs.json")
+LOGS_PATH = os.getenv("LOGS_PATH", os.path.join(BASE_DIR, "logs.json"))
 
 # Embedding model
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
-# Chunking settings
-CHUNK_SIZE = 400        # target words per chunk
-CHUNK_OVERLAP = 50      # overlap in words between chunks
-MIN_CHUNK_SIZE = 50     # ignore tiny chunks
+# Chunking settings (measured in embedding-model tokens)
+CHUNK_MAX_TOKENS = 256      # all-MiniLM-L6-v2 truncates inputs at 256 tokens (incl. [CLS]/[SEP])
+CHUNK_OVERLAP_TOKENS = 32   # overlap between consecutive chunks, in whole sentences
+MIN_CHUNK_TOKENS = 48       # a smaller tail is topped up with earlier sentences
 
 # Retrieval settings
 TOP_K = 10              # number of chunks to retrieve
 
+# Cross-encoder reranking: retrieve more candidates, send only the best few to the LLM
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20          # chunks retrieved for the cross-encoder to score
+RERANK_TOP_N = 3                # chunks kept for the prompt
+RERANK_CACHE_SIZE = 20_000      # cached (query, chunk) scores
+
+# Request pipeline
+SPECULATIVE_RETRIEVAL = True    # start embedding/search alongside routing; discarded if no context is needed
+PIPELINE_WORKERS = 16           # threads shared by all in-flight requests' pipeline stages
+
+# Context reuse across turns (cosine similarity of consecutive query embeddings)
+CONTEXT_REUSE_ENABLED = True
+CONTEXT_REUSE_THRESHOLD = 0.85  # at or above: reuse the previous chunks, no search
+CONTEXT_EXTEND_THRESHOLD = 0.70 # at or above: previous chunks merged with a fresh search
+CONTEXT_REUSE_MAX_CHUNKS = 5    # chunks sent when reusing (best re-scored first)
+
+# FAQ fast path: stored answers for near-exact matches of FAQ questions, no LLM call
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_DOCUMENTS = ["17_FAQ_Common_Questions.pdf", "21_Account_Management_FAQ.pdf"]
+FAQ_INDEX_PATH = os.path.join(BASE_DIR, "faq_index.bin")
+FAQ_METADATA_PATH = os.path.join(BASE_DIR, "faq_metadata.pkl")
+FAQ_THRESHOLD = 0.90            # cosine similarity between the query and an FAQ question
+
+# Collections: named subsets of docs/, each with its own index under INDEXES_DIR.
+# The default collection is the global index at FAISS_INDEX_PATH / METADATA_PATH.
+INDEXES_DIR = os.path.join(BASE_DIR, "indexes")
+DEFAULT_COLLECTION = "all"
+MAX_LOADED_COLLECTIONS = 3      # least recently used collections are evicted from memory
+COLLECTIONS = {
+    "hr": [
+        "01_Employee_Handbook_2024.pdf", "02_Data_Security_Privacy_Policy.pdf",
+        "03_Remote_Work_Guidelines.pdf", "04_Code_of_Conduct.pdf", "05_PTO_Leave_Policy.pdf",
+    ],
+    "product": [
+        "06_ClearPath_User_Guide_v3.2.pdf", "07_Getting_Started_Guide.pdf",
+        "08_Advanced_Features_Overview.pdf", "09_Integrations_Catalog.pdf", "10_Mobile_App_Guide.pdf",
+        "11_Keyboard_Shortcuts.pdf", "12_Custom_Workflows_Tutorial.pdf", "13_Reporting_Analytics_Guide.pdf",
+    ],
+    "sales": [
+        "14_Pricing_Sheet_2024.pdf", "15_Enterprise_Plan_Details.pdf", "16_Feature_Comparison_Matrix.pdf",
+    ],
+    "support": [
+        "17_FAQ_Common_Questions.pdf", "18_Onboarding_Checklist.pdf", "19_Support_SLA_Response_Times.pdf",
+        "20_Troubleshooting_Guide.pdf", "21_Account_Management_FAQ.pdf",
+    ],
+    "internal": [
+        "22_Q4_2023_Team_Retrospective.pdf", "23_Engineering_Team_Structure.pdf",
+        "24_Weekly_Standup_Notes_Dec2023.pdf", "25_Product_Roadmap_2024.pdf",
+    ],
+    "engineering": [
+        "26_API_Documentation_v2.1.pdf", "27_Webhook_Integration_Guide.pdf",
+        "28_System_Architecture_Overview.pdf", "29_Deployment_Infrastructure_Guide.pdf",
+        "30_Release_Notes_Version_History.pdf",
+    ],
+}
+
+# Sharding: INDEX_SHARDS > 1 makes ingest.py also split each index into shards
+# (by document), searched in parallel shard worker processes (see shards.py)
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+
 # Groq API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")   # "groq" or "stub" (deterministic, for benchmarks)
 SIMPLE_MODEL = "llama-3.1-8b-instant"
 COMPLEX_MODEL = "llama-3.3-70b-versatile"
 
 # Conversation memory
 MAX_MEMORY_TURNS = 5    # keep last 5 exchanges in memory
+HISTORY_MODE = os.getenv("HISTORY_MODE", "full")   # "full" (raw turns) or "summary" (rolling summary + recent turns)
+HISTORY_RECENT_TURNS = 2            # exchanges kept verbatim in "summary" mode
+HISTORY_SUMMARY_MODEL = SIMPLE_MODEL
+HISTORY_SUMMARY_WORDS = 120         # target summary length given to the model
+HISTORY_SUMMARY_MAX_TOKENS = 256    # hard cap on the summary's output tokens
+HISTORY_SUMMARY_WORKERS = 2         # summary threads, separate from the post-response worker
+
+# Query rewriting (follow-ups are condensed into standalone retrieval queries)
+QUERY_REWRITE_ENABLED = True
+REWRITE_KEYWORDS = 6    # keywords carried over from earlier turns
+REWRITE_TURNS = 1       # how many previous exchanges to mine for keywords
+
+# LLM generation
+MAX_OUTPUT_TOKENS = 1024
+
+# Streaming (/query_stream, Server-Sent Events)
+STREAM_FRAME_CHARS = 48     # tokens are coalesced into frames of up to this many characters
+STREAM_FRAME_MS = 25        # how long a frame waits for more tokens (the first frame never waits)
+STREAM_BUFFER_TOKENS = 64   # tokens buffered ahead of a slow client before generation pauses
+
+# Stub LLM (LLM_BACKEND = "stub")
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "200"))   # time to first token
+STUB_LLM_TOKEN_MS = float(os.getenv("STUB_LLM_TOKEN_MS", "5"))         # delay between tokens
+STUB_LLM_TOKENS = int(os.getenv("STUB_LLM_TOKENS", "60"))              # tokens per answer
+
+# Rate limiting (client-side admission control per Groq model)
+# Groq enforces requests-per-minute and tokens-per-minute per model.
+RATE_LIMITS = {
+    SIMPLE_MODEL: {"rpm": 30, "tpm": 6000},
+    COMPLEX_MODEL: {"rpm": 30, "tpm": 12000},
+}
+RATE_LIMIT_MODE = "fallback"    # "queue", "shed" or "fallback" when a bucket is empty
+RATE_LIMIT_MAX_WAIT = 10.0      # seconds a request may queue before it is shed
+RATE_LIMIT_FALLBACKS = {COMPLEX_MODEL: SIMPLE_MODEL}
+
+# Priority scheduling: per-classification queues and concurrency limits in front of the pipeline
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_MAX_CONCURRENCY = 12  # requests in the pipeline at once, all classes together
+SCHEDULER_CLASSES = {
+    # concurrency: slots a class may hold; queue: max waiting; weight: share of contended
+    # slots; deadline: seconds a request may wait to start before it is shed
+    "simple": {"concurrency": 12, "queue": 200, "weight": 4, "deadline": 2.0},
+    "complex": {"concurrency": 8, "queue": 50, "weight": 1, "deadline": 20.0},
+}
+
+# Evaluation: "background" runs evaluator checks, logging and router feedback after the
+# response is sent (flags via /conversations/{id}/flags or the stream's done event);
+# "inline" computes them before responding, for clients that need flags in the response
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "background")
+POST_RESPONSE_QUEUE_SIZE = 1000 # queued post-response tasks before they run inline instead
+
+# Admin diagnostics (/admin/*: memory report, tracemalloc diffs, sampling CPU profile).
+# Off by default; requests must send the X-Admin-Token header.
+ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "false").lower() == "true"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = 30.0      # longest sampling CPU profile one request may take
+
+# Request coalescing: identical history-free questions in flight share one pipeline run
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+SINGLEFLIGHT_TIMEOUT = 30.0     # seconds a coalesced request waits for the shared result
+
+# Batch queries (/query_batch, batch_query.py)
+BATCH_MAX_ITEMS = 10_000        # queries per request
+BATCH_CONCURRENCY = 8           # LLM calls in flight per batch (a request may ask for fewer)
+BATCH_RATE_LIMIT_MODE = "queue" # bulk jobs wait for rate-limit capacity instead of being shed
+BATCH_RATE_LIMIT_MAX_WAIT = 120.0
+
+# Model router
+ROUTER_CACHE_SIZE = 4096        # memoized classifications of recent queries
+ROUTER_MODE = "rules"           # "rules" (keyword rules only) or "adaptive" (rules + learned classifier)
+ROUTER_FEEDBACK_PATH = os.getenv("ROUTER_FEEDBACK_PATH", os.path.join(BASE_DIR, "router_feedback.jsonl"))
+ROUTER_MODEL_PATH = os.path.join(BASE_DIR, "router_model.npz")
+ROUTER_QUALITY_TARGET = 0.9     # minimum predicted answer quality for a model to be picked
+ROUTER_MIN_SAMPLES = 50         # outcomes needed before a model can be picked by the classifier
+ROUTER_LATENCY_BUDGET_MS = 3000  # models slower than this on average are never picked by the classifier
+# Outcome logging for `adaptive_router.py train`: on in adaptive mode, opt-in otherwise
+ROUTER_FEEDBACK_ENABLED = os.getenv(
+    "ROUTER_FEEDBACK_ENABLED", "true" if ROUTER_MODE == "adaptive" else "false"
+).lower() == "true"
+ROUTER_FEEDBACK_MAX_BYTES = 50 * 1024 * 1024   # the feedback log is rotated to <path>.1 past this size
+
+# Groq list prices, USD per 1M tokens
+MODEL_PRICES = {
+    SIMPLE_MODEL: {"input": 0.05, "output": 0.08},
+    COMPLEX_MODEL: {"input": 0.59, "output": 0.79},
+}
+
+# Ingestion pipeline
+INGEST_BATCH_SIZE = "auto"      # embedding batch size, or "auto" to tune it for this CPU
+INGEST_QUEUE_SIZE = 4           # extracted documents buffered ahead of the embedder
+INGEST_CHECKPOINT_EVERY = 2000  # vectors between checkpoints (a crashed ingest resumes from the last one)
+INGEST_CHECKPOINT_DIR = os.path.join(BASE_DIR, "ingest_checkpoint")
+
+# Embedding cache (ingest-time, keyed on model + chunk text hash)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, "embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000   # LRU-evicted beyond this (~300MB at 384 dims)
+
+# PDF extraction cache (ingest-time, page text keyed on file hash + page + extractor version)
+EXTRACT_CACHE_ENABLED = True
+EXTRACT_CACHE_DIR = os.path.join(BASE_DIR, "extract_cache")
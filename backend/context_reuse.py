@@ -0,0 +1,77 @@
+"""
+Context Reuse (Retrieve Once per Topic)
+=======================================
+Follow-up turns on the same topic reuse the chunks retrieved earlier in the
+conversation instead of searching FAISS again.
+
+Each conversation's state keeps the embedding of the query that was last
+searched for and the chunks it returned. For a new turn, the cosine
+similarity of the two query embeddings decides:
+
+  >= CONTEXT_REUSE_THRESHOLD   → reuse: no search; the previous chunks are
+                                 re-scored against the new query and the
+                                 best CONTEXT_REUSE_MAX_CHUNKS are sent
+  >= CONTEXT_EXTEND_THRESHOLD  → extend: previous chunks merged with a
+                                 fresh search (by chunk id)
+  otherwise                    → fresh retrieval
+
+State is only reused for the same collection and filter.
+"""
+
+import numpy as np
+
+from config import (
+    CONTEXT_REUSE_ENABLED, CONTEXT_REUSE_THRESHOLD, CONTEXT_EXTEND_THRESHOLD, CONTEXT_REUSE_MAX_CHUNKS
+)
+
+
+def cosine(a, b):
+    a, b = np.ravel(a), np.ravel(b)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denom if denom else 0.0
+
+
+def chunk_tokens(chunks):
+    """Rough prompt cost of a chunk set (same ~4 chars/token estimate as llm.estimate_tokens)."""
+    return sum(len(chunk.text) // 4 for chunk in chunks)
+
+
+def decide(state, embedding, key):
+    """
+    ("fresh" | "reuse" | "extend", similarity) for a new turn.
+    `key` identifies the collection + filter the chunks came from.
+    """
+    previous = state.get("retrieval")
+    if not CONTEXT_REUSE_ENABLED or previous is None or previous["key"] != key:
+        return "fresh", None
+
+    similarity = round(cosine(previous["embedding"], embedding), 4)
+    if similarity >= CONTEXT_REUSE_THRESHOLD:
+        return "reuse", similarity
+    if similarity >= CONTEXT_EXTEND_THRESHOLD:
+        return "extend", similarity
+    return "fresh", similarity
+
+
+def previous_chunks(state):
+    return state["retrieval"]["chunks"]
+
+
+def merge(previous, fresh, limit):
+    """Union of two chunk lists by id, best score first, keeping the higher score."""
+    best = {}
+    for chunk in previous + fresh:
+        if chunk.id not in best or chunk.relevance_score > best[chunk.id].relevance_score:
+            best[chunk.id] = chunk
+    return sorted(best.values(), key=lambda c: c.relevance_score, reverse=True)[:limit]
+
+
+def remember(state, key, embedding, chunks):
+    """Record a search so later turns can compare against it."""
+    state["retrieval"] = {"key": key, "embedding": np.ravel(embedding).copy(), "chunks": chunks}
+
+
+def trim_reused(chunks):
+    """The chunks actually sent on reuse, and the prompt tokens that saves."""
+    sent = chunks[:CONTEXT_REUSE_MAX_CHUNKS]
+    return sent, chunk_tokens(chunks) - chunk_tokens(sent)
@@ -0,0 +1,141 @@
+"""
+Embedding Cache
+===============
+Persistent on-disk cache of chunk embeddings, so re-ingesting (or trying a
+slightly different chunk size) only encodes text that actually changed.
+
+Layout (one directory per embedding model):
+  vectors.f32  → memory-mapped float32 array, one row per cached embedding
+  index.pkl    → key → row, in least-recently-used order
+
+Keys are the SHA-1 of the chunk text. When the cache holds `max_entries`
+vectors, the least recently used entry is evicted. Its row is only reused
+after the next save(): until then the index.pkl on disk may still map the
+old key to it, and overwriting it early would let a crash pair that key
+with another text's vector.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+# Rows are allocated in blocks of this size as the cache grows
+GROW_ROWS = 4096
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory, model_name, max_entries):
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]", "_", model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.pkl")
+        self.max_entries = max_entries
+
+        self.slots = OrderedDict()   # key → row, oldest first
+        self.free = []               # rows safe to reuse
+        self.released = []           # rows evicted since the last save (index.pkl may still point at them)
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "rb") as f:
+                state = pickle.load(f)
+            self.slots, self.free, self.dim = state["slots"], state["free"], state["dim"]
+            self.capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            self.vectors = np.memmap(self.vectors_path, dtype="float32", mode="r+", shape=(self.capacity, self.dim))
+            self._trim(self.max_entries)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow(self, rows):
+        """Extend the memory-mapped file to hold `rows` rows."""
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * self.dim * 4)
+        self.capacity = rows
+        self.vectors = np.memmap(self.vectors_path, dtype="float32", mode="r+", shape=(rows, self.dim))
+
+    def _trim(self, max_entries):
+        """Evict least recently used entries until at most `max_entries` remain."""
+        while len(self.slots) > max_entries:
+            _, row = self.slots.popitem(last=False)
+            self.released.append(row)
+
+    def _next_row(self):
+        self._trim(self.max_entries - 1)   # make room, evicting the LRU entry if full
+        if self.free:
+            return self.free.pop()
+        # Every row below this one is cached, free or released; the file may
+        # exceed max_entries rows by the evictions since the last save
+        row = len(self.slots) + len(self.released)
+        if row >= self.capacity:
+            self._grow(self.capacity + GROW_ROWS)
+        return row
+
+    def get(self, keys):
+        """Cached vectors for `keys` (None for misses), marking hits as recently used."""
+        found = []
+        for key in keys:
+            row = self.slots.get(key)
+            if row is None:
+                self.misses += 1
+                found.append(None)
+            else:
+                self.hits += 1
+                self.slots.move_to_end(key)
+                found.append(np.array(self.vectors[row]))
+        return found
+
+    def put(self, keys, embeddings):
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        for key, vector in zip(keys, embeddings):
+            if key in self.slots:
+                continue
+            row = self._next_row()
+            self.vectors[row] = vector
+            self.slots[key] = row
+
+    def encode(self, model, texts, batch_size):
+        """model.encode(texts) that only encodes texts not already in the cache."""
+        keys = [text_key(t) for t in texts]
+        found = self.get(keys)
+
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            new = np.asarray(model.encode([texts[i] for i in missing], batch_size=batch_size), dtype="float32")
+            self.put([keys[i] for i in missing], new)
+            for i, vector in zip(missing, new):
+                found[i] = vector
+
+        return np.vstack(found).astype("float32")
+
+    def save(self):
+        """Flush vectors and persist the key index; rows evicted before it become reusable."""
+        if self.vectors is None:
+            return
+        self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"slots": self.slots, "free": self.free + self.released, "dim": self.dim}, f)
+        os.replace(tmp_path, self.index_path)
+        self.free.extend(self.released)
+        self.released = []
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,14 +1,40 @@
 """
 Evaluation Harness
-Runs test queries against the API and prints PASS/FAIL results.
+Runs labeled test queries concurrently and prints PASS/FAIL results,
+retrieval quality (recall@k, MRR) and a latency/throughput report.
+
+Modes:
+  api        → POST each query to the running API (keywords, classification, sources)
+  retrieval  → call retriever.retrieve directly, no server and no LLM calls
+
+Dataset (JSONL, one object per line; every field except "query" is optional):
+  {"query": "...", "expected_keywords": [...], "expected_classification": "complex",
+   "expected_docs": ["12_Custom_Workflows_Tutorial.pdf"],
+   "expected_pages": [{"document": "12_Custom_Workflows_Tutorial.pdf", "page": 2}]}
+
+In api mode the report also averages prompt tokens, LLM time and rerank
+time per query. To measure the reranking stage end to end, run once with
+RERANK_ENABLED=false and --output, restart the API with it on, and pass the
+first report as --baseline: added rerank latency is printed against the
+prompt tokens and LLM latency saved.
+
+Usage:
+  python eval_harness.py                                  # built-in tests against the API
+  python eval_harness.py --mode retrieval --dataset eval.jsonl --concurrency 16 --k 10
+  python eval_harness.py --dataset eval.jsonl --output no_rerank.json
+  python eval_harness.py --dataset eval.jsonl --baseline no_rerank.json   # API restarted with RERANK_ENABLED=true
 """
 
-import requests
+import argparse
+import asyncio
+import json
 import time
 
+import numpy as np
+
 API_URL = "http://localhost:8000/query"
 
-# Test cases: each has a query and expected keywords in the answer
+# Test cases: each has a query, expected keywords in the answer and the documents that answer it
 tests = [
     {
         "query": "hi",
@@ -18,22 +44,26 @@ tests = [
     {
         "query": "What is Clearpath?",
         "expected_keywords": ["clearpath"],
-        "expected_classification": "simple"
+        "expected_classification": "simple",
+        "expected_docs": ["06_ClearPath_User_Guide_v3.2.pdf", "07_Getting_Started_Guide.pdf"]
     },
     {
         "query": "How do I set up custom workflows in Clearpath?",
         "expected_keywords": ["workflow", "custom", "create", "set"],
-        "expected_classification": "complex"
+        "expected_classification": "complex",
+        "expected_docs": ["12_Custom_Workflows_Tutorial.pdf"]
     },
     {
         "query": "What are the pricing plans?",
         "expected_keywords": ["pric", "plan", "enterprise", "cost"],
-        "expected_classification": "complex"
+        "expected_classification": "complex",
+        "expected_docs": ["14_Pricing_Sheet_2024.pdf", "15_Enterprise_Plan_Details.pdf", "16_Feature_Comparison_Matrix.pdf"]
     },
     {
         "query": "Explain the data security policy",
         "expected_keywords": ["security", "data", "privacy", "policy"],
-        "expected_classification": "complex"
+        "expected_classification": "complex",
+        "expected_docs": ["02_Data_Security_Privacy_Policy.pdf"]
     },
     {
         "query": "thanks",
@@ -43,16 +73,29 @@ tests = [
     {
         "query": "How do I integrate third-party tools with Clearpath?",
         "expected_keywords": ["integrat", "api", "connect", "tool"],
-        "expected_classification": "complex"
+        "expected_classification": "complex",
+        "expected_docs": ["09_Integrations_Catalog.pdf", "27_Webhook_Integration_Guide.pdf"]
     },
     {
         "query": "What is the SLA response time?",
         "expected_keywords": ["sla", "response", "time", "support"],
-        "expected_classification": "complex"
+        "expected_classification": "complex",
+        "expected_docs": ["19_Support_SLA_Response_Times.pdf"]
     },
 ]
 
 
+def load_dataset(path):
+    """Load a JSONL dataset of labeled queries."""
+    items = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    return items
+
+
 def check_keywords(answer, keywords):
     """Check if any expected keyword appears in the answer."""
     answer_lower = answer.lower()
@@ -62,75 +105,286 @@ def check_keywords(answer, keywords):
     return False
 
 
-def run_tests():
-    print("=" * 80)
-    print("Clearpath RAG - Evaluation Harness")
-    print("=" * 80)
-    print(f"Running {len(tests)} test queries against {API_URL}\n")
+# --- Retrieval metrics ---
+
+def relevance_labels(item, sources):
+    """
+    Mark each retrieved source as relevant or not.
+    Page-level labels are used when present, otherwise document-level.
+    Returns (labels, n_relevant) or (None, 0) if the item has no labels.
+    """
+    if item.get("expected_pages"):
+        relevant = {(p["document"], p["page"]) for p in item["expected_pages"]}
+        keys = [(s["document"], s["page"]) for s in sources]
+    elif item.get("expected_docs"):
+        relevant = set(item["expected_docs"])
+        keys = [s["document"] for s in sources]
+    else:
+        return None, 0
+
+    # Count each relevant document/page once, at its best rank
+    labels, seen = [], set()
+    for key in keys:
+        hit = key in relevant and key not in seen
+        seen.add(key)
+        labels.append(hit)
+    return labels, len(relevant)
+
+
+def recall_at(labels, n_relevant, k):
+    return sum(labels[:k]) / n_relevant
 
-    passed = 0
-    failed = 0
-    errors = 0
 
-    for i, test in enumerate(tests, 1):
-        query = test["query"]
-        expected_kw = test["expected_keywords"]
-        expected_class = test["expected_classification"]
+def reciprocal_rank(labels):
+    for rank, hit in enumerate(labels, 1):
+        if hit:
+            return 1.0 / rank
+    return 0.0
 
+
+def retrieval_report(results, k):
+    """Average recall@{1,3,5,k} and MRR over items that have relevance labels."""
+    labeled = [r for r in results if r.get("labels") is not None]
+    if not labeled:
+        return {}
+    report = {"labeled_queries": len(labeled)}
+    for cutoff in sorted({1, 3, 5, k}):
+        if cutoff <= k:
+            report[f"recall@{cutoff}"] = round(
+                float(np.mean([recall_at(r["labels"], r["n_relevant"], cutoff) for r in labeled])), 4
+            )
+    report["mrr"] = round(float(np.mean([reciprocal_rank(r["labels"]) for r in labeled])), 4)
+    return report
+
+
+def latency_report(results, wall_s):
+    latencies = [r["latency_ms"] for r in results if not r.get("error")]
+    if not latencies:
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "queries": len(results),
+        "wall_s": round(wall_s, 2),
+        "throughput_qps": round(len(results) / wall_s, 2),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1)
+    }
+
+
+def cost_report(results):
+    """Per-query averages of prompt tokens, chunks sent, LLM time and rerank time (api mode)."""
+    answered = [r for r in results if not r.get("error") and "tokens_input" in r]
+    if not answered:
+        return {}
+    llm = [r["llm_ms"] for r in answered if r["llm_ms"] is not None]
+    return {
+        "queries": len(answered),
+        "avg_prompt_tokens": round(float(np.mean([r["tokens_input"] for r in answered])), 1),
+        "avg_chunks": round(float(np.mean([r["chunks"] for r in answered])), 2),
+        "avg_llm_ms": round(float(np.mean(llm)), 1) if llm else None,
+        # Averaged over all answered queries: queries that skip retrieval add no rerank time
+        "avg_rerank_ms": round(sum(r["rerank_ms"] or 0.0 for r in answered) / len(answered), 1)
+    }
+
+
+def compare_cost(cost, baseline):
+    """Rerank latency added against prompt tokens and LLM latency saved, relative to a baseline report."""
+    base = baseline.get("cost") or {}
+    if not cost or not base:
+        return {}
+    comparison = {
+        "rerank_ms_added": round(cost["avg_rerank_ms"] - base.get("avg_rerank_ms", 0.0), 1),
+        "prompt_tokens_saved": round(base["avg_prompt_tokens"] - cost["avg_prompt_tokens"], 1),
+        "prompt_tokens_saved_pct": round(100 * (1 - cost["avg_prompt_tokens"] / base["avg_prompt_tokens"]), 1)
+        if base["avg_prompt_tokens"] else 0.0
+    }
+    if cost["avg_llm_ms"] is not None and base.get("avg_llm_ms") is not None:
+        comparison["llm_ms_saved"] = round(base["avg_llm_ms"] - cost["avg_llm_ms"], 1)
+        comparison["net_ms_saved"] = round(comparison["llm_ms_saved"] - comparison["rerank_ms_added"], 1)
+    return comparison
+
+
+# --- Runners ---
+
+async def run_api_item(client, sem, url, item, k):
+    """Query the running API and score the answer, classification and sources."""
+    async with sem:
+        start = time.perf_counter()
         try:
-            start = time.time()
-            resp = requests.post(API_URL, json={"question": query}, timeout=30)
-            elapsed = int((time.time() - start) * 1000)
+            resp = await client.post(url, json={"question": item["query"]})
+        except Exception as e:
+            return {"item": item, "error": str(e), "latency_ms": 0}
+        latency_ms = (time.perf_counter() - start) * 1000
 
-            if resp.status_code != 200:
-                print(f"  [{i}] FAIL (HTTP {resp.status_code})")
-                print(f"      Query: {query}")
-                print(f"      Error: {resp.text}\n")
-                failed += 1
-                continue
+    if resp.status_code != 200:
+        return {"item": item, "error": f"HTTP {resp.status_code}: {resp.text[:200]}", "latency_ms": latency_ms}
 
-            data = resp.json()
-            answer = data.get("answer", "")
-            classification = data.get("metadata", {}).get("classification", "")
-            model = data.get("metadata", {}).get("model_used", "")
+    data = resp.json()
+    metadata = data.get("metadata", {})
+    stages = metadata.get("stages_ms") or {}
+    labels, n_relevant = relevance_labels(item, data.get("sources", [])[:k])
+    return {
+        "item": item,
+        "latency_ms": latency_ms,
+        "answer": data.get("answer", ""),
+        "classification": metadata.get("classification", ""),
+        "model": metadata.get("model_used", ""),
+        "tokens_input": metadata.get("tokens", {}).get("input", 0),
+        "chunks": metadata.get("chunks_retrieved", 0),
+        "llm_ms": stages.get("llm"),
+        "rerank_ms": stages.get("rerank"),
+        "labels": labels,
+        "n_relevant": n_relevant
+    }
 
-            # Check keyword match
-            kw_match = check_keywords(answer, expected_kw)
 
-            # Check classification
-            class_match = classification == expected_class
+async def run_retrieval_item(sem, item, k):
+    """Call the retriever directly (no LLM) and score the retrieved chunks."""
+    from retriever import retrieve
+    from router import classify_query
 
-            # Overall result
-            result = "PASS" if (kw_match and class_match) else "FAIL"
+    async with sem:
+        start = time.perf_counter()
+        try:
+            chunks = await asyncio.to_thread(retrieve, item["query"], k)
+        except Exception as e:
+            return {"item": item, "error": str(e), "latency_ms": 0}
+        latency_ms = (time.perf_counter() - start) * 1000
 
-            if result == "PASS":
-                passed += 1
-            else:
-                failed += 1
+    sources = [{"document": chunk.document, "page": chunk.page} for chunk in chunks]
+    labels, n_relevant = relevance_labels(item, sources)
+    return {
+        "item": item,
+        "latency_ms": latency_ms,
+        "classification": classify_query(item["query"])["classification"],
+        "labels": labels,
+        "n_relevant": n_relevant
+    }
 
-            print(f"  [{i}] {result} | {elapsed}ms | {classification} -> {model}")
-            print(f"      Query:    {query}")
-            print(f"      Answer:   {answer[:120]}...")
-            if not kw_match:
-                print(f"      ⚠ Keywords not found: {expected_kw}")
-            if not class_match:
-                print(f"      ⚠ Expected '{expected_class}', got '{classification}'")
-            print()
 
-        except requests.exceptions.ConnectionError:
-            print(f"  [{i}] ERROR - Cannot connect to backend")
-            print(f"      Query: {query}\n")
+async def run_all(items, mode, concurrency, k, url):
+    sem = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    if mode == "api":
+        import httpx
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            results = await asyncio.gather(*(run_api_item(client, sem, url, item, k) for item in items))
+    else:
+        results = await asyncio.gather(*(run_retrieval_item(sem, item, k) for item in items))
+
+    return list(results), time.perf_counter() - start
+
+
+def score(result):
+    """PASS/FAIL for one result, plus the reasons it failed."""
+    item = result["item"]
+    problems = []
+
+    if "answer" in result and item.get("expected_keywords"):
+        if not check_keywords(result["answer"], item["expected_keywords"]):
+            problems.append(f"Keywords not found: {item['expected_keywords']}")
+
+    expected_class = item.get("expected_classification")
+    if expected_class and result["classification"] != expected_class:
+        problems.append(f"Expected '{expected_class}', got '{result['classification']}'")
+
+    if result.get("labels") is not None and not any(result["labels"]):
+        problems.append(f"No expected source retrieved: {item.get('expected_docs') or item.get('expected_pages')}")
+
+    return ("FAIL" if problems else "PASS"), problems
+
+
+def run_tests(items=None, mode="api", concurrency=8, k=10, url=API_URL, verbose=True, output=None, baseline=None):
+    items = items if items is not None else tests
+
+    print("=" * 80)
+    print("Clearpath RAG - Evaluation Harness")
+    print("=" * 80)
+    target = url if mode == "api" else "retriever.retrieve (no LLM)"
+    print(f"Running {len(items)} test queries against {target} (concurrency={concurrency}, k={k})\n")
+
+    results, wall_s = asyncio.run(run_all(items, mode, concurrency, k, url))
+
+    passed = failed = errors = 0
+    for i, result in enumerate(results, 1):
+        query = result["item"]["query"]
+        if result.get("error"):
             errors += 1
-        except Exception as e:
-            print(f"  [{i}] ERROR - {str(e)}")
+            print(f"  [{i}] ERROR - {result['error']}")
             print(f"      Query: {query}\n")
-            errors += 1
+            continue
+
+        verdict, problems = score(result)
+        if verdict == "PASS":
+            passed += 1
+        else:
+            failed += 1
+
+        if verbose or problems:
+            route = f"{result['classification']} -> {result['model']}" if mode == "api" else result["classification"]
+            print(f"  [{i}] {verdict} | {int(result['latency_ms'])}ms | {route}")
+            print(f"      Query:    {query}")
+            if "answer" in result:
+                print(f"      Answer:   {result['answer'][:120]}...")
+            for problem in problems:
+                print(f"      ⚠ {problem}")
+            print()
+
+    retrieval = retrieval_report(results, k)
+    latency = latency_report(results, wall_s)
+    cost = cost_report(results)
+    comparison = compare_cost(cost, baseline) if baseline else {}
 
     print("=" * 80)
     print(f"Results: {passed} PASSED | {failed} FAILED | {errors} ERRORS")
-    print(f"Total:   {len(tests)} tests")
+    print(f"Total:   {len(items)} tests")
+    if retrieval:
+        metrics = " | ".join(f"{name} {value}" for name, value in retrieval.items() if name != "labeled_queries")
+        print(f"Retrieval ({retrieval['labeled_queries']} labeled): {metrics}")
+    if latency:
+        print(f"Latency: p50 {latency['p50_ms']}ms | p95 {latency['p95_ms']}ms | p99 {latency['p99_ms']}ms "
+              f"| {latency['throughput_qps']} queries/s over {latency['wall_s']}s")
+    if cost:
+        print(f"Cost:    {cost['avg_prompt_tokens']} prompt tokens | {cost['avg_chunks']} chunks | "
+              f"LLM {cost['avg_llm_ms']}ms | rerank {cost['avg_rerank_ms']}ms (per query)")
+    if comparison:
+        saved = f" | LLM -{comparison['llm_ms_saved']}ms | net latency {-comparison['net_ms_saved']:+.1f}ms" \
+            if "llm_ms_saved" in comparison else ""
+        print(f"vs baseline: rerank +{comparison['rerank_ms_added']}ms | prompt tokens "
+              f"-{comparison['prompt_tokens_saved']} ({comparison['prompt_tokens_saved_pct']}%){saved}")
     print("=" * 80)
 
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                "mode": mode, "k": k, "concurrency": concurrency,
+                "passed": passed, "failed": failed, "errors": errors,
+                "retrieval": retrieval, "latency": latency, "cost": cost, "vs_baseline": comparison
+            }, f, indent=2)
+        print(f"Saved report to {output}")
+
+    return {"passed": passed, "failed": failed, "errors": errors, "retrieval": retrieval, "latency": latency,
+            "cost": cost, "vs_baseline": comparison}
+
 
 if __name__ == "__main__":
-    run_tests()
+    parser = argparse.ArgumentParser(description="Clearpath evaluation harness")
+    parser.add_argument("--mode", choices=["api", "retrieval"], default="api")
+    parser.add_argument("--dataset", help="JSONL file of labeled queries (default: built-in tests)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10, help="retrieval cutoff for recall@k / MRR")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--output", help="write a JSON report here")
+    parser.add_argument("--quiet", action="store_true", help="only print failures and the summary")
+    parser.add_argument("--baseline", help="earlier --output report to compare cost against (e.g. reranking off)")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset) if args.dataset else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    run_tests(dataset, args.mode, args.concurrency, args.k, args.url, not args.quiet, args.output, baseline)
@@ -51,7 +51,7 @@ def check_conflicting_sources(chunks):
     # Extract all numbers with their surrounding context (5 words before)
     number_contexts = []
     for chunk in chunks:
-        text = chunk["text"].lower()
+        text = chunk.text.lower()
         # Find patterns like "$99", "99%", "99 users", numbers with context
         matches = re.finditer(r'(\w+\s+){0,3}(\$[\d,.]+|[\d,.]+%|[\d,.]+)', text)
         for match in matches:
@@ -0,0 +1,77 @@
+"""
+PDF Extraction Cache
+====================
+Persistent on-disk cache of extracted page text, so re-running ingest.py
+after changing chunking or embedding settings skips PDF parsing (pdfplumber
+layout analysis, by far the slowest ingest stage) for unchanged files.
+
+Pages are keyed by (file content hash, page number, extractor version).
+All pages of one PDF are stored together as zlib-compressed JSON:
+  <sha1 of the file>.<version>.json.z  →  {"pages": [[page, text], ...]}
+
+Changing the extractor version (see ingest.EXTRACTOR_VERSION) makes old
+entries stop matching. Only complete extractions are written, so a PDF that
+failed to parse is retried on the next run.
+"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+
+
+def file_key(path, block=1 << 20):
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class ExtractCache:
+    def __init__(self, directory, version, refresh=False):
+        """
+        `refresh` ignores entries written before this run: every PDF is
+        re-extracted and re-cached once, and later reads in the same run
+        (a PDF in several collections, the FAQ build) use the new entry.
+        """
+        self.directory = directory
+        self.version = re.sub(r"[^\w.-]", "_", str(version))
+        self.refresh = refresh
+        self.refreshed = set()   # keys written during this run
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.{self.version}.json.z")
+
+    def get(self, key):
+        """Cached [(page_number, text), ...] for a file hash, or None."""
+        path = self._path(key)
+        if (self.refresh and key not in self.refreshed) or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as f:
+                pages = json.loads(zlib.decompress(f.read()))["pages"]
+        except (OSError, ValueError, KeyError, zlib.error):
+            self.misses += 1   # unreadable entry: extract again and overwrite it
+            return None
+        self.hits += 1
+        return [(page, text) for page, text in pages]
+
+    def put(self, key, pages):
+        data = zlib.compress(json.dumps({"pages": pages}, separators=(",", ":")).encode("utf-8"), 6)
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.refreshed.add(key)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
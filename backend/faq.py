@@ -0,0 +1,104 @@
+"""
+FAQ Fast Path
+=============
+Serves stored answers for queries that match a question from the FAQ
+documents, without retrieval or an LLM call.
+
+The FAQ index (built by ingest.py from FAQ_DOCUMENTS) holds normalized
+question embeddings in an inner-product index, so scores are cosine
+similarities. A query matches when its best score is at least
+FAQ_THRESHOLD; set FAQ_ENABLED = false to turn the fast path off.
+"""
+
+import os
+import pickle
+import threading
+
+import faiss
+import numpy as np
+
+from retriever import ChunkRef
+from config import FAQ_ENABLED, FAQ_INDEX_PATH, FAQ_METADATA_PATH, FAQ_THRESHOLD
+
+# Loaded once on first lookup; None if the FAQ index hasn't been built
+_faq = None
+_faq_loaded = False
+_lock = threading.Lock()
+_stats = {"lookups": 0, "hits": 0, "hit_score_sum": 0.0}
+
+
+def _load_faq():
+    global _faq, _faq_loaded
+
+    with _lock:
+        if not _faq_loaded:
+            if os.path.exists(FAQ_INDEX_PATH) and os.path.exists(FAQ_METADATA_PATH):
+                with open(FAQ_METADATA_PATH, "rb") as f:
+                    _faq = (faiss.read_index(FAQ_INDEX_PATH), pickle.load(f))
+            _faq_loaded = True
+    return _faq
+
+
+def match_batch(query_embeddings, record=True):
+    """
+    Best FAQ entry per query row, or None where nothing clears FAQ_THRESHOLD.
+    Entries are dicts with question, answer, document, page and score.
+
+    With `record=False` the lookups are not counted in the metrics; a caller
+    matching speculatively passes them to count_lookups() once the result is used.
+    """
+    if not FAQ_ENABLED or len(query_embeddings) == 0:
+        return [None] * len(query_embeddings)
+    faq = _load_faq()
+    if faq is None:
+        return [None] * len(query_embeddings)
+
+    index, entries = faq
+    queries = np.array(query_embeddings, dtype="float32")
+    faiss.normalize_L2(queries)
+    scores, ids = index.search(queries, 1)
+
+    matches = []
+    for score, idx in zip(scores[:, 0], ids[:, 0]):
+        score = float(score)
+        matches.append({**entries[idx], "score": round(score, 4)} if idx != -1 and score >= FAQ_THRESHOLD else None)
+
+    if record:
+        count_lookups(matches)
+    return matches
+
+
+def count_lookups(matches):
+    """Count lookups whose results were consulted (None for a miss)."""
+    if not FAQ_ENABLED or _faq is None:
+        return
+    with _lock:
+        _stats["lookups"] += len(matches)
+        for found in matches:
+            if found:
+                _stats["hits"] += 1
+                _stats["hit_score_sum"] += found["score"]
+
+
+def match(query_embedding, record=True):
+    """The FAQ entry for one query embedding of shape (1, d), or None."""
+    return match_batch(query_embedding, record)[0]
+
+
+def as_chunk(entry):
+    """An FAQ entry as a retrieved chunk (in a one-entry store), for sources and the evaluator."""
+    store = [{"text": f"Q: {entry['question']} A: {entry['answer']}", "document": entry["document"], "page": entry["page"]}]
+    return ChunkRef(0, entry["score"], store)
+
+
+def get_metrics():
+    with _lock:
+        lookups, hits = _stats["lookups"], _stats["hits"]
+        return {
+            "enabled": FAQ_ENABLED,
+            "index_loaded": _faq is not None,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_hit_score": round(_stats["hit_score_sum"] / hits, 4) if hits else 0.0
+        }
@@ -0,0 +1,86 @@
+"""
+History Compaction (Rolling Summaries)
+======================================
+With HISTORY_MODE = "summary" a conversation keeps only its last
+HISTORY_RECENT_TURNS exchanges verbatim. Older messages are folded into a
+rolling summary written by HISTORY_SUMMARY_MODEL (the 8B model) and cached
+in the conversation's state, so prompt size stays roughly flat however long
+the conversation runs.
+
+  - schedule() runs compact() after each saved turn on its own small pool
+    (HISTORY_SUMMARY_WORKERS threads), so summarizing never delays an answer
+    and a slow 8B call never holds up the post-response worker's log and
+    flag writes. The messages trimmed since the last summary are sent with
+    the previous summary; the reply replaces it.
+  - One compaction per conversation at a time: a turn saved while its
+    conversation is being summarized leaves its messages pending for the
+    next turn.
+  - The summary is bounded: the model is asked for at most
+    HISTORY_SUMMARY_WORDS words and capped at HISTORY_SUMMARY_MAX_TOKENS.
+  - Until a summary covers them, trimmed messages are still sent verbatim
+    (memory.prompt_history), so nothing drops out of the prompt meanwhile.
+  - The summary call is shed, not queued, when the 8B rate limit is
+    exhausted; the messages stay pending and are retried after the next turn.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import HISTORY_MODE, HISTORY_SUMMARY_WORKERS
+from llm import summarize_history
+from memory import unsummarized, set_summary
+
+_executor = None
+_executor_lock = threading.Lock()
+_compacting = set()     # conversations with a compaction scheduled or running
+_stats_lock = threading.Lock()
+_stats = {"summaries": 0, "failed": 0, "messages_folded": 0, "tokens_used": 0, "skipped_busy": 0}
+
+
+def schedule(conversation_id):
+    """Run compact() for the conversation in the background, unless one is already under way."""
+    global _executor
+    with _executor_lock:
+        if conversation_id in _compacting:
+            with _stats_lock:
+                _stats["skipped_busy"] += 1
+            return
+        _compacting.add(conversation_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix="history-summary")
+    _executor.submit(_compact_scheduled, conversation_id)
+
+
+def _compact_scheduled(conversation_id):
+    try:
+        compact(conversation_id)
+    except Exception as e:
+        print(f"[WARN] History summary task for {conversation_id} failed: {e}")
+    finally:
+        with _executor_lock:
+            _compacting.discard(conversation_id)
+
+
+def compact(conversation_id):
+    """Fold the conversation's trimmed messages into its summary (no-op if there are none)."""
+    messages, summary = unsummarized(conversation_id)
+    if not messages:
+        return
+    try:
+        new_summary, used = summarize_history(summary, messages)
+    except Exception as e:
+        with _stats_lock:
+            _stats["failed"] += 1
+        print(f"[WARN] History summary for {conversation_id} failed, retrying next turn: {e}")
+        return
+
+    set_summary(conversation_id, new_summary, messages)
+    with _stats_lock:
+        _stats["summaries"] += 1
+        _stats["messages_folded"] += len(messages)
+        _stats["tokens_used"] += used
+
+
+def get_metrics():
+    with _stats_lock:
+        return {"mode": HISTORY_MODE, "in_progress": len(_compacting), **_stats}
@@ -1,21 +1,50 @@
 
 import os
+import re
+import bisect
+import json
+import queue
 import pickle
+import shutil
+import argparse
+import threading
+import time
 import pdfplumber
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from config import (
-    DOCS_DIR, FAISS_INDEX_PATH, METADATA_PATH,
-    EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, MIN_CHUNK_SIZE
+    DOCS_DIR, DEFAULT_COLLECTION, COLLECTIONS,
+    EMBEDDING_MODEL, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, MIN_CHUNK_TOKENS,
+    INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, INGEST_CHECKPOINT_EVERY, INGEST_CHECKPOINT_DIR,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES,
+    EXTRACT_CACHE_ENABLED, EXTRACT_CACHE_DIR,
+    FAQ_ENABLED, FAQ_DOCUMENTS, FAQ_INDEX_PATH, FAQ_METADATA_PATH, INDEX_SHARDS
 )
+from embedding_cache import EmbeddingCache
+from extract_cache import ExtractCache, file_key
+from retriever import collection_paths
+from shards import write_shards
+from query_rewriter import content_words
 
 
-def extract_text_from_pdf(pdf_path):
+# Part of the extraction cache key: bump the suffix when the cleanup below changes
+EXTRACTOR_VERSION = f"pdfplumber-{pdfplumber.__version__}-1"
+
+
+def extract_text_from_pdf(pdf_path, cache=None):
     """
     Extract text from a PDF file page by page.
     Returns a list of (page_number, text) tuples.
+    With an ExtractCache, unchanged files are served from it without parsing.
     """
+    key = None
+    if cache is not None:
+        key = file_key(pdf_path)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     pages = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
@@ -28,55 +57,117 @@ def extract_text_from_pdf(pdf_path):
                     pages.append((i + 1, text))           # 1-indexed page numbers
     except Exception as e:
         print(f"  [ERROR] Failed to read {pdf_path}: {e}")
+        return pages
+    if cache is not None:
+        cache.put(key, pages)
     return pages
 
 
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    """
-    Split text into chunks of ~chunk_size words with overlap.
-    
-    We split on word boundaries and try to break at sentence endings
-    (periods) when possible, to preserve semantic meaning.
-    """
-    words = text.split()
-    if len(words) <= chunk_size:
-        return [text]
+# Sentence boundary: end punctuation followed by whitespace and a likely sentence start
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
 
-    chunks = []
-    start = 0
 
-    while start < len(words):
-        end = start + chunk_size
+def split_sentences(text):
+    """Split page text into sentences (regex-based, no NLP dependency)."""
+    return [s for s in SENTENCE_BOUNDARY.split(text) if s]
 
-        # If we're not at the end, try to break at a sentence boundary
-        if end < len(words):
-            # Look backwards from 'end' for a period to break at
-            best_break = end
-            for j in range(end, max(start + chunk_size // 2, start), -1):
-                if words[j - 1].endswith(('.', '!', '?')):
-                    best_break = j
+
+def _split_long_sentence(sentence, max_tokens, tokenizer):
+    """Break a sentence longer than the token budget into word windows that fit."""
+    words = sentence.split()
+    word_tokens = [len(ids) for ids in tokenizer(words, add_special_tokens=False)["input_ids"]]
+    pieces, current, current_tokens = [], [], 0
+    for word, count in zip(words, word_tokens):
+        if current and current_tokens + count > max_tokens:
+            pieces.append((" ".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += count
+    if current:
+        pieces.append((" ".join(current), current_tokens))
+    return pieces
+
+
+def iter_sentences(pages, tokenizer, max_tokens):
+    """
+    Stream (sentence, n_tokens, page_number) across all pages of a document.
+    Each page is tokenized in one batched call, so the whole pass is linear.
+    """
+    for page_num, page_text in pages:
+        sentences = split_sentences(page_text)
+        if not sentences:
+            continue
+        token_ids = tokenizer(sentences, add_special_tokens=False)["input_ids"]
+        for sentence, ids in zip(sentences, token_ids):
+            if len(ids) <= max_tokens:
+                yield sentence, len(ids), page_num
+            else:
+                for piece, count in _split_long_sentence(sentence, max_tokens, tokenizer):
+                    yield piece, count, page_num
+
+
+def chunk_document(pages, tokenizer, max_tokens=CHUNK_MAX_TOKENS,
+                   overlap=CHUNK_OVERLAP_TOKENS, min_tokens=MIN_CHUNK_TOKENS):
+    """
+    Split a document into chunks of at most `max_tokens` embedding-model tokens.
+
+    Works across page boundaries (a section that spans two pages stays together)
+    and only breaks between sentences. Consecutive chunks share up to `overlap`
+    tokens of whole sentences. Yields dicts with the chunk text, its token count
+    and the span of pages it covers.
+    """
+    # Leave room for the [CLS] and [SEP] tokens the encoder adds
+    budget = max_tokens - 2
+
+    window = []             # (sentence, n_tokens, page) in the current chunk
+    window_tokens = 0
+    new_tokens = 0          # tokens in the window that weren't carried over as overlap
+    previous = []           # the last emitted window, used to top up a short tail
+    carried_count = 0       # sentences of `previous` carried into `window`
+
+    def make_chunk(sentences):
+        return {
+            "text": " ".join(s for s, _, _ in sentences),
+            "page": sentences[0][2],
+            "page_end": sentences[-1][2],
+            "n_tokens": sum(n for _, n, _ in sentences)
+        }
+
+    for sentence, n_tokens, page_num in iter_sentences(pages, tokenizer, budget):
+        if window and window_tokens + n_tokens > budget:
+            yield make_chunk(window)
+            previous = window
+
+            # Carry trailing sentences over as overlap
+            carried, carried_tokens = [], 0
+            for item in reversed(window):
+                if carried_tokens + item[1] > overlap or carried_tokens + item[1] + n_tokens > budget:
                     break
-            end = best_break
+                carried.insert(0, item)
+                carried_tokens += item[1]
+            window, window_tokens, new_tokens = carried, carried_tokens, 0
+            carried_count = len(carried)
 
-        chunk_words = words[start:end]
-        chunk_text_str = " ".join(chunk_words)
+        window.append((sentence, n_tokens, page_num))
+        window_tokens += n_tokens
+        new_tokens += n_tokens
 
-        if len(chunk_words) >= MIN_CHUNK_SIZE:
-            chunks.append(chunk_text_str)
+    if not new_tokens:
+        return
 
-        # Move forward by (chunk length - overlap) words
-        start = start + (end - start) - overlap
-        if start >= len(words):
-            break
+    # A short tail is topped up with earlier sentences instead of becoming a tiny chunk
+    if new_tokens < min_tokens and previous:
+        for item in reversed(previous[:len(previous) - carried_count]):
+            if window_tokens + item[1] > budget:
+                break
+            window.insert(0, item)
+            window_tokens += item[1]
 
-    return chunks
+    yield make_chunk(window)
 
 
-def load_all_documents():
-    """
-    Load all PDFs from the docs directory.
-    Returns a list of chunk dicts with text, document name, and page number.
-    """
+def list_pdf_files():
+    """Sorted PDF filenames in the docs directory."""
     if not os.path.exists(DOCS_DIR):
         print(f"[ERROR] Docs directory not found: {DOCS_DIR}")
         return []
@@ -84,83 +175,437 @@ def load_all_documents():
     pdf_files = sorted([f for f in os.listdir(DOCS_DIR) if f.lower().endswith(".pdf")])
     if not pdf_files:
         print("[ERROR] No PDF files found in docs/")
-        return []
+    return pdf_files
 
-    print(f"Found {len(pdf_files)} PDF files in {DOCS_DIR}")
 
-    all_chunks = []
+# --- Pipeline stages ---
+
+def produce_documents(pdf_files, tokenizer, max_tokens, out_queue, stats, extract_cache=None):
+    """
+    Stage 1 (background thread): extract + chunk one document at a time.
+    Puts (pdf_file, chunks) on a bounded queue, then None when finished.
+    An exception is forwarded through the queue so the consumer can re-raise it.
+    """
+    try:
+        for pdf_file in pdf_files:
+            start = time.perf_counter()
+            pages = extract_text_from_pdf(os.path.join(DOCS_DIR, pdf_file), extract_cache)
+            stats["extract_seconds"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunks = []
+            for chunk in chunk_document(pages, tokenizer, max_tokens):
+                chunk["document"] = pdf_file
+                chunks.append(chunk)
+            stats["chunk_seconds"] += time.perf_counter() - start
+            stats["tokens"] += sum(c["n_tokens"] for c in chunks)
+
+            print(f"  Processed: {pdf_file} -> {len(chunks)} chunks from {len(pages)} pages")
+            out_queue.put((pdf_file, chunks))
+    except Exception as e:
+        out_queue.put(e)
+    out_queue.put(None)
+
+
+def tune_batch_size(model, texts, candidates=(8, 16, 32, 64, 128)):
+    """
+    Time model.encode on a sample of texts for increasing batch sizes and
+    return the fastest. Stops as soon as a larger batch stops helping.
+    """
+    best_size, best_rate = candidates[0], 0.0
+    for size in candidates:
+        if size > len(texts):
+            break
+        start = time.perf_counter()
+        model.encode(texts, batch_size=size)
+        rate = len(texts) / (time.perf_counter() - start)
+        print(f"    batch_size={size}: {rate:.1f} chunks/s")
+        if rate < best_rate * 1.05:
+            break
+        best_size, best_rate = size, rate
+    return best_size
+
+
+# --- Checkpointing ---
+
+def _checkpoint_dir(collection):
+    return os.path.join(INGEST_CHECKPOINT_DIR, collection)
+
+
+def _checkpoint_paths(collection):
+    directory = _checkpoint_dir(collection)
+    return (
+        os.path.join(directory, "index.bin"),
+        os.path.join(directory, "metadata.jsonl"),
+        os.path.join(directory, "progress.json")
+    )
+
+
+def _atomic_write_index(index, path):
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
 
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(DOCS_DIR, pdf_file)
-        print(f"  Processing: {pdf_file}")
 
-        pages = extract_text_from_pdf(pdf_path)
-        doc_chunk_count = 0
+def save_checkpoint(index, meta_file, done, settings, collection):
+    """Persist the index and the list of fully ingested documents."""
+    index_path, _, progress_path = _checkpoint_paths(collection)
+    meta_file.flush()
+    os.fsync(meta_file.fileno())
+    _atomic_write_index(index, index_path)
 
-        for page_num, page_text in pages:
-            chunks = chunk_text(page_text)
-            for chunk in chunks:
-                all_chunks.append({
-                    "text": chunk,
-                    "document": pdf_file,
-                    "page": page_num
-                })
-                doc_chunk_count += 1
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"done": done, "ntotal": index.ntotal, "settings": settings}, f)
+    os.replace(tmp_path, progress_path)
 
-        print(f"    -> {doc_chunk_count} chunks from {len(pages)} pages")
 
-    print(f"\nTotal chunks: {len(all_chunks)}")
-    return all_chunks
+def load_checkpoint(settings, collection):
+    """
+    Load a previous checkpoint if it was made with the same settings.
+    Returns (index, done_documents) or (None, []).
+    """
+    index_path, meta_path, progress_path = _checkpoint_paths(collection)
+    if not os.path.exists(progress_path):
+        return None, []
+
+    with open(progress_path) as f:
+        progress = json.load(f)
+    if progress["settings"] != settings:
+        print("  Checkpoint was made with different settings, starting fresh.")
+        return None, []
+
+    index = faiss.read_index(index_path)
+
+    # The index is written before progress.json: a crash in between leaves an
+    # index ahead of the recorded progress, which can't be matched to metadata
+    if index.ntotal != progress["ntotal"]:
+        print("  Checkpoint index doesn't match its progress record, starting fresh.")
+        return None, []
+
+    # Drop metadata written after the checkpoint (its vectors were never saved)
+    with open(meta_path) as f:
+        lines = [line for _, line in zip(range(progress["ntotal"]), f)]
+    if len(lines) < progress["ntotal"]:
+        print("  Checkpoint metadata is incomplete, starting fresh.")
+        return None, []
+    with open(meta_path, "w") as f:
+        f.writelines(lines)
+
+    print(f"  Resuming: {len(progress['done'])} documents, {index.ntotal} vectors already ingested")
+    return index, progress["done"]
+
+
+def finalize(index, meta_path, collection, shards=INDEX_SHARDS):
+    """
+    Write the collection's final index + metadata.pkl and remove the checkpoint.
+    With shards > 1 the index is also split into shards for scatter-gather search.
+    """
+    index_path, metadata_path = collection_paths(collection)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+
+    _atomic_write_index(index, index_path)
+    print(f"Saved FAISS index to {index_path}")
+
+    with open(meta_path) as f:
+        metadata = [json.loads(line) for line in f]
+    if shards > 1:
+        print(f"Splitting index into {shards} shards...")
+    write_shards(index, metadata, index_path, shards)
+    tmp_path = metadata_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(metadata, f)
+    os.replace(tmp_path, metadata_path)
+    print(f"Saved metadata to {metadata_path}")
 
+    shutil.rmtree(_checkpoint_dir(collection), ignore_errors=True)
 
-def build_faiss_index(chunks):
+
+# --- Pipeline ---
+
+def document_tags(pdf_file):
+    """Names of the collections a document belongs to (stored with each chunk for filtering)."""
+    return [name for name, files in COLLECTIONS.items() if pdf_file in files]
+
+
+def run_ingest(collection=DEFAULT_COLLECTION, resume=False, batch_size=INGEST_BATCH_SIZE,
+               use_cache=EMBEDDING_CACHE_ENABLED, model=None, shards=INDEX_SHARDS, extract_cache=None):
     """
-    Generate embeddings for all chunks and build a FAISS index.
-    Saves:
-      - faiss_index.bin  (the vector index)
-      - metadata.pkl     (chunk text + document + page for each vector)
+    Streaming ingest: extract → chunk → batch-embed → add to index → append metadata.
+
+    Extraction/chunking runs in a background thread feeding a bounded queue,
+    so only a few documents plus one embedding batch are held in memory
+    besides the index itself. Metadata is appended to disk as vectors are
+    added, and a checkpoint is written every INGEST_CHECKPOINT_EVERY vectors.
+    Chunks whose text was embedded before are served from the embedding cache,
+    and PDFs extracted before from `extract_cache` (an ExtractCache).
+
+    `collection` builds a named subset of docs/ (see COLLECTIONS in config.py)
+    into its own index; the default collection covers every document.
+    `shards` > 1 also writes the index as that many shards (see shards.py).
     """
-    if not chunks:
+    pdf_files = list_pdf_files()
+    if collection != DEFAULT_COLLECTION:
+        collection_paths(collection)  # validates the name
+        pdf_files = [f for f in pdf_files if f in COLLECTIONS[collection]]
+    if not pdf_files:
+        return
+
+    print(f"Collection '{collection}': {len(pdf_files)} PDF files in {DOCS_DIR}")
+    if model is None:
+        print(f"Loading embedding model: {EMBEDDING_MODEL}")
+        model = SentenceTransformer(EMBEDDING_MODEL)
+    max_tokens = min(CHUNK_MAX_TOKENS, model.max_seq_length)
+    settings = {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunking": [max_tokens, CHUNK_OVERLAP_TOKENS, MIN_CHUNK_TOKENS]
+    }
+
+    os.makedirs(_checkpoint_dir(collection), exist_ok=True)
+    _, meta_path, progress_path = _checkpoint_paths(collection)
+    index, done = load_checkpoint(settings, collection) if resume else (None, [])
+    if index is None and os.path.exists(progress_path):
+        os.remove(progress_path)  # starting fresh: the old checkpoint is no longer valid
+    meta_file = open(meta_path, "a" if index is not None else "w")
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, EMBEDDING_CACHE_MAX_ENTRIES) if use_cache else None
+
+    stats = {"extract_seconds": 0.0, "chunk_seconds": 0.0, "tokens": 0, "embed_seconds": 0.0}
+    todo = [f for f in pdf_files if f not in set(done)]
+    docs_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    threading.Thread(
+        target=produce_documents,
+        args=(todo, model.tokenizer, max_tokens, docs_queue, stats, extract_cache),
+        daemon=True
+    ).start()
+
+    pending = []            # chunks waiting to be embedded
+    received = []           # documents whose chunks are pending or embedded since the last checkpoint
+    since_checkpoint = 0
+    start = time.perf_counter()
+
+    def embed(batch):
+        nonlocal index
+        t = time.perf_counter()
+        texts = [c["text"] for c in batch]
+        if cache is not None:
+            embeddings = cache.encode(model, texts, batch_size=len(batch))
+        else:
+            embeddings = np.asarray(model.encode(texts, batch_size=len(batch)), dtype="float32")
+        stats["embed_seconds"] += time.perf_counter() - t
+
+        if index is None:
+            index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(embeddings)
+        for c in batch:
+            meta_file.write(json.dumps({
+                "text": c["text"], "document": c["document"], "page": c["page"], "page_end": c["page_end"],
+                "tags": document_tags(c["document"])
+            }) + "\n")
+
+    while True:
+        item = docs_queue.get()
+        if isinstance(item, Exception):
+            raise item
+        finished = item is None
+
+        if not finished:
+            pdf_file, chunks = item
+            pending.extend(chunks)
+            received.append(pdf_file)
+
+        # Pick a batch size once there is a representative sample
+        if batch_size == "auto" and (len(pending) >= 128 or finished):
+            print("  Tuning embedding batch size...")
+            batch_size = tune_batch_size(model, [c["text"] for c in pending[:128]]) if len(pending) >= 8 else 8
+            print(f"  Using batch_size={batch_size}")
+
+        while batch_size != "auto" and len(pending) >= batch_size:
+            embed(pending[:batch_size])
+            since_checkpoint += batch_size
+            pending = pending[batch_size:]
+
+        # Checkpoint at a document boundary: flush the partial batch so every
+        # received document is fully in the index
+        if finished or since_checkpoint >= INGEST_CHECKPOINT_EVERY:
+            if pending:
+                embed(pending)
+                pending = []
+            if index is not None:
+                done.extend(received)
+                received = []
+                since_checkpoint = 0
+                save_checkpoint(index, meta_file, done, settings, collection)
+                if cache is not None:
+                    cache.save()
+
+        if finished:
+            break
+
+    meta_file.close()
+    if index is None:
         print("[ERROR] No chunks to index.")
         return
 
-    print(f"\nLoading embedding model: {EMBEDDING_MODEL}")
-    model = SentenceTransformer(EMBEDDING_MODEL)
+    elapsed = time.perf_counter() - start
+    print(f"\nFAISS index built: {index.ntotal} vectors, dimension={index.d}")
+    print(f"Extraction: {stats['extract_seconds']:.2f}s")
+    if extract_cache is not None:
+        print(f"Extraction cache: {extract_cache.hits}/{extract_cache.hits + extract_cache.misses} PDFs "
+              f"({extract_cache.hit_ratio():.1%}) served without parsing")
+    print(f"Chunking:  {stats['chunk_seconds']:.2f}s ({stats['tokens'] / max(stats['chunk_seconds'], 1e-9):,.0f} tokens/s)")
+    print(f"Embedding: {stats['embed_seconds']:.2f}s | Total: {elapsed:.2f}s")
+    if cache is not None:
+        print(f"Embedding cache: {cache.hits}/{cache.hits + cache.misses} hits ({cache.hit_ratio():.1%}), "
+              f"{len(cache)} entries stored")
+    finalize(index, meta_path, collection, shards)
 
-    # Extract just the text for embedding
-    texts = [c["text"] for c in chunks]
+    print("\n✅ Ingestion complete!")
 
-    print(f"Generating embeddings for {len(texts)} chunks...")
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=8)
-    embeddings = np.array(embeddings, dtype="float32")
 
-    # Build FAISS index (L2 distance, simple flat index — works great for <100k vectors)
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
+# --- FAQ extraction ---
 
-    print(f"FAISS index built: {index.ntotal} vectors, dimension={dimension}")
+# "Q: ... A: ..." pairs
+FAQ_QA_RE = re.compile(r"Q:\s*(.+?\?)\s*A:\s*(.+?)(?=\s*Q:|\Z)")
 
-    # Save index
-    faiss.write_index(index, FAISS_INDEX_PATH)
-    print(f"Saved FAISS index to {FAISS_INDEX_PATH}")
+# A question sentence: starts with a question word, ends with "?"
+FAQ_QUESTION_RE = re.compile(
+    r"\b(?:How|What|Where|When|Why|Which|Who|Can|Could|Is|Are|Do|Does|Should|Will)\b[^.?!]{5,200}\?"
+)
 
-    # Save metadata (text, document, page for each chunk)
-    metadata = [{"text": c["text"], "document": c["document"], "page": c["page"]} for c in chunks]
-    with open(METADATA_PATH, "wb") as f:
-        pickle.dump(metadata, f)
-    print(f"Saved metadata to {METADATA_PATH}")
+# Answers that try to instruct the model are never served verbatim
+FAQ_UNSAFE_RE = re.compile(r"ignore (?:all )?(?:previous|prior|above) instructions|disregard .{0,40}instructions", re.I)
 
-    print("\n✅ Ingestion complete!")
+# PDF artifacts: "fi" for arrows, (cid:127) for bullets
+FAQ_ARTIFACTS = [(re.compile(r"\s+fi\s+"), " → "), (re.compile(r"\s*\(cid:127\)\s*"), " • ")]
+
+
+def _clean_faq_text(text):
+    for pattern, replacement in FAQ_ARTIFACTS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def _trim_answer(answer):
+    """Drop a trailing section heading: keep the answer up to its last sentence end."""
+    end = max(answer.rfind(". "), answer.rfind("! "), answer.rfind(".) "))
+    if answer.endswith((".", "!", ")")):
+        return answer
+    return answer[:end + 1] if end > 0 else answer
+
+
+def extract_faq_pairs(pages, document):
+    """
+    Question/answer pairs from an FAQ document's pages.
+    Handles "Q: ... A: ..." and question-sentence-then-answer layouts.
+    Returns [{"question", "answer", "document", "page"}].
+    """
+    starts, parts, offset = [], [], 0
+    for page_num, text in pages:
+        starts.append((offset, page_num))
+        parts.append(text)
+        offset += len(text) + 1
+    text = " ".join(parts)
+    offsets = [o for o, _ in starts]
+
+    def page_at(pos):
+        return starts[bisect.bisect_right(offsets, pos) - 1][1]
+
+    spans = []   # (question start, question end, answer end)
+    if "Q:" in text:
+        for m in FAQ_QA_RE.finditer(text):
+            spans.append((m.start(1), m.end(1), m.start(2), m.end(2)))
+    else:
+        questions = []
+        for m in FAQ_QUESTION_RE.finditer(text):
+            start = m.start()
+            # Too vague on its own ("What should I do?"): include the sentence before it
+            if len(content_words(m.group())) < 2:
+                previous = max(text.rfind(". ", 0, start - 2), text.rfind("? ", 0, start - 2))
+                start = previous + 2 if previous >= 0 else start
+            questions.append((start, m.end()))
+        for i, (q_start, q_end) in enumerate(questions):
+            a_end = questions[i + 1][0] if i + 1 < len(questions) else len(text)
+            spans.append((q_start, q_end, q_end, a_end))
+
+    pairs = []
+    for q_start, q_end, a_start, a_end in spans:
+        question = _clean_faq_text(text[q_start:q_end])
+        answer = _clean_faq_text(_trim_answer(text[a_start:a_end].strip()))
+        if len(answer) < 20 or FAQ_UNSAFE_RE.search(answer):
+            continue
+        pairs.append({"question": question, "answer": answer, "document": document, "page": page_at(q_start)})
+    return pairs
+
+
+def build_faq_index(model, pdf_files=FAQ_DOCUMENTS, extract_cache=None):
+    """Extract FAQ pairs and save an inner-product index over their normalized question embeddings."""
+    pairs = []
+    for pdf_file in pdf_files:
+        path = os.path.join(DOCS_DIR, pdf_file)
+        if not os.path.exists(path):
+            print(f"  [WARN] FAQ document not found: {pdf_file}")
+            continue
+        found = extract_faq_pairs(extract_text_from_pdf(path, extract_cache), pdf_file)
+        print(f"  FAQ: {pdf_file} -> {len(found)} Q/A pairs")
+        pairs.extend(found)
+    if not pairs:
+        print("No FAQ pairs found; FAQ index not built.")
+        return
+
+    embeddings = np.array(model.encode([p["question"] for p in pairs]), dtype="float32")
+    faiss.normalize_L2(embeddings)
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+
+    _atomic_write_index(index, FAQ_INDEX_PATH)
+    tmp_path = FAQ_METADATA_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(pairs, f)
+    os.replace(tmp_path, FAQ_METADATA_PATH)
+    print(f"Saved FAQ index ({len(pairs)} questions) to {FAQ_INDEX_PATH}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clearpath document ingestion")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--batch-size", type=int, help="embedding batch size (default: auto-tune)")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the embedding cache")
+    parser.add_argument("--collection", action="append",
+                        help=f"collection to build (repeatable; default: '{DEFAULT_COLLECTION}')")
+    parser.add_argument("--all-collections", action="store_true",
+                        help="build the default index and every collection in config.COLLECTIONS")
+    parser.add_argument("--no-faq", action="store_true", help="skip building the FAQ index")
+    parser.add_argument("--force-extract", action="store_true",
+                        help="re-parse every PDF, ignoring (and refreshing) the extraction cache")
+    parser.add_argument("--shards", type=int, default=INDEX_SHARDS,
+                        help=f"split each index into N shards for scatter-gather search (default: {INDEX_SHARDS})")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("Clearpath RAG - Document Ingestion")
     print("=" * 60)
 
-    chunks = load_all_documents()
-    if chunks:
-        build_faiss_index(chunks)
+    if args.all_collections:
+        collections = [DEFAULT_COLLECTION] + list(COLLECTIONS)
     else:
-        print("No chunks generated. Check your docs/ folder.")
+        collections = args.collection or [DEFAULT_COLLECTION]
+
+    print(f"Loading embedding model: {EMBEDDING_MODEL}")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    extract_cache = None
+    if EXTRACT_CACHE_ENABLED:
+        extract_cache = ExtractCache(EXTRACT_CACHE_DIR, EXTRACTOR_VERSION, refresh=args.force_extract)
+
+    for name in collections:
+        run_ingest(
+            collection=name,
+            resume=args.resume,
+            batch_size=args.batch_size or INGEST_BATCH_SIZE,
+            use_cache=EMBEDDING_CACHE_ENABLED and not args.no_cache,
+            model=model,
+            shards=args.shards,
+            extract_cache=extract_cache
+        )
+
+    if FAQ_ENABLED and not args.no_faq:
+        build_faq_index(model, extract_cache=extract_cache)
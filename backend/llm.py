@@ -1,10 +1,19 @@
 
 import os
+import threading
 from groq import Groq
-from config import GROQ_API_KEY
+from config import (
+    GROQ_API_KEY, LLM_BACKEND, MAX_OUTPUT_TOKENS, RATE_LIMIT_MODE, RATE_LIMIT_MAX_WAIT,
+    HISTORY_SUMMARY_MODEL, HISTORY_SUMMARY_WORDS, HISTORY_SUMMARY_MAX_TOKENS
+)
+from ratelimit import acquire, settle
 
-# Initialize Groq client
-client = Groq(api_key=GROQ_API_KEY)
+# Initialize Groq client (or the deterministic stub for benchmarks)
+if LLM_BACKEND == "stub":
+    from stub_llm import StubClient
+    client = StubClient()
+else:
+    client = Groq(api_key=GROQ_API_KEY)
 
 SYSTEM_PROMPT = (
     "You are an expert Clearpath customer support assistant. "
@@ -16,6 +25,14 @@ SYSTEM_PROMPT = (
     "Be professional, technical, and concise."
 )
 
+SUMMARY_PROMPT = (
+    "You keep a running summary of a Clearpath customer support conversation. "
+    "Merge the earlier summary (if any) and the new messages into one updated summary "
+    f"of at most {HISTORY_SUMMARY_WORDS} words. Keep the topics discussed, product names, settings, "
+    "numbers, the user's situation and any open questions; drop greetings and small talk. "
+    "Reply with the summary only."
+)
+
 
 def build_messages(question, chunks, conversation_history=None):
     """
@@ -34,7 +51,7 @@ def build_messages(question, chunks, conversation_history=None):
         context_parts = []
         for i, chunk in enumerate(chunks, 1):
             context_parts.append(
-                f"[Source {i}: {chunk['document']}, Page {chunk['page']}]\n{chunk['text']}"
+                f"[Source {i}: {chunk.document}, Page {chunk.page}]\n{chunk.text}"
             )
         context_text = "\n\n".join(context_parts)
     else:
@@ -47,60 +64,176 @@ def build_messages(question, chunks, conversation_history=None):
     return messages
 
 
-def call_llm(question, chunks, model, conversation_history=None):
+def estimate_tokens(messages):
+    """
+    Cheap prompt-size estimate (~4 characters per token plus per-message overhead).
+    Used for rate-limit admission before the real usage is known.
+    """
+    return sum(len(msg["content"]) // 4 + 4 for msg in messages)
+
+
+def call_llm(question, chunks, model, conversation_history=None,
+             rate_limit_mode=RATE_LIMIT_MODE, max_wait=RATE_LIMIT_MAX_WAIT):
     """
     Call Groq API with the given question, context chunks, and model.
     
+    The request is admitted through the rate limiter first, which may
+    switch to the fallback model or raise RateLimitExceeded
+    (`rate_limit_mode` / `max_wait` override the configured policy).
+
     Returns:
-        dict with 'answer', 'tokens_input', 'tokens_output'
+        dict with 'answer', 'tokens_input', 'tokens_output', 'model_used'
     """
     messages = build_messages(question, chunks, conversation_history)
+    estimated = estimate_tokens(messages)
+    model = acquire(model, estimated, rate_limit_mode, max_wait)
 
+    used = 0   # a failed call refunds the whole estimate
     try:
         response = client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=0.3,
-            max_tokens=1024
+            max_tokens=MAX_OUTPUT_TOKENS
         )
 
         answer = response.choices[0].message.content
         tokens_input = response.usage.prompt_tokens
         tokens_output = response.usage.completion_tokens
+        used = tokens_input + tokens_output
 
         return {
             "answer": answer,
             "tokens_input": tokens_input,
-            "tokens_output": tokens_output
+            "tokens_output": tokens_output,
+            "model_used": model
         }
 
     except Exception as e:
         return {
             "answer": f"Sorry, I encountered an error: {str(e)}",
             "tokens_input": 0,
-            "tokens_output": 0
+            "tokens_output": 0,
+            "model_used": model
         }
+    finally:
+        settle(model, estimated, used)
+
+
+def summarize_history(summary, messages, model=HISTORY_SUMMARY_MODEL):
+    """
+    Fold `messages` into the rolling conversation `summary` (None for the
+    first one). The call is shed rather than queued when the model's rate
+    limit is exhausted. Returns (new summary, tokens used); raises on failure.
+    """
+    transcript = "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in messages)
+    prompt = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"EARLIER SUMMARY:\n{summary or '(none)'}\n\nNEW MESSAGES:\n{transcript}"}
+    ]
+    estimated = estimate_tokens(prompt)
+    model = acquire(model, estimated, mode="shed")
+
+    used = 0
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=prompt,
+            temperature=0.0,
+            max_tokens=HISTORY_SUMMARY_MAX_TOKENS
+        )
+        used = response.usage.prompt_tokens + response.usage.completion_tokens
+    finally:
+        settle(model, estimated, used)
+    return response.choices[0].message.content.strip(), used
 
 
 def call_llm_stream(question, chunks, model, conversation_history=None):
     """
     Call Groq API with streaming enabled.
-    Yields tokens one by one.
+
+    Admission happens eagerly (so RateLimitExceeded is raised here, before
+    any response is started). Returns a TokenStream; iterating it yields
+    tokens one by one and raises if the upstream request fails.
     """
     messages = build_messages(question, chunks, conversation_history)
+    estimated = estimate_tokens(messages)
+    model = acquire(model, estimated)
+    return TokenStream(messages, model, estimated)
 
-    try:
-        stream = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.3,
-            max_tokens=1024,
-            stream=True
-        )
 
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+class TokenStream:
+    """
+    Tokens of one streaming completion.
 
-    except Exception as e:
-        yield f" [Error during streaming: {str(e)}]"
+    close() stops generation upstream by closing the Groq HTTP stream; it is
+    safe to call from another thread while the stream is being iterated.
+    Rate-limit usage is settled exactly once, when the stream ends or closes.
+    """
+
+    def __init__(self, messages, model, estimated):
+        self.messages = messages
+        self.model = model
+        self.tokens_input = estimated
+        self.output_chars = 0
+        self.closed = False
+        self._stream = None
+        self._started = False
+        self._settled = False
+        self._lock = threading.Lock()
+
+    @property
+    def tokens_output(self):
+        return self.output_chars // 4
+
+    def __iter__(self):
+        with self._lock:
+            if self.closed or self._started:
+                return
+            self._started = True
+
+        try:
+            stream = client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                temperature=0.3,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                stream=True
+            )
+            with self._lock:
+                self._stream = stream
+                closed = self.closed
+            if closed:
+                stream.close()
+                return
+
+            for chunk in stream:
+                if self.closed:
+                    break
+                content = chunk.choices[0].delta.content
+                if content:
+                    self.output_chars += len(content)
+                    yield content
+        except Exception:
+            # Closing the HTTP stream mid-read surfaces as an error; that's expected
+            if not self.closed:
+                raise
+        finally:
+            self._settle()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            stream, started = self._stream, self._started
+        if stream is not None:
+            stream.close()
+        if not started:
+            self._settle()
+
+    def _settle(self):
+        # Streaming responses don't report usage, so settle with an estimate
+        with self._lock:
+            if self._settled:
+                return
+            self._settled = True
+        settle(self.model, self.tokens_input, self.tokens_input + self.tokens_output)
@@ -1,27 +1,79 @@
+import asyncio
 import time
 import json
+import orjson
+import gc
 import os
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import secrets
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Header, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
 
-from retriever import retrieve
-from router import classify_query
+from retriever import retrieve, retrieve_batch, embed_query, embed_queries, rescore, loaded_collections, collection_stats
+from router import classify_query, cache_info as router_cache_info
+from adaptive_router import choose_model, record_outcome
 from llm import call_llm, call_llm_stream
+from ratelimit import RateLimitExceeded, get_metrics as get_rate_limit_metrics
+from sse import StreamStats, format_event, token_frames, get_metrics as get_stream_metrics
+from pipeline import run_dag
+from singleflight import SingleFlight, SingleFlightTimeout
+from scheduler import PriorityScheduler, Overloaded
+from faq import (
+    match as faq_match, match_batch as faq_match_batch, as_chunk as faq_chunk, count_lookups as count_faq_lookups,
+    get_metrics as get_faq_metrics
+)
+from query_rewriter import retrieval_query
 
 from evaluator import evaluate
-from memory import get_or_create_conversation, add_message, get_history
-from config import LOGS_PATH, FAISS_INDEX_PATH
+from memory import (
+    get_or_create_conversation, add_message, get_history, get_state, add_flags, set_flags, get_flags,
+    prompt_history, conversation_store, conversation_state
+)
+from history_summary import schedule as compact_history, get_metrics as get_history_metrics
+import profiling
+import post_response
+from context_reuse import decide, previous_chunks, merge, remember, trim_reused
+from reranker import rerank, rerank_batch, get_metrics as get_rerank_metrics
+from config import (
+    LOGS_PATH, FAISS_INDEX_PATH, ROUTER_MODE, SPECULATIVE_RETRIEVAL, TOP_K, RERANK_ENABLED, RERANK_CANDIDATES,
+    SINGLEFLIGHT_ENABLED, EVALUATION_MODE, ADMIN_ENABLED, ADMIN_TOKEN, PROFILE_MAX_SECONDS, HISTORY_MODE,
+    BATCH_MAX_ITEMS, BATCH_CONCURRENCY, BATCH_RATE_LIMIT_MODE, BATCH_RATE_LIMIT_MAX_WAIT
+)
 
-app = FastAPI(title="Clearpath Support Chatbot API")
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Don't lose logs / flags still waiting in the post-response queue
+    await run_in_threadpool(post_response.drain)
+
+
+app = FastAPI(title="Clearpath Support Chatbot API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# In-flight /query pipeline runs, shared by identical concurrent requests
+flights = SingleFlight()
+
+# Per-classification admission in front of /query and /query_stream
+scheduler = PriorityScheduler()
 
 # --- Request/Response Models ---
 
+class QueryFilter(BaseModel):
+    documents: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+
+
 class QueryRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = None
+    collection: Optional[str] = None
+    filter: Optional[QueryFilter] = None
 
 
 class TokenInfo(BaseModel):
@@ -36,6 +88,13 @@ class MetadataInfo(BaseModel):
     latency_ms: int
     chunks_retrieved: int
     evaluator_flags: list
+    stages_ms: Optional[dict] = None
+    trace: Optional[dict] = None
+    retrieval_query: Optional[str] = None
+    context_reuse: Optional[dict] = None
+    rerank: Optional[dict] = None
+    coalesced: Optional[bool] = None
+    flags_pending: Optional[bool] = None   # background evaluation: see /conversations/{id}/flags
 
 
 class SourceInfo(BaseModel):
@@ -51,10 +110,40 @@ class QueryResponse(BaseModel):
     conversation_id: str
 
 
+def query_response(answer, conversation_id, sources, **metadata):
+    """
+    A response body in the QueryResponse shape, as plain dicts. /query
+    returns it through ORJSONResponse, skipping pydantic validation; the
+    models above still document the contract. Missing optional metadata is null.
+    """
+    return {
+        "answer": answer,
+        "metadata": {name: metadata.get(name) for name in MetadataInfo.model_fields},
+        "sources": sources,
+        "conversation_id": conversation_id
+    }
+
+
+# --- Timing ---
+
+def lap(stages, name, started):
+    """Record the ms elapsed since `started` as stage `name`; returns the current time."""
+    now = time.perf_counter()
+    stages[name] = round((now - started) * 1000, 2)
+    return now
+
+
 # --- Logging ---
 
 def log_request(entry):
     """Append a log entry to logs.json"""
+    log_requests([entry])
+
+
+def log_requests(entries):
+    """Append several log entries to logs.json with a single rewrite."""
+    if not entries:
+        return
     logs = []
     if os.path.exists(LOGS_PATH):
         try:
@@ -63,7 +152,7 @@ def log_request(entry):
         except (json.JSONDecodeError, FileNotFoundError):
             logs = []
 
-    logs.append(entry)
+    logs.extend(entries)
 
     with open(LOGS_PATH, "w") as f:
         json.dump(logs, f, indent=2)
@@ -76,66 +165,494 @@ def health():
     index_exists = os.path.exists(FAISS_INDEX_PATH)
     return {
         "status": "ok",
-        "faiss_index_ready": index_exists
+        "faiss_index_ready": index_exists,
+        "collections_loaded": loaded_collections()
+    }
+
+
+# --- Metrics ---
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "rate_limits": get_rate_limit_metrics(),
+        "streaming": get_stream_metrics(),
+        "faq": get_faq_metrics(),
+        "singleflight": flights.get_metrics(),
+        "scheduler": scheduler.get_metrics(),
+        "post_response": post_response.get_metrics(),
+        "history": get_history_metrics(),
+        "rerank": get_rerank_metrics()
+    }
+
+
+# --- Admin (opt-in diagnostics, see profiling.py) ---
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints don't exist unless ADMIN_ENABLED, and need the X-Admin-Token header."""
+    if not ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_memory(object_types: bool = False):
+    """
+    RSS plus object counts and approximate sizes of the in-memory stores:
+    conversations, per-conversation state, loaded collections and caches.
+    `object_types=true` also counts live objects by type (walks the whole heap).
+    """
+    report = {
+        "rss_mb": profiling.rss_mb(),
+        "conversations": {
+            "count": len(conversation_store),
+            "messages": sum(len(history) for history in list(conversation_store.values())),
+            **profiling.deep_sizeof(conversation_store)
+        },
+        "conversation_state": {"count": len(conversation_state), **profiling.deep_sizeof(conversation_state)},
+        "collections": collection_stats(),
+        "router_cache": router_cache_info(),
+        "in_flight": {
+            "singleflight": flights.get_metrics()["in_flight"],
+            "post_response_queued": post_response.get_metrics()["queued"]
+        },
+        "gc": {"counts": gc.get_count(), "garbage": len(gc.garbage)},
+        "tracemalloc": profiling.tracing_status()
+    }
+    if object_types:
+        report["object_types"] = profiling.object_types()
+    return report
+
+
+@app.post("/admin/tracemalloc/start", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_tracemalloc_start(frames: int = 25):
+    """Start allocation tracing and take the baseline snapshot."""
+    return profiling.start_tracing(max(1, min(frames, 100)))
+
+
+@app.post("/admin/tracemalloc/snapshot", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_tracemalloc_snapshot(group_by: str = "lineno", limit: int = 25):
+    """Allocation growth since the previous snapshot, biggest first (group_by: lineno, filename, traceback)."""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback.")
+    diff = profiling.snapshot_diff(group_by, max(1, min(limit, 500)))
+    if diff is None:
+        raise HTTPException(status_code=409, detail="Not tracing; POST /admin/tracemalloc/start first.")
+    return diff
+
+
+@app.post("/admin/tracemalloc/stop", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_tracemalloc_stop():
+    return profiling.stop_tracing()
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_profile(seconds: float = 5.0, interval_ms: float = 5.0, format: str = "collapsed"):
+    """
+    Sampling CPU profile of every thread for `seconds` (max PROFILE_MAX_SECONDS).
+    format=collapsed returns flamegraph.pl / speedscope input; format=json the top stacks.
+    """
+    result = profiling.sample_stacks(max(0.1, min(seconds, PROFILE_MAX_SECONDS)), max(1.0, interval_ms))
+    if result is None:
+        raise HTTPException(status_code=409, detail="A profile is already running.")
+    stacks, rounds = result
+    if format == "collapsed":
+        return PlainTextResponse(profiling.collapsed(stacks))
+    return {
+        "rounds": rounds,
+        "samples": sum(stacks.values()),
+        "top": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(50)]
+    }
+
+
+# --- Rate Limiting ---
+
+def rate_limited(e):
+    """Turn a shed request into a 429 with a Retry-After hint."""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))}
+    )
+
+
+# --- Retrieval ---
+
+# With reranking on, retrieval fetches a wider candidate set for the cross-encoder
+RETRIEVE_K = RERANK_CANDIDATES if RERANK_ENABLED else TOP_K
+
+
+def retrieve_for(req, question, embedding=None):
+    """Retrieve chunks for a request, honouring its collection and filter."""
+    search_filter = req.filter or QueryFilter()
+    try:
+        return retrieve(
+            question,
+            top_k=RETRIEVE_K,
+            query_embedding=embedding,
+            collection=req.collection,
+            documents=search_filter.documents,
+            tags=search_filter.tags
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        return []
+
+
+def reuse_key(req):
+    """Chunks can only be reused for the same collection and filter."""
+    search_filter = req.filter or QueryFilter()
+    return req.collection, tuple(search_filter.documents or ()), tuple(search_filter.tags or ())
+
+
+def faq_applies(req):
+    """FAQ answers cover the whole knowledge base, so requests scoped to a collection or filter skip them."""
+    return reuse_key(req) == (None, (), ())
+
+
+def retrieve_with_reuse(req, conv_id, question, embedding):
+    """
+    Retrieve for a conversation turn, reusing the chunks of an earlier turn
+    on the same topic instead of searching again (see context_reuse.py).
+
+    Returns (chunks, reuse) where `reuse` describes the decision for the metadata.
+    """
+    state = get_state(conv_id)
+    decision, similarity = decide(state, embedding, reuse_key(req))
+    reuse = {"decision": decision, "similarity": similarity, "search_skipped": decision == "reuse", "tokens_saved": 0}
+
+    if decision == "reuse":
+        chunks, reuse["tokens_saved"] = trim_reused(rescore(previous_chunks(state), embedding, req.collection))
+        return chunks, reuse
+
+    chunks = retrieve_for(req, question, embedding)
+    if decision == "extend":
+        chunks = merge(rescore(previous_chunks(state), embedding, req.collection), chunks, RETRIEVE_K)
+    return chunks, reuse
+
+
+def faq_result(entry):
+    """An FAQ entry shaped like call_llm's result."""
+    return {"answer": entry["answer"], "tokens_input": 0, "tokens_output": 0, "model_used": "faq"}
+
+
+def format_sources(chunks):
+    """Source citations for the response."""
+    return [
+        {
+            "document": chunk.document,
+            "page": chunk.page,
+            "relevance_score": chunk.relevance_score
+        }
+        for chunk in chunks
+    ]
+
+
+def save_turn(conv_id, question, answer):
+    """Append a question/answer exchange; in "summary" mode, compact older turns after the response."""
+    add_message(conv_id, "user", question)
+    add_message(conv_id, "assistant", answer)
+    if HISTORY_MODE == "summary":
+        compact_history(conv_id)
+
+
+# --- Request Pipeline ---
+
+def prepare_context(req, question, conv_id, retrieval_optional=False):
+    """
+    Route the query, fetch the conversation history and retrieve context as a DAG.
+
+    Follow-up questions are condensed with the history into a standalone
+    retrieval query first (cached per turn, see query_rewriter.py).
+
+    With SPECULATIVE_RETRIEVAL on, embedding + search start at the same time
+    as routing instead of waiting for the route; if the route turns out not
+    to need context, the retrieval is abandoned and the request carries on
+    without waiting for it. With it off, retrieval waits for the route and is
+    skipped when not needed.
+
+    If `retrieval_optional`, a failed retrieval means answering without context
+    instead of raising.
+
+    Follow-ups close to the previous turn's query reuse its chunks without a
+    search; the new search is only remembered once the route needs context.
+
+    Queries matching an FAQ question closely enough get the stored answer
+    (context["faq"]) and skip retrieval altogether, unless the request is
+    scoped to a collection or filter.
+
+    Returns a dict with route, query, embedding, chunks, reuse, faq, history, stages and trace.
+    """
+    if SPECULATIVE_RETRIEVAL:
+        embed_task = (lambda query: embed_query(query), ["rewrite"])
+    else:
+        embed_task = (
+            lambda route, query: embed_query(query) if route.get("requires_context", True) else None,
+            ["route", "rewrite"]
+        )
+
+    tasks = {
+        "route": (lambda: classify_query(question), []),
+        "history": (lambda: get_history(conv_id), []),
+        "rewrite": (lambda history: retrieval_query(conv_id, question, history), ["history"]),
+        "embed": embed_task,
+        "retrieve": (
+            lambda query, embedding: (
+                retrieve_with_reuse(req, conv_id, query, embedding) if embedding is not None else ([], None)
+            ),
+            ["rewrite", "embed"]
+        ),
+        "faq": (
+            lambda embedding: faq_match(embedding, record=False) if embedding is not None and faq_applies(req) else None,
+            ["embed"]
+        )
+    }
+    if RERANK_ENABLED:
+        # Cross-encoder pass over the candidates; only the best RERANK_TOP_N reach the prompt
+        tasks["rerank"] = (
+            lambda query, retrieved: (*retrieved, rerank(query, retrieved[0], req.collection)),
+            ["rewrite", "retrieve"]
+        )
+
+    results, errors, trace = run_dag(tasks, until=lambda done: "route" in done and "history" in done and (
+        not done["route"].get("requires_context", True) or bool(done.get("faq"))
+    ))
+    stages = {name: round(task["end_ms"] - task["start_ms"], 2) for name, task in trace["tasks"].items()}
+
+    for name in ("route", "history"):
+        if name in errors:
+            raise errors[name]
+
+    context = {
+        "route": results["route"],
+        "query": results.get("rewrite", question),
+        "embedding": None,
+        "chunks": [],
+        "reuse": None,
+        "rerank": None,
+        "faq": None,
+        "history": results["history"],
+        "stages": stages,
+        "trace": trace
     }
 
+    requires_context = context["route"].get("requires_context", True)
+    trace["speculative_discarded"] = SPECULATIVE_RETRIEVAL and not requires_context
+    if not requires_context:
+        return context
+
+    # The speculative FAQ lookup only counts in the metrics once it is consulted here
+    if "faq" in results and results.get("embed") is not None and faq_applies(req):
+        count_faq_lookups([results["faq"]])
+
+    # FAQ fast path: the stored answer is used and retrieval is abandoned
+    if results.get("faq"):
+        context["faq"] = results["faq"]
+        context["embedding"] = results["embed"]
+        context["chunks"] = [faq_chunk(results["faq"])]
+        return context
+
+    stage = "rerank" if RERANK_ENABLED else "retrieve"
+    if stage in errors:
+        if retrieval_optional and not isinstance(errors[stage], HTTPException):
+            return context
+        raise errors[stage]
+
+    context["embedding"] = results["embed"]
+    if RERANK_ENABLED:
+        _, context["reuse"], (context["chunks"], context["rerank"]) = results["rerank"]
+    else:
+        context["chunks"], context["reuse"] = results["retrieve"]
+
+    # Remember what was searched for, so the next turn can reuse it
+    if context["reuse"] and context["reuse"]["decision"] != "reuse":
+        remember(get_state(conv_id), reuse_key(req), context["embedding"], context["chunks"])
+    return context
+
 
 # --- Main Endpoint ---
 
+def pick_model(route, embedding):
+    """The route's model or, in adaptive mode, the learned classifier's cheapest adequate pick."""
+    if embedding is not None and ROUTER_MODE == "adaptive":
+        return choose_model(embedding, route)["model_used"]
+    return route["model_used"]
+
+
+def answer(req, question, conv_id):
+    """
+    The shareable part of a /query request: context, model choice and LLM
+    call. Coalesced requests get the same result, so it is read-only.
+    """
+    # Route, history and (speculative) retrieval run concurrently;
+    # follow-ups are retrieved with a query condensed from the history
+    context = prepare_context(req, question, conv_id)
+    t = time.perf_counter()
+    route, embedding, chunks = context["route"], context["embedding"], context["chunks"]
+    stages = context["stages"]
+    model_used = pick_model(route, embedding)
+
+    if context["faq"]:
+        # FAQ fast path: stored answer, no LLM call
+        llm_result = faq_result(context["faq"])
+    else:
+        # Call LLM (the rate limiter may fall back to the simple model)
+        try:
+            llm_result = call_llm(question, chunks, model_used, prompt_history(conv_id, context["history"]))
+        except RateLimitExceeded as e:
+            raise rate_limited(e)
+        lap(stages, "llm", t)
+
+    return {
+        "context": context,
+        "llm_result": llm_result,
+        "model_used": llm_result.get("model_used", model_used)
+    }
+
+
+def finish_query(flags_entry, answer_text, chunks, log_entry, embedding=None, rule_model=None, flags=None):
+    """
+    Post-response stage of a query: evaluator checks (unless `flags` are
+    given), the per-conversation flags lookup, the request log and, with an
+    `embedding`, the adaptive router's feedback. Returns the flags.
+    """
+    log_entry = settle_query(flags_entry, answer_text, chunks, log_entry, embedding, rule_model, flags)
+    log_request(log_entry)
+    return log_entry["evaluator_flags"]
+
+
+def settle_query(flags_entry, answer_text, chunks, log_entry, embedding=None, rule_model=None, flags=None):
+    """finish_query without the log write: returns the log entry with its flags."""
+    if flags is None:
+        flags = evaluate(answer_text, chunks, len(chunks))
+    if flags_entry is not None:
+        set_flags(flags_entry, flags)
+    if embedding is not None:
+        record_outcome(embedding, rule_model, log_entry["model_used"], flags,
+                       log_entry["latency_ms"], log_entry["tokens_input"], log_entry["tokens_output"])
+    return {**log_entry, "evaluator_flags": flags}
+
+
+def finish_batch(finishes):
+    """finish_query for every item of a batch, writing the request log once."""
+    log_requests([settle_query(*args) for args in finishes])
+
+
+def flight_key(req, question, conv_id):
+    """
+    Coalescing key for a request, or None if it must run on its own.
+    Only history-free requests are coalesced: a conversation changes the answer.
+    """
+    if not SINGLEFLIGHT_ENABLED or get_history(conv_id):
+        return None
+    return " ".join(question.lower().split()), classify_query(question)["model_used"], reuse_key(req)
+
+
+async def admit(question):
+    """
+    Wait for a pipeline slot in the question's class (see scheduler.py).
+    Returns (class, admitted_at); a shed request gets a 503.
+    """
+    cls = classify_query(question)["classification"]
+    try:
+        await scheduler.acquire(cls)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))}
+        )
+    return cls, time.monotonic()
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse holding a scheduler slot (and the TokenStream it
+    relays) until it is over. Both are released however the response ends,
+    including a client that is gone before the stream's generator ever
+    starts (its own cleanup never runs then).
+    """
+    slot = None     # (class name, admitted_at) once query_stream hands the slot over
+    tokens = None   # TokenStream to close, settling its rate-limit reservation
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.tokens is not None:
+                self.tokens.close()
+            if self.slot is not None:
+                cls, admitted_at = self.slot
+                scheduler.release(cls, time.monotonic() - admitted_at)
+
+
+def sse_response(events, tokens=None):
+    """Server-Sent Events response for an async event generator (relaying `tokens`, if given)."""
+    response = SlotStreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.tokens = tokens
+    return response
+
+
 @app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest):
+async def query(req: QueryRequest):
     start_time = time.time()
 
     # Validate input
     if not req.question or not req.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
+    # Simple and complex queries queue separately, so a greeting doesn't wait behind RAG generations
+    cls, admitted_at = await admit(req.question.strip())
+    try:
+        return ORJSONResponse(await run_in_threadpool(run_query, req, start_time))
+    finally:
+        scheduler.release(cls, time.monotonic() - admitted_at)
+
+
+def run_query(req, start_time):
+    """The /query pipeline, run on the threadpool once the request is admitted."""
     question = req.question.strip()
 
     try:
         # Get or create conversation
         conv_id, _ = get_or_create_conversation(req.conversation_id)
 
-        # Classify the query (simple or complex)
-        route = classify_query(question)
-        classification = route["classification"]
-        model_used = route["model_used"]
-        requires_context = route.get("requires_context", True)
-
-        # Retrieve relevant chunks ONLY if required
-        chunks = []
-        if requires_context:
+        # Identical questions already in flight share one pipeline run
+        key = flight_key(req, question, conv_id)
+        if key is None:
+            result, coalesced = answer(req, question, conv_id), False
+        else:
             try:
-                chunks = retrieve(question)
-            except FileNotFoundError:
-                chunks = []
-        
-        chunks_retrieved = len(chunks)
-
-        # Get conversation history for context
-        history = get_history(conv_id)
+                result, coalesced = flights.do(key, lambda: answer(req, question, conv_id))
+            except SingleFlightTimeout as e:
+                raise HTTPException(status_code=504, detail=str(e))
 
-        # Call LLM
-        llm_result = call_llm(question, chunks, model_used, history)
-        answer = llm_result["answer"]
+        context, llm_result = result["context"], result["llm_result"]
+        t = time.perf_counter()
+        route, embedding, chunks = context["route"], context["embedding"], context["chunks"]
+        stages, trace = dict(context["stages"]), context["trace"]
+        classification = route["classification"]
+        model_used = result["model_used"]
+        answer_text = llm_result["answer"]
         tokens_input = llm_result["tokens_input"]
         tokens_output = llm_result["tokens_output"]
-
-        # Evaluate the response
-        flags = evaluate(answer, chunks, chunks_retrieved)
+        chunks_retrieved = len(chunks)
 
         # Format sources from retrieved chunks
-        sources = []
-        for chunk in chunks:
-            sources.append({
-                "document": chunk["document"],
-                "page": chunk["page"],
-                "relevance_score": chunk["relevance_score"]
-            })
+        sources = format_sources(chunks)
 
         # Save conversation history
-        add_message(conv_id, "user", question)
-        add_message(conv_id, "assistant", answer)
+        save_turn(conv_id, question, answer_text)
+        if coalesced and context["reuse"] and context["reuse"]["decision"] != "reuse":
+            remember(get_state(conv_id), reuse_key(req), embedding, chunks)
+        flags_entry = add_flags(conv_id, question)
+        t = lap(stages, "memory", t)
 
         # Calculate latency
         latency_ms = int((time.time() - start_time) * 1000)
@@ -143,87 +660,446 @@ def query(req: QueryRequest):
         # Log the request
         log_entry = {
             "query": question,
+            "retrieval_query": context["query"],
             "classification": classification,
             "model_used": model_used,
             "tokens_input": tokens_input,
             "tokens_output": tokens_output,
-            "latency_ms": latency_ms
+            "latency_ms": latency_ms,
+            "stages_ms": dict(stages),
+            "pipeline_saved_ms": trace["saved_ms"],
+            "context_reuse": context["reuse"]["decision"] if context["reuse"] else None,
+            "coalesced": coalesced
         }
-        log_request(log_entry)
+
+        # Evaluate, log and feed the outcome back to the adaptive router (once per
+        # pipeline run) — after the response is sent, unless EVALUATION_MODE is inline
+        feedback_embedding = embedding if not context["faq"] and not coalesced else None
+        finish_args = (flags_entry, answer_text, chunks, log_entry, feedback_embedding, route["model_used"])
+        if EVALUATION_MODE == "inline":
+            flags = finish_query(*finish_args)
+            t = lap(stages, "post_response", t)
+        else:
+            flags = []
+            post_response.submit(finish_query, *finish_args)
 
         # Build response matching the exact API contract
-        return QueryResponse(
-            answer=answer,
-            metadata=MetadataInfo(
-                model_used=model_used,
-                classification=classification,
-                tokens=TokenInfo(input=tokens_input, output=tokens_output),
-                latency_ms=latency_ms,
-                chunks_retrieved=chunks_retrieved,
-                evaluator_flags=flags
-            ),
-            sources=sources,
-            conversation_id=conv_id
+        return query_response(
+            answer_text,
+            conv_id,
+            sources,
+            model_used=model_used,
+            classification=classification,
+            tokens={"input": tokens_input, "output": tokens_output},
+            latency_ms=latency_ms,
+            chunks_retrieved=chunks_retrieved,
+            evaluator_flags=flags,
+            stages_ms=stages,
+            trace=trace,
+            retrieval_query=context["query"],
+            context_reuse=context["reuse"],
+            rerank=context["rerank"],
+            coalesced=coalesced,
+            flags_pending=EVALUATION_MODE != "inline"
         )
 
     except HTTPException:
         raise
     except Exception as e:
         # Catch-all: return a safe response instead of crashing
-        latency_ms = int((time.time() - start_time) * 1000)
-        conv_id = req.conversation_id or "error"
-        return QueryResponse(
-            answer=f"Sorry, something went wrong: {str(e)}",
-            metadata=MetadataInfo(
-                model_used="none",
-                classification="simple",
-                tokens=TokenInfo(input=0, output=0),
-                latency_ms=latency_ms,
-                chunks_retrieved=0,
-                evaluator_flags=[]
-            ),
-            sources=[],
-            conversation_id=conv_id
-        )
+        return error_response(req.conversation_id or "error", f"Sorry, something went wrong: {str(e)}", start_time)
+
+
+def error_response(conv_id, message, start_time):
+    """A response body carrying an error message instead of an answer."""
+    return query_response(
+        message,
+        conv_id,
+        [],
+        model_used="none",
+        classification="simple",
+        tokens={"input": 0, "output": 0},
+        latency_ms=int((time.time() - start_time) * 1000),
+        chunks_retrieved=0,
+        evaluator_flags=[]
+    )
+
+
+# --- Conversations ---
+
+@app.get("/conversations/{conversation_id}/flags")
+def conversation_flags(conversation_id: str):
+    """Evaluator flags per turn; `pending` until the background evaluation has run."""
+    turns = get_flags(conversation_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Unknown conversation.")
+    return {"conversation_id": conversation_id, "turns": turns}
 
 
 # --- Streaming Endpoint ---
 
+async def faq_stream(context, question, conv_id, started):
+    """
+    The SSE event sequence for an FAQ hit: the stored answer as a single
+    token frame. Logged like any other answer, through the post-response worker.
+    """
+    faq, chunks = context["faq"], context["chunks"]
+    sent = False
+    flags = None
+    try:
+        yield format_event("sources", {"sources": format_sources(chunks)})
+        yield format_event("token", {"text": faq["answer"]})
+        sent = True
+        yield format_event("metadata", {
+            "model_used": "faq",
+            "classification": context["route"]["classification"],
+            "tokens": {"input": 0, "output": 0},
+            "latency_ms": int((time.perf_counter() - started) * 1000),
+            "chunks_retrieved": len(chunks),
+            "retrieval_query": context["query"],
+            "context_reuse": None,
+            "stages_ms": context["stages"]
+        })
+        flags = evaluate(faq["answer"], chunks, len(chunks))
+        yield format_event("done", {"conversation_id": conv_id, "evaluator_flags": flags})
+    finally:
+        # Runs on disconnect too, once the answer has been sent
+        if sent:
+            save_turn(conv_id, question, faq["answer"])
+            post_response.submit(finish_query, add_flags(conv_id, question), faq["answer"], chunks, {
+                "query": question,
+                "retrieval_query": context["query"],
+                "classification": context["route"]["classification"],
+                "model_used": "faq",
+                "tokens_input": 0,
+                "tokens_output": 0,
+                "latency_ms": int((time.perf_counter() - started) * 1000),
+                "stream": "completed" if flags is not None else "cancelled"
+            }, None, None, flags)
+
+
 @app.post("/query_stream")
-def query_stream(req: QueryRequest):
+async def query_stream(req: QueryRequest):
     """
-    Streaming version of the query endpoint.
-    Yields tokens as they are generated.
+    Streaming version of the query endpoint, as Server-Sent Events.
+
+    Events: sources → token (coalesced frames) → metadata → done,
+    or sources → token* → error → done if generation fails.
+    If the client disconnects, generation is cancelled upstream and the
+    partial answer is still saved to the conversation.
     """
     if not req.question or not req.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
+    started = time.perf_counter()
     question = req.question.strip()
-    conv_id, _ = get_or_create_conversation(req.conversation_id)
-    route = classify_query(question)
-    model_used = route["model_used"]
-    requires_context = route.get("requires_context", True)
-    
-    chunks = []
-    if requires_context:
+    cls, admitted_at = await admit(question)
+    try:
+        response = await start_stream(req, question, started)
+    except BaseException:
+        scheduler.release(cls, time.monotonic() - admitted_at)
+        raise
+    # The slot is held until the response is over
+    response.slot = (cls, admitted_at)
+    return response
+
+
+async def start_stream(req, question, started):
+    """Prepare the context and start generation; returns the SSE response."""
+    conv_id, _ = await run_in_threadpool(get_or_create_conversation, req.conversation_id)
+    context = await run_in_threadpool(prepare_context, req, question, conv_id, True)
+    route, chunks = context["route"], context["chunks"]
+
+    if context["faq"]:
+        return sse_response(faq_stream(context, question, conv_id, started))
+
+    # Admission happens before the response starts so a shed request gets a real 429
+    try:
+        tokens = await run_in_threadpool(call_llm_stream, question, chunks, pick_model(route, context["embedding"]),
+                                           prompt_history(conv_id, context["history"]))
+    except RateLimitExceeded as e:
+        raise rate_limited(e)
+
+    async def event_stream():
+        stats = StreamStats(started)
+        answer = []
+        outcome = "cancelled"
+        flags = None
         try:
-            chunks = retrieve(question)
-        except:
-            chunks = []
-    
-    history = get_history(conv_id)
-
-    def stream_generator():
-        full_answer = ""
-        for token in call_llm_stream(question, chunks, model_used, history):
-            full_answer += token
-            yield token
-        
-        # After streaming completes, we add to memory
-        add_message(conv_id, "user", question)
-        add_message(conv_id, "assistant", full_answer)
-
-    return StreamingResponse(stream_generator(), media_type="text/plain")
+            yield format_event("sources", {"sources": format_sources(chunks)})
+            try:
+                async for frame in token_frames(tokens, stats):
+                    answer.append(frame)
+                    yield format_event("token", {"text": frame})
+            except Exception as e:
+                outcome = "errors"
+                yield format_event("error", {"detail": f"Error during streaming: {e}"})
+            else:
+                outcome = "completed"
+                yield format_event("metadata", {
+                    "model_used": tokens.model,
+                    "classification": route["classification"],
+                    "tokens": {"input": tokens.tokens_input, "output": tokens.tokens_output},
+                    "latency_ms": int((time.perf_counter() - started) * 1000),
+                    "chunks_retrieved": len(chunks),
+                    "retrieval_query": context["query"],
+                    "context_reuse": context["reuse"],
+                    "rerank": context["rerank"],
+                    "stages_ms": context["stages"],
+                    "stream": stats.summary()
+                })
+                # The answer is already on screen, so the checks don't delay it
+                flags = evaluate("".join(answer), chunks, len(chunks))
+            yield format_event("done", {"conversation_id": conv_id, "evaluator_flags": flags})
+        finally:
+            # Runs on disconnect too: stop generating and keep what was already said
+            tokens.close()
+            stats.record(outcome)
+            full_answer = "".join(answer)
+            if full_answer:
+                save_turn(conv_id, question, full_answer)
+                post_response.submit(finish_query, add_flags(conv_id, question), full_answer, chunks, {
+                    "query": question,
+                    "retrieval_query": context["query"],
+                    "classification": route["classification"],
+                    "model_used": tokens.model,
+                    "tokens_input": tokens.tokens_input,
+                    "tokens_output": tokens.tokens_output,
+                    "latency_ms": int((time.perf_counter() - started) * 1000),
+                    "stream": outcome
+                }, context["embedding"] if outcome == "completed" else None, route["model_used"], flags)
+
+    return sse_response(event_stream(), tokens)
+
+
+# --- Batch Endpoint ---
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+    concurrency: Optional[int] = None
+
+
+def parse_batch(body, content_type):
+    """
+    Batch items from a JSON body ({"queries": [...]} or a bare list) or
+    JSONL / NDJSON (one query per line). Items may be plain question strings.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        raw = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+        batch = {"queries": raw}
+    else:
+        batch = json.loads(body or b"[]")
+        if isinstance(batch, list):
+            batch = {"queries": batch}
+    batch["queries"] = [{"question": q} if isinstance(q, str) else q for q in batch.get("queries", [])]
+    return BatchQueryRequest(**batch)
+
+
+def prepare_batch(items):
+    """
+    Route every item, then embed all questions that need context in one
+    batched encode and search them with one FAISS call per collection + filter.
+    Unscoped items matching an FAQ question get the stored answer and are not searched.
+
+    Returns (routes, embeddings, chunks, faqs, errors), each indexed like `items`.
+    """
+    routes = [classify_query(item.question.strip()) for item in items]
+    embeddings = [None] * len(items)
+    chunks = [[] for _ in items]
+    faqs = [None] * len(items)
+    errors = [None] * len(items)
+
+    need = [i for i, route in enumerate(routes) if route.get("requires_context", True)]
+    if not need:
+        return routes, embeddings, chunks, faqs, errors
+
+    matrix = embed_queries([items[i].question.strip() for i in need])
+    faq_rows = [row for row, i in enumerate(need) if faq_applies(items[i])]
+    matched = dict(zip(faq_rows, faq_match_batch(matrix[faq_rows]))) if faq_rows else {}
+    groups = {}
+    for row, i in enumerate(need):
+        embeddings[i] = matrix[row:row + 1]
+        faq = matched.get(row)
+        if faq:
+            faqs[i] = faq
+            chunks[i] = [faq_chunk(faq)]
+        else:
+            groups.setdefault(reuse_key(items[i]), []).append((row, i))
+
+    for members in groups.values():
+        req = items[members[0][1]]
+        search_filter = req.filter or QueryFilter()
+        try:
+            questions = [items[i].question.strip() for _, i in members]
+            found = retrieve_batch(
+                questions,
+                top_k=RETRIEVE_K,
+                query_embeddings=matrix[[row for row, _ in members]],
+                collection=req.collection,
+                documents=search_filter.documents,
+                tags=search_filter.tags
+            )
+        except ValueError as e:
+            for _, i in members:
+                errors[i] = str(e)
+            continue
+        except FileNotFoundError:
+            continue
+        if RERANK_ENABLED:
+            found = [kept for kept, _ in rerank_batch(questions, found, req.collection)]
+        for (_, i), item_chunks in zip(members, found):
+            chunks[i] = item_chunks
+
+    return routes, embeddings, chunks, faqs, errors
+
+
+def answer_batch_item(item, route, embedding, chunks, faq=None):
+    """
+    Answer one prepared batch item. Batch jobs queue on the rate limiter
+    (BATCH_RATE_LIMIT_MODE) rather than being shed; FAQ hits skip the LLM.
+    Evaluation runs here only if EVALUATION_MODE is inline.
+
+    Returns (response dict, finish_query arguments or None).
+    """
+    start_time = time.time()
+    question = item.question.strip()
+    conv_id = item.conversation_id or str(uuid.uuid4())
+    history = get_history(item.conversation_id) if item.conversation_id else []
+
+    rule_model = route["model_used"]
+    model_used = pick_model(route, embedding)
+
+    try:
+        llm_result = faq_result(faq) if faq else call_llm(
+            question, chunks, model_used, prompt_history(conv_id, history),
+            rate_limit_mode=BATCH_RATE_LIMIT_MODE, max_wait=BATCH_RATE_LIMIT_MAX_WAIT
+        )
+    except RateLimitExceeded as e:
+        return error_response(conv_id, f"Sorry, rate limited: {e}", start_time), None
+
+    answer = llm_result["answer"]
+    model_used = llm_result.get("model_used", model_used)
+    flags = evaluate(answer, chunks, len(chunks)) if EVALUATION_MODE == "inline" else None
+    flags_entry = None
+    if item.conversation_id:
+        save_turn(conv_id, question, answer)
+        flags_entry = add_flags(conv_id, question)
+    latency_ms = int((time.time() - start_time) * 1000)
+
+    response = query_response(
+        answer,
+        conv_id,
+        format_sources(chunks),
+        model_used=model_used,
+        classification=route["classification"],
+        tokens={"input": llm_result["tokens_input"], "output": llm_result["tokens_output"]},
+        latency_ms=latency_ms,
+        chunks_retrieved=len(chunks),
+        evaluator_flags=flags or [],
+        flags_pending=flags is None
+    )
+    log_entry = {
+        "query": question,
+        "classification": route["classification"],
+        "model_used": model_used,
+        "tokens_input": llm_result["tokens_input"],
+        "tokens_output": llm_result["tokens_output"],
+        "latency_ms": latency_ms,
+        "batch": True
+    }
+    feedback_embedding = embedding if not faq else None
+    return response, (flags_entry, answer, chunks, log_entry, feedback_embedding, rule_model, flags)
+
+
+def answer_in_order(jobs):
+    """Answer one conversation's batch items one after another, completing their futures."""
+    for future, args in jobs:
+        if not future.set_running_or_notify_cancel():
+            continue  # cancelled: the client is gone
+        try:
+            future.set_result(answer_batch_item(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+
+@app.post("/query_batch")
+async def query_batch(request: Request):
+    """
+    Answer many queries in one request, for offline / bulk jobs.
+
+    Accepts {"queries": [...], "concurrency": N}, a JSON list, or a JSONL
+    body (Content-Type: application/x-ndjson, concurrency as ?concurrency=N). Retrieval is batched (one
+    encode, one FAISS search); LLM calls run with bounded concurrency, except
+    that items sharing a conversation_id are answered in input order.
+    Results stream back as NDJSON in input order, one QueryResponse per
+    line plus its "index".
+    """
+    try:
+        batch = parse_batch(await request.body(), request.headers.get("content-type", ""))
+        if batch.concurrency is None and "concurrency" in request.query_params:
+            batch.concurrency = int(request.query_params["concurrency"])
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+    if len(batch.queries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch too large: max {BATCH_MAX_ITEMS} queries.")
+
+    items = batch.queries
+    valid = [i for i, item in enumerate(items) if item.question and item.question.strip()]
+    routes, embeddings, chunks, faqs, errors = await run_in_threadpool(prepare_batch, [items[i] for i in valid])
+
+    concurrency = max(1, min(batch.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    futures = {}
+    conversations = {}   # conversation_id → [(future, args)], in input order
+    for n, i in enumerate(valid):
+        if errors[n] is not None:
+            futures[i] = errors[n]
+        elif items[i].conversation_id:
+            futures[i] = Future()
+            conversations.setdefault(items[i].conversation_id, []).append(
+                (futures[i], (items[i], routes[n], embeddings[n], chunks[n], faqs[n]))
+            )
+    for n, i in enumerate(valid):
+        if i in futures:
+            # Items of one conversation run as one chain (queued at its first item),
+            # so each sees the turns before it
+            chain = conversations.pop(items[i].conversation_id, None) if items[i].conversation_id else None
+            if chain:
+                executor.submit(answer_in_order, chain)
+        else:
+            futures[i] = executor.submit(answer_batch_item, items[i], routes[n], embeddings[n], chunks[n], faqs[n])
+
+    async def ndjson():
+        finishes = []
+        started = time.time()
+        try:
+            for i, item in enumerate(items):
+                future = futures.get(i)
+                if future is None:
+                    response = error_response(item.conversation_id or "error", "Question cannot be empty.", started)
+                elif isinstance(future, str):
+                    response = error_response(item.conversation_id or "error", future, started)
+                else:
+                    try:
+                        response, finish = await asyncio.wrap_future(future)
+                    except Exception as e:
+                        response, finish = error_response(
+                            item.conversation_id or "error", f"Sorry, something went wrong: {str(e)}", started
+                        ), None
+                    if finish:
+                        finishes.append(finish)
+                yield orjson.dumps({"index": i, **response}) + b"\n"
+        finally:
+            # Client gone or done: drop queued items; evaluation (unless inline),
+            # router feedback and one log write go to the post-response worker
+            for future in futures.values():
+                if not isinstance(future, str):
+                    future.cancel()
+            executor.shutdown(wait=False)
+            if finishes:
+                post_response.submit(finish_batch, finishes)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
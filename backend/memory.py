@@ -1,10 +1,17 @@
 
+import threading
 import uuid
-from config import MAX_MEMORY_TURNS
+from config import MAX_MEMORY_TURNS, HISTORY_MODE, HISTORY_RECENT_TURNS
 
 # In-memory conversation store
 conversation_store = {}
 
+# Per-conversation derived state (e.g. the condensed retrieval query for the current turn)
+conversation_state = {}
+
+# Guards the rolling summary and the messages waiting to be folded into it
+_summary_lock = threading.Lock()
+
 
 def get_or_create_conversation(conversation_id=None):
     """
@@ -35,13 +42,86 @@ def add_message(conversation_id, role, content):
         "role": role,
         "content": content
     })
+    state = get_state(conversation_id)
+    state["messages"] = state.get("messages", 0) + 1
 
-    # Trim to last N turns (each turn = 1 user + 1 assistant message)
-    max_messages = MAX_MEMORY_TURNS * 2
-    if len(conversation_store[conversation_id]) > max_messages:
-        conversation_store[conversation_id] = conversation_store[conversation_id][-max_messages:]
+    # Trim to last N turns (each turn = 1 user + 1 assistant message).
+    # In "summary" mode the trimmed messages wait to be folded into the summary.
+    history = conversation_store[conversation_id]
+    max_messages = (HISTORY_RECENT_TURNS if HISTORY_MODE == "summary" else MAX_MEMORY_TURNS) * 2
+    if len(history) > max_messages:
+        if HISTORY_MODE == "summary":
+            with _summary_lock:
+                pending = get_state(conversation_id).setdefault("unsummarized", [])
+                pending.extend(history[:-max_messages])
+                del pending[:-MAX_MEMORY_TURNS * 2]   # if summaries keep failing, the oldest are dropped
+        conversation_store[conversation_id] = history[-max_messages:]
 
 
 def get_history(conversation_id):
     """Get conversation history for a given ID."""
     return conversation_store.get(conversation_id, [])
+
+
+def get_state(conversation_id):
+    """Mutable scratch state attached to a conversation."""
+    return conversation_state.setdefault(conversation_id, {})
+
+
+def message_count(conversation_id):
+    """Messages ever added to the conversation. Unlike len(history), it keeps growing after trimming."""
+    return conversation_state.get(conversation_id, {}).get("messages", 0)
+
+
+def unsummarized(conversation_id):
+    """(messages trimmed since the last summary, current summary or None)."""
+    with _summary_lock:
+        state = get_state(conversation_id)
+        return list(state.get("unsummarized", ())), state.get("summary")
+
+
+def set_summary(conversation_id, summary, folded):
+    """Store a new summary and drop the messages it `folded` in from the pending list."""
+    folded_ids = {id(msg) for msg in folded}
+    with _summary_lock:
+        state = get_state(conversation_id)
+        state["summary"] = summary
+        state["unsummarized"] = [msg for msg in state.get("unsummarized", ()) if id(msg) not in folded_ids]
+
+
+def prompt_history(conversation_id, history):
+    """
+    The history to send to the LLM: the rolling summary (as a system
+    message) and any messages not summarized yet, followed by `history`.
+    """
+    with _summary_lock:
+        state = conversation_state.get(conversation_id, {})
+        summary = state.get("summary")
+        pending = list(state.get("unsummarized", ()))
+    if summary:
+        pending.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return pending + history if pending else history
+
+
+def add_flags(conversation_id, question, flags=None):
+    """
+    Record a turn's evaluator flags (None while they are still being computed).
+    Returns the entry, which set_flags fills in later. Only the last MAX_MEMORY_TURNS are kept.
+    """
+    turns = get_state(conversation_id).setdefault("flags", [])
+    entry = {"turn": turns[-1]["turn"] + 1 if turns else 1, "question": question, "evaluator_flags": flags}
+    turns.append(entry)
+    del turns[:-MAX_MEMORY_TURNS]
+    return entry
+
+
+def set_flags(entry, flags):
+    entry["evaluator_flags"] = flags
+
+
+def get_flags(conversation_id):
+    """Evaluator flags per turn, oldest first; None for an unknown conversation."""
+    if conversation_id not in conversation_store:
+        return None
+    return [dict(entry, pending=entry["evaluator_flags"] is None)
+            for entry in get_state(conversation_id).get("flags", [])]
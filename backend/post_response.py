@@ -0,0 +1,93 @@
+"""
+Post-Response Tasks
+===================
+Work that doesn't change the answer — evaluator checks, the request log,
+router feedback — runs on a background worker after the response is sent,
+instead of adding its cost to user-facing latency.
+
+Tasks go through a bounded queue (POST_RESPONSE_QUEUE_SIZE) to a single
+worker thread, so they run in submission order and logs.json has one
+writer. If the queue is full the task runs inline in the caller rather
+than being dropped. Pending tasks are drained on shutdown.
+
+EVALUATION_MODE = "inline" keeps the old behaviour (flags computed before
+the response is returned).
+"""
+
+import queue
+import threading
+import time
+
+from config import POST_RESPONSE_QUEUE_SIZE
+
+_queue = queue.Queue(maxsize=POST_RESPONSE_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"completed": 0, "failed": 0, "ran_inline": 0, "max_depth": 0, "task_seconds": 0.0}
+
+
+def _run(fn, args):
+    start = time.perf_counter()
+    outcome = "completed"
+    try:
+        fn(*args)
+    except Exception as e:
+        outcome = "failed"
+        print(f"[WARN] Post-response task {fn.__name__} failed: {e}")
+    with _stats_lock:
+        _stats[outcome] += 1
+        _stats["task_seconds"] += time.perf_counter() - start
+
+
+def _work():
+    while True:
+        fn, args = _queue.get()
+        try:
+            _run(fn, args)
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="post-response", daemon=True)
+            _worker.start()
+
+
+def submit(fn, *args):
+    """Run fn(*args) after the response; inline if the queue is full."""
+    _ensure_worker()
+    try:
+        _queue.put_nowait((fn, args))
+    except queue.Full:
+        with _stats_lock:
+            _stats["ran_inline"] += 1
+        _run(fn, args)
+        return
+    with _stats_lock:
+        _stats["max_depth"] = max(_stats["max_depth"], _queue.qsize())
+
+
+def drain(timeout=10.0):
+    """Wait (up to `timeout` seconds) for queued tasks to finish. Returns True if the queue is empty."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not _queue.unfinished_tasks
+
+
+def get_metrics():
+    with _stats_lock:
+        stats = dict(_stats)
+    done = stats["completed"] + stats["failed"]
+    return {
+        "queued": _queue.unfinished_tasks,
+        "max_depth": stats["max_depth"],
+        "completed": stats["completed"],
+        "failed": stats["failed"],
+        "ran_inline": stats["ran_inline"],
+        "avg_task_ms": round(stats["task_seconds"] * 1000 / done, 2) if done else 0.0
+    }
@@ -0,0 +1,175 @@
+"""
+Profiling (Admin Diagnostics)
+=============================
+Tools behind the opt-in /admin endpoints, for finding where a long-running
+API worker's memory and CPU go. Everything is bounded so it can be switched
+on briefly in production:
+
+  - tracemalloc snapshots: start tracing, then diff each snapshot against
+    the previous one to see which lines keep allocating (tracing slows
+    allocation down while on — stop it when done).
+  - Size reports: object counts and approximate deep sizes of the
+    in-memory stores, walked up to SIZE_MAX_OBJECTS objects per section.
+  - Sampling CPU profile: a background thread reads every thread's stack
+    (sys._current_frames) every few ms for a few seconds. Nothing is
+    instrumented, so the cost is one stack walk per sample. Output is in the
+    "collapsed" format flamegraph.pl and speedscope read directly:
+        thread;module:function;module:function <samples>
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+SIZE_MAX_OBJECTS = 200_000
+
+_trace_lock = threading.Lock()
+_last_snapshot = None
+_profile_lock = threading.Lock()
+
+
+# --- Memory ---
+
+def rss_mb():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def deep_sizeof(obj, max_objects=SIZE_MAX_OBJECTS):
+    """
+    Approximate size of `obj` and everything it references through
+    dicts, lists, tuples and sets (each object counted once).
+    Returns {"bytes", "objects", "truncated"}; stops after `max_objects`.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+    return {"bytes": total, "objects": len(seen), "truncated": bool(stack)}
+
+
+def object_types(limit=25):
+    """Most common live object types tracked by the garbage collector."""
+    counts = Counter(type(o).__name__ for o in gc.get_objects())
+    return dict(counts.most_common(limit))
+
+
+def start_tracing(frames=25):
+    """Start tracemalloc (if needed) and take the baseline snapshot."""
+    global _last_snapshot
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        _last_snapshot = tracemalloc.take_snapshot()
+    return tracing_status()
+
+
+def stop_tracing():
+    global _last_snapshot
+    with _trace_lock:
+        tracemalloc.stop()
+        _last_snapshot = None
+    return tracing_status()
+
+
+def tracing_status():
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "traced_mb": round(current / 1024 / 1024, 2),
+        "peak_traced_mb": round(peak / 1024 / 1024, 2),
+        "overhead_mb": round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2)
+    }
+
+
+def snapshot_diff(group_by="lineno", limit=25):
+    """
+    Take a snapshot and diff it against the previous one (which it then
+    replaces). Returns the `limit` biggest growths, or None if not tracing.
+    """
+    global _last_snapshot
+    with _trace_lock:
+        if not tracemalloc.is_tracing() or _last_snapshot is None:
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ])
+        stats = snapshot.compare_to(_last_snapshot, group_by)
+        _last_snapshot = snapshot
+
+    return {
+        **tracing_status(),
+        "top": [
+            {
+                "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_kb": round(stat.size / 1024, 1),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count": stat.count,
+                "count_diff": stat.count_diff
+            }
+            for stat in stats[:limit]
+        ]
+    }
+
+
+# --- CPU ---
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+def sample_stacks(seconds, interval_ms=5.0):
+    """
+    Sample every other thread's stack for `seconds`. Returns
+    (Counter of collapsed stacks → samples, number of sampling rounds),
+    or None if another profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        rounds = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                calls = []
+                while frame is not None:
+                    calls.append(_frame_name(frame))
+                    frame = frame.f_back
+                calls.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(calls))] += 1
+            rounds += 1
+            time.sleep(interval_ms / 1000)
+        return stacks, rounds
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks):
+    """Collapsed-stack text (flamegraph.pl / speedscope input), heaviest first."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,109 @@
+"""
+Query Rewriter (History-Aware)
+==============================
+Turns follow-up questions ("tell me more about it", "what about the
+enterprise one?") into standalone retrieval queries, so FAISS searches for
+the topic being discussed instead of the literal pronouns.
+
+Rules (no LLM, no second retrieval):
+  - Only follow-ups are rewritten: questions opening with a continuation
+    ("what about", "and ..."), using a referring pronoun (it, they, those,
+    ...) or with no content words of their own ("why?"), asked in a
+    conversation that already has history. Short standalone questions
+    ("what is SSO?") are left alone.
+  - The previous turn's question and answer are mined for keywords
+    (stopwords removed, the user's question weighted above the answer),
+    and the top REWRITE_KEYWORDS are appended to the question.
+
+The condensed query is cached in the conversation's state for the current
+turn (keyed on the conversation's message count, which keeps growing after
+the history is trimmed), so repeated retrievals within a turn reuse it.
+"""
+
+import re
+from collections import Counter
+
+from config import QUERY_REWRITE_ENABLED, REWRITE_KEYWORDS, REWRITE_TURNS
+from memory import get_state, message_count
+
+# Words that point back to something said earlier. Generic words like
+# "this", "that" or "one" are left out: "what is this error?" stands alone.
+FOLLOW_UP_WORDS = {
+    "it", "its", "they", "them", "their", "those", "these", "ones", "else", "same", "above"
+}
+
+# Openers that continue the previous topic
+FOLLOW_UP_STARTERS = ("and ", "what about", "how about", "tell me more", "also ")
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "then", "so", "of", "to", "in", "on", "at", "by",
+    "for", "with", "from", "into", "about", "as", "is", "are", "was", "were", "be", "been", "being",
+    "do", "does", "did", "can", "could", "will", "would", "should", "may", "might", "must", "shall",
+    "has", "have", "had", "i", "me", "my", "we", "our", "you", "your", "he", "she", "his", "her",
+    "what", "which", "who", "whom", "when", "where", "why", "how", "not", "no", "yes", "all", "any",
+    "some", "each", "there", "here", "than", "too", "very", "just", "only", "up", "out", "tell",
+    "please", "thanks", "hi", "hello", "get", "use", "using", "want", "need", "know", "like", "also",
+    "more", "other", "such", "via", "per", "am", "let", "us", "sure", "clearpath", "this", "that", "one"
+} | FOLLOW_UP_WORDS
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-]*[a-z0-9]|[a-z0-9]")
+
+
+def content_words(text):
+    """Lowercased words of `text` with stopwords removed, in order."""
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS and len(w) > 2]
+
+
+def is_follow_up(question):
+    """True if the question leans on earlier turns for its topic."""
+    text = question.lower().strip()
+    if text.startswith(FOLLOW_UP_STARTERS):
+        return True
+    words = set(WORD_RE.findall(text))
+    return bool(words & FOLLOW_UP_WORDS) or not content_words(text)
+
+
+def history_keywords(history, exclude, limit):
+    """Top keywords from the last REWRITE_TURNS turns, user questions counted double."""
+    scores = Counter()
+    first_seen = {}
+    for msg in history[-REWRITE_TURNS * 2:]:
+        weight = 2 if msg["role"] == "user" else 1
+        for word in content_words(msg["content"]):
+            if word in exclude:
+                continue
+            scores[word] += weight
+            first_seen.setdefault(word, len(first_seen))
+    ranked = sorted(scores, key=lambda w: (-scores[w], first_seen[w]))
+    return ranked[:limit]
+
+
+def condense_query(question, history):
+    """Standalone retrieval query for `question` given the conversation so far."""
+    if not history or not is_follow_up(question):
+        return question
+    keywords = history_keywords(history, set(content_words(question)), REWRITE_KEYWORDS)
+    if not keywords:
+        return question
+    return f"{question} {' '.join(keywords)}"
+
+
+def retrieval_query(conversation_id, question, history):
+    """
+    The query to retrieve with for this turn, condensed once per turn.
+
+    The cache entry is keyed on the turn (the conversation's message count)
+    and question, so a new message in the conversation invalidates it.
+    """
+    if not QUERY_REWRITE_ENABLED:
+        return question
+
+    state = get_state(conversation_id)
+    turn = message_count(conversation_id)
+    cached = state.get("condensed")
+    if cached and cached["turn"] == turn and cached["question"] == question:
+        return cached["query"]
+
+    query = condense_query(question, history)
+    state["condensed"] = {"turn": turn, "question": question, "query": query}
+    return query
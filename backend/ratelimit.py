@@ -0,0 +1,196 @@
+"""
+Rate Limiter (Token-Bucket Admission Control)
+=============================================
+Client-side admission layer in front of the Groq API.
+
+Each model gets two token buckets that mirror Groq's own limits:
+  - requests per minute (rpm)
+  - tokens per minute (tpm), charged with the estimated prompt tokens
+
+When a bucket is empty the behaviour depends on RATE_LIMIT_MODE:
+  queue    → wait until the buckets refill, up to RATE_LIMIT_MAX_WAIT seconds
+  shed     → reject immediately (the API turns this into a 429)
+  fallback → try the cheaper fallback model first (70B → 8B), then queue
+"""
+
+import threading
+import time
+
+from config import RATE_LIMITS, RATE_LIMIT_MODE, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_FALLBACKS, LLM_BACKEND
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted before its deadline."""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"Rate limit reached for {model}, retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `rate` tokens/second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class ModelLimiter:
+    """Request + token buckets for a single model, with queueing metrics."""
+
+    def __init__(self, model, rpm, tpm):
+        self.model = model
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.cond = threading.Condition()
+
+        # Metrics
+        self.admitted = 0
+        self.shed = 0
+        self.fallbacks = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _wait_time(self, tokens, now):
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def _admit(self, tokens):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.admitted += 1
+
+    def try_acquire(self, tokens):
+        """Admit immediately if both buckets have room. Returns True/False."""
+        with self.cond:
+            if self._wait_time(tokens, time.monotonic()) == 0:
+                self._admit(tokens)
+                return True
+            return False
+
+    def acquire(self, tokens, max_wait):
+        """
+        Block until the request can be admitted or `max_wait` seconds pass.
+        Raises RateLimitExceeded if the deadline would be missed.
+        """
+        start = time.monotonic()
+        deadline = start + max_wait
+
+        with self.cond:
+            # A request bigger than the whole bucket can never be admitted
+            if tokens > self.tokens.capacity:
+                self.shed += 1
+                raise RateLimitExceeded(self.model, 60.0)
+
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(tokens, now)
+                    if wait == 0:
+                        self._admit(tokens)
+                        break
+                    if now + wait > deadline:
+                        self.shed += 1
+                        raise RateLimitExceeded(self.model, wait)
+                    self.cond.wait(wait)
+            finally:
+                self.queue_depth -= 1
+
+            waited = time.monotonic() - start
+            self.waited += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once the real usage is known."""
+        with self.cond:
+            self.tokens.take(actual - estimated)
+            self.cond.notify_all()
+
+    def metrics(self):
+        with self.cond:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "fallbacks": self.fallbacks,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "avg_wait_ms": int(self.total_wait / self.waited * 1000) if self.waited else 0,
+                "max_wait_ms": int(self.max_wait * 1000),
+                "requests_available": int(self.requests.tokens),
+                "tokens_available": int(self.tokens.tokens),
+            }
+
+
+# One limiter per configured model (Groq's limits don't apply to the stub LLM)
+_limiters = {
+    model: ModelLimiter(model, limits["rpm"], limits["tpm"])
+    for model, limits in RATE_LIMITS.items()
+} if LLM_BACKEND != "stub" else {}
+
+
+def acquire(model, tokens, mode=RATE_LIMIT_MODE, max_wait=RATE_LIMIT_MAX_WAIT):
+    """
+    Admit one request for `model` costing `tokens` estimated prompt tokens.
+
+    Returns the model that was admitted (may be the fallback model).
+    Raises RateLimitExceeded when the request is shed.
+    """
+    limiter = _limiters.get(model)
+    if limiter is None:
+        return model  # unknown model: no limits configured
+
+    if limiter.try_acquire(tokens):
+        return model
+
+    if mode == "shed":
+        with limiter.cond:
+            limiter.shed += 1
+            retry_after = limiter._wait_time(tokens, time.monotonic())
+        raise RateLimitExceeded(model, retry_after)
+
+    if mode == "fallback":
+        fallback = RATE_LIMIT_FALLBACKS.get(model)
+        if fallback in _limiters and _limiters[fallback].try_acquire(tokens):
+            with limiter.cond:
+                limiter.fallbacks += 1
+            return fallback
+
+    limiter.acquire(tokens, max_wait)
+    return model
+
+
+def settle(model, estimated, actual):
+    """Charge (or refund) the difference between estimated and actual tokens."""
+    limiter = _limiters.get(model)
+    if limiter is not None:
+        limiter.settle(estimated, actual)
+
+
+def get_metrics():
+    """Per-model admission metrics (queue depth, wait times, shed counts)."""
+    return {model: limiter.metrics() for model, limiter in _limiters.items()}
@@ -0,0 +1,134 @@
+"""
+Cross-Encoder Reranking
+=======================
+Optional stage between retrieval and the LLM (RERANK_ENABLED). Retrieval
+fetches a wider candidate set (RERANK_CANDIDATES) with the cheap FAISS
+search, a small CPU cross-encoder (RERANK_MODEL) scores every
+(query, chunk) pair in one batched call, and only the best RERANK_TOP_N
+chunks go into the prompt. A few well-ranked chunks cost fewer prompt
+tokens, and less LLM time, than TOP_K loosely ranked ones.
+
+Scores are cached per (query hash, collection, chunk id) in an LRU of
+RERANK_CACHE_SIZE entries, so repeated queries and reused chunks are not
+scored again. Kept chunks carry the cross-encoder score as their
+relevance_score. ms-marco cross-encoders output unbounded logits, so the
+model is loaded with a sigmoid activation to keep scores in 0-1 like
+retrieval's (the frontend shows them as percentages).
+
+If the model can't be loaded, chunks keep their retrieval order (cut to
+TOP_K) and a warning is printed once.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import RERANK_ENABLED, RERANK_MODEL, RERANK_TOP_N, RERANK_CACHE_SIZE, TOP_K
+
+# Loaded on first use; None if loading failed
+_model = None
+_model_loaded = False
+_lock = threading.Lock()
+_scores = OrderedDict()   # (query hash, collection, chunk id) → score, least recently used first
+_stats = {"queries": 0, "pairs_scored": 0, "cache_hits": 0, "seconds": 0.0}
+
+
+def _load_model():
+    global _model, _model_loaded
+
+    with _lock:
+        if not _model_loaded:
+            try:
+                import torch
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL, default_activation_function=torch.nn.Sigmoid())
+            except Exception as e:
+                print(f"[WARN] Reranker model {RERANK_MODEL} unavailable, reranking skipped: {e}")
+            _model_loaded = True
+    return _model
+
+
+def query_key(query):
+    return hashlib.sha1(query.encode("utf-8")).digest()
+
+
+def rerank_batch(queries, chunk_lists, collection=None, top_n=RERANK_TOP_N):
+    """
+    Rerank each query's candidate chunks and keep the best `top_n`.
+    Uncached pairs from all queries are scored in one cross-encoder call.
+
+    Returns [(chunks, info)] per query; info has candidates, kept, scored,
+    cache_hits and whether the cross-encoder was applied.
+    """
+    start = time.perf_counter()
+    keys = [[(query_key(query), collection, chunk.id) for chunk in chunks]
+            for query, chunks in zip(queries, chunk_lists)]
+    found = {}
+    with _lock:
+        for row in keys:
+            for key in row:
+                if key in _scores:
+                    _scores.move_to_end(key)
+                    found[key] = _scores[key]
+
+    missing = {}   # key → (query, text), deduplicated across queries
+    for query, chunks, row in zip(queries, chunk_lists, keys):
+        for chunk, key in zip(chunks, row):
+            if key not in found:
+                missing.setdefault(key, (query, chunk.text))
+
+    if missing:
+        model = _load_model()
+        if model is None:
+            return [(chunks[:TOP_K], {"applied": False, "candidates": len(chunks), "kept": min(len(chunks), TOP_K)})
+                    for chunks in chunk_lists]
+        pairs = list(missing.values())
+        scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        with _lock:
+            for key, score in zip(missing, scores):
+                found[key] = _scores[key] = round(float(score), 4)
+            while len(_scores) > RERANK_CACHE_SIZE:
+                _scores.popitem(last=False)
+
+    results = []
+    for chunks, row in zip(chunk_lists, keys):
+        ranked = sorted(zip(chunks, row), key=lambda pair: -found[pair[1]])[:top_n]
+        kept = [chunk._replace(relevance_score=found[key]) for chunk, key in ranked]
+        results.append((kept, {
+            "applied": True,
+            "candidates": len(chunks),
+            "kept": len(kept),
+            "scored": sum(1 for key in row if key in missing),
+            "cache_hits": sum(1 for key in row if key not in missing)
+        }))
+
+    with _lock:
+        _stats["queries"] += len(queries)
+        _stats["pairs_scored"] += len(missing)
+        _stats["cache_hits"] += sum(info["cache_hits"] for _, info in results)
+        _stats["seconds"] += time.perf_counter() - start
+    return results
+
+
+def rerank(query, chunks, collection=None, top_n=RERANK_TOP_N):
+    """rerank_batch() for one query: (best `top_n` chunks, info)."""
+    if not chunks:
+        return [], {"applied": False, "candidates": 0, "kept": 0}
+    return rerank_batch([query], [chunks], collection, top_n)[0]
+
+
+def get_metrics():
+    with _lock:
+        stats = dict(_stats)
+        cached = len(_scores)
+    pairs = stats["pairs_scored"] + stats["cache_hits"]
+    return {
+        "enabled": RERANK_ENABLED,
+        "model_loaded": _model is not None,
+        "queries": stats["queries"],
+        "pairs_scored": stats["pairs_scored"],
+        "cache_hit_rate": round(stats["cache_hits"] / pairs, 4) if pairs else 0.0,
+        "cached_scores": cached,
+        "avg_ms": round(stats["seconds"] * 1000 / stats["queries"], 2) if stats["queries"] else 0.0
+    }
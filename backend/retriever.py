@@ -1,78 +1,317 @@
-
 import os
 import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import NamedTuple
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from config import FAISS_INDEX_PATH, METADATA_PATH, EMBEDDING_MODEL, TOP_K
+from shards import ShardedIndex, shard_paths
+from profiling import deep_sizeof
+from config import (
+    FAISS_INDEX_PATH, METADATA_PATH, EMBEDDING_MODEL, TOP_K,
+    INDEXES_DIR, DEFAULT_COLLECTION, COLLECTIONS, MAX_LOADED_COLLECTIONS
+)
+
+
+class ChunkRef(NamedTuple):
+    """
+    A retrieved chunk: its id and score plus a reference to the chunk store
+    (the collection's metadata list) it came from. Text and citation fields
+    are read from the store on access, so a result is a three-field tuple
+    rather than a six-key dict.
+    """
+    id: int
+    relevance_score: float
+    store: list
+
+    @property
+    def text(self):
+        return self.store[self.id]["text"]
+
+    @property
+    def document(self):
+        return self.store[self.id]["document"]
+
+    @property
+    def page(self):
+        return self.store[self.id]["page"]
+
+    @property
+    def page_end(self):
+        chunk_meta = self.store[self.id]
+        return chunk_meta.get("page_end", chunk_meta["page"])
 
+    def __repr__(self):
+        return f"ChunkRef(id={self.id}, relevance_score={self.relevance_score}, document={self.document!r}, page={self.page})"
 
-# Load model, index, and metadata once at module level
+
+# Load model once at module level; collections are loaded on demand
 _model = None
-_index = None
-_metadata = None
+_collections = OrderedDict()    # name → {"index", "metadata", "doc_ids", "tag_ids", "users", "evicted"}, least recently used first
+_collections_lock = threading.Lock()
+_loading = {}                   # name → lock held while that collection is read from disk
+
 
+def collection_paths(name):
+    """(index_path, metadata_path) for a collection."""
+    if name == DEFAULT_COLLECTION:
+        return FAISS_INDEX_PATH, METADATA_PATH
+    if name not in COLLECTIONS:
+        raise ValueError(f"Unknown collection '{name}'. Available: {[DEFAULT_COLLECTION] + sorted(COLLECTIONS)}")
+    directory = os.path.join(INDEXES_DIR, name)
+    return os.path.join(directory, "faiss_index.bin"), os.path.join(directory, "metadata.pkl")
 
-def _load_resources():
-    """Lazy-load the FAISS index, metadata, and embedding model."""
-    global _model, _index, _metadata
+
+def _load_model():
+    """Lazy-load the embedding model."""
+    global _model
 
     if _model is None:
         _model = SentenceTransformer(EMBEDDING_MODEL)
 
-    if _index is None:
-        if not os.path.exists(FAISS_INDEX_PATH):
-            raise FileNotFoundError(f"FAISS index not found at {FAISS_INDEX_PATH}. Run ingest.py first.")
-        _index = faiss.read_index(FAISS_INDEX_PATH)
 
-    if _metadata is None:
-        if not os.path.exists(METADATA_PATH):
-            raise FileNotFoundError(f"Metadata not found at {METADATA_PATH}. Run ingest.py first.")
-        with open(METADATA_PATH, "rb") as f:
-            _metadata = pickle.load(f)
+def _read_collection(name):
+    """Read a collection's index + metadata and precompute id lists for filtering."""
+    index_path, metadata_path = collection_paths(name)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"FAISS index not found at {index_path}. Run ingest.py first.")
+    if not os.path.exists(metadata_path):
+        raise FileNotFoundError(f"Metadata not found at {metadata_path}. Run ingest.py first.")
+
+    with open(metadata_path, "rb") as f:
+        metadata = pickle.load(f)
+
+    # A sharded collection is searched by its shard workers instead of in-process
+    paths = shard_paths(index_path)
+    if paths:
+        index = ShardedIndex(paths, [chunk_meta["shard"] for chunk_meta in metadata])
+    else:
+        index = faiss.read_index(index_path)
+
+    doc_ids, tag_ids = {}, {}
+    for i, chunk_meta in enumerate(metadata):
+        doc_ids.setdefault(chunk_meta["document"], []).append(i)
+        for tag in chunk_meta.get("tags", []):
+            tag_ids.setdefault(tag, []).append(i)
+
+    return {
+        "index": index,
+        "metadata": metadata,
+        "doc_ids": {doc: np.array(ids, dtype="int64") for doc, ids in doc_ids.items()},
+        "tag_ids": {tag: np.array(ids, dtype="int64") for tag, ids in tag_ids.items()},
+        "users": 0,         # searches currently holding the collection
+        "evicted": False
+    }
+
 
+def _close(collection):
+    """Stop a sharded collection's worker processes."""
+    if isinstance(collection["index"], ShardedIndex):
+        collection["index"].close()
 
-def retrieve(query, top_k=TOP_K):
+
+def _acquire_collection(name):
     """
-    Retrieve top-K relevant chunks for a given query.
+    Get a loaded collection and register as one of its users, reading it
+    from disk and evicting the LRU one if needed. Reading (and spawning
+    shard workers) happens outside _collections_lock, one loader per name.
+    """
+    while True:
+        with _collections_lock:
+            collection = _collections.get(name)
+            if collection is not None:
+                _collections.move_to_end(name)
+                collection["users"] += 1
+                return collection
+            load_lock = _loading.setdefault(name, threading.Lock())
 
-    Returns a list of dicts:
-    [
-        {
-            "text": "chunk content...",
-            "document": "filename.pdf",
-            "page": 3,
-            "relevance_score": 0.85
-        },
-        ...
-    ]
+        with load_lock:
+            with _collections_lock:
+                if name in _collections:
+                    continue  # another thread loaded it while we waited
+
+            try:
+                collection = _read_collection(name)
+            except Exception:
+                with _collections_lock:
+                    _loading.pop(name, None)
+                raise
+            to_close = []
+            with _collections_lock:
+                _loading.pop(name, None)
+                collection["users"] = 1
+                _collections[name] = collection
+                while len(_collections) > MAX_LOADED_COLLECTIONS:
+                    _, evicted = _collections.popitem(last=False)
+                    evicted["evicted"] = True
+                    if evicted["users"] == 0:
+                        to_close.append(evicted)
+            for evicted in to_close:
+                _close(evicted)
+            return collection
+
+
+def _release_collection(collection):
+    """Drop a user; an evicted collection is closed once its last user is done."""
+    with _collections_lock:
+        collection["users"] -= 1
+        idle = collection["evicted"] and collection["users"] == 0
+    if idle:
+        _close(collection)
+
+
+@contextmanager
+def _load_collection(name):
+    """A loaded collection that is not closed while the block runs, even if it is evicted."""
+    collection = _acquire_collection(name)
+    try:
+        yield collection
+    finally:
+        _release_collection(collection)
+
+
+def loaded_collections():
+    """Names of the collections currently held in memory."""
+    return list(_collections)
+
+
+def collection_stats():
+    """Vectors and approximate memory per loaded collection (sharded indexes live in their workers)."""
+    with _collections_lock:
+        loaded = list(_collections.items())
+    stats = {}
+    for name, coll in loaded:
+        index = coll["index"]
+        sharded = isinstance(index, ShardedIndex)
+        stats[name] = {
+            "vectors": index.ntotal,
+            "dimension": index.d,
+            "shards": len(index.pools) if sharded else None,
+            "index_mb": None if sharded else round(index.ntotal * index.d * 4 / 1024 / 1024, 2),
+            "metadata": deep_sizeof(coll["metadata"])
+        }
+    return stats
+
+
+def _filter_ids(collection, documents=None, tags=None):
+    """Chunk ids matching the document and/or tag filter (both must match if both are given)."""
+    selected = None
+    for wanted, lookup in ((documents, collection["doc_ids"]), (tags, collection["tag_ids"])):
+        if not wanted:
+            continue
+        ids = np.unique(np.concatenate([lookup.get(w, np.empty(0, dtype="int64")) for w in wanted]))
+        selected = ids if selected is None else np.intersect1d(selected, ids)
+    return selected
+
+
+def embed_query(query):
+    """Embed a single query. Returns a float32 array of shape (1, dimension)."""
+    _load_model()
+    return np.array(_model.encode([query]), dtype="float32")
+
+
+def embed_queries(queries, batch_size=64):
+    """Embed many queries in one batched encode. Returns a float32 array of shape (n, dimension)."""
+    _load_model()
+    return np.array(_model.encode(list(queries), batch_size=batch_size), dtype="float32")
+
+
+def _search(coll, query_embeddings, top_k, documents=None, tags=None):
+    """
+    (distances, indices) for a query matrix, or None if nothing can match.
+    Metadata filters become an IDSelector, so FAISS only scores matching
+    vectors; sharded indexes get the ids and only search shards holding them.
     """
-    _load_resources()
+    ids = _filter_ids(coll, documents, tags)
+    if ids is not None and len(ids) == 0:
+        return None
+    index = coll["index"]
+    if isinstance(index, ShardedIndex):
+        return index.search(query_embeddings, top_k, ids=ids)
 
-    # Convert query to embedding
-    query_embedding = _model.encode([query])
-    query_embedding = np.array(query_embedding, dtype="float32")
+    params = None
+    if ids is not None:
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)))
+    return index.search(query_embeddings, top_k, params=params)
 
-    # Search FAISS index (returns L2 distances, lower = more similar)
-    distances, indices = _index.search(query_embedding, top_k)
 
+def _results(metadata, distances, indices):
+    """Turn one row of FAISS output into ChunkRefs."""
     results = []
-    for i, idx in enumerate(indices[0]):
+    for i, idx in enumerate(indices):
         if idx == -1:
             continue  # FAISS returns -1 if fewer results than top_k
 
-        chunk_meta = _metadata[idx]
-        distance = float(distances[0][i])
-
         # Convert L2 distance to a similarity score (0 to 1)
         # Lower distance = higher similarity
-        relevance_score = round(1.0 / (1.0 + distance), 4)
-
-        results.append({
-            "text": chunk_meta["text"],
-            "document": chunk_meta["document"],
-            "page": chunk_meta["page"],
-            "relevance_score": relevance_score
-        })
+        relevance_score = round(1.0 / (1.0 + float(distances[i])), 4)
+        results.append(ChunkRef(int(idx), relevance_score, metadata))
 
     return results
+
+
+def retrieve(query, top_k=TOP_K, query_embedding=None, collection=None, documents=None, tags=None):
+    """
+    Retrieve top-K relevant chunks for a given query.
+
+    Pass `query_embedding` (from embed_query) to skip re-encoding the query.
+    `collection` picks a named index (default: everything); `documents` and
+    `tags` restrict the search to matching chunks inside FAISS itself.
+
+    Returns a list of ChunkRefs, best first:
+    [
+        ChunkRef(id=42, relevance_score=0.85, store=<collection metadata>),
+        ...
+    ]
+    with .text, .document, .page and .page_end read from the store.
+    """
+    # Convert query to embedding
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+
+    with _load_collection(collection or DEFAULT_COLLECTION) as coll:
+        # Search FAISS index (returns L2 distances, lower = more similar)
+        found = _search(coll, query_embedding, top_k, documents, tags)
+    if found is None:
+        return []
+    distances, indices = found
+    return _results(coll["metadata"], distances[0], indices[0])
+
+
+def retrieve_batch(queries, top_k=TOP_K, query_embeddings=None, collection=None, documents=None, tags=None):
+    """
+    retrieve() for many queries at once: one batched encode and a single
+    FAISS search over the whole query matrix. Returns one result list per query.
+    """
+    if query_embeddings is None:
+        query_embeddings = embed_queries(queries)
+    if len(query_embeddings) == 0:
+        return []
+
+    with _load_collection(collection or DEFAULT_COLLECTION) as coll:
+        found = _search(coll, query_embeddings, top_k, documents, tags)
+    if found is None:
+        return [[] for _ in range(len(query_embeddings))]
+
+    distances, indices = found
+    return [_results(coll["metadata"], distances[row], indices[row]) for row in range(len(indices))]
+
+
+def rescore(chunks, query_embedding, collection=None):
+    """
+    Re-score already retrieved chunks against a new query without searching.
+    Vectors are read back from the index by chunk id. Returns new refs, best first.
+    """
+    if not chunks:
+        return []
+    with _load_collection(collection or DEFAULT_COLLECTION) as coll:
+        vectors = coll["index"].reconstruct_batch(np.array([c.id for c in chunks], dtype="int64"))
+    distances = ((vectors - query_embedding) ** 2).sum(axis=1)
+
+    rescored = [
+        chunk._replace(relevance_score=round(1.0 / (1.0 + float(distance)), 4))
+        for chunk, distance in zip(chunks, distances)
+    ]
+    return sorted(rescored, key=lambda c: c.relevance_score, reverse=True)
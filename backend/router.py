@@ -18,13 +18,22 @@ Rules:
 Mapping:
   simple  → llama-3.1-8b-instant
   complex → llama-3.3-70b-versatile
+
+The router runs on every request, so the rules are compiled once into
+regexes at import time and results are memoized per normalized query.
 """
 
-from config import SIMPLE_MODEL, COMPLEX_MODEL
+import re
+from functools import lru_cache
+
+from config import SIMPLE_MODEL, COMPLEX_MODEL, ROUTER_CACHE_SIZE
 
 # Greetings and simple phrases
 GREETINGS = {"hi", "hello", "hey", "thanks", "thank you", "bye", "goodbye", "ok", "okay", "sure", "yes", "no"}
 
+# Queries that specifically DON'T need retrieval (Identity/Greetings)
+PERSONAL_QUERIES = {"who are you", "what is your name", "what's your name", "identify yourself", "what are you"}
+
 # Keywords that signal a complex query
 COMPLEX_KEYWORDS = {"how", "why", "explain", "compare", "steps", "difference", "describe", "elaborate", "pricing", "plans", "cost"}
 
@@ -32,42 +41,68 @@ COMPLEX_KEYWORDS = {"how", "why", "explain", "compare", "steps", "difference", "
 YES_NO_STARTERS = {"is", "are", "was", "were", "do", "does", "did", "can", "could", "will", "would", "should", "has", "have", "had"}
 
 
-def classify_query(question):
-    """
-    Classify a query as 'simple' or 'complex' using rule-based logic.
+def _alternation(phrases):
+    """Regex alternation of literal phrases, longest first."""
+    return "|".join(re.escape(p) for p in sorted(phrases, key=lambda p: (-len(p), p)))
 
-    Returns:
-        dict with 'classification', 'model_used', and 'requires_context'
-    """
-    text = question.strip().lower()
-    words = text.split()
-    word_count = len(words)
 
-    # List of queries that specifically DON'T need retrieval (Identity/Greetings)
-    PERSONAL_QUERIES = {"who are you", "what is your name", "what's your name", "identify yourself", "what are you"}
+# --- Compiled rules ---
+
+# Query mentions any personal query
+_PERSONAL_RE = re.compile(_alternation(PERSONAL_QUERIES))
+
+# First word is a yes/no starter
+_YES_NO_RE = re.compile(r"(?:%s)(?:\s|\Z)" % _alternation(YES_NO_STARTERS))
+
+# Any whole word is a complex keyword (ignoring trailing punctuation)
+_COMPLEX_RE = re.compile(r"(?<!\S)(?:%s)[?!.,]*(?!\S)" % _alternation(COMPLEX_KEYWORDS))
+
+# At least 10 whitespace-separated words
+_TEN_WORDS_RE = re.compile(r"(?:\S+\s+){9}\S")
 
-    # Check if it's a greeting
-    clean_text = text.rstrip("!?.,")
-    if clean_text in GREETINGS or any(q in text for q in PERSONAL_QUERIES):
-        return {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": False}
+# Shared results (treat as read-only)
+_SIMPLE_NO_CONTEXT = {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": False}
+_SIMPLE = {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": True}
+_COMPLEX = {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+
+
+@lru_cache(maxsize=ROUTER_CACHE_SIZE)
+def _classify(text):
+    """Apply the rules to an already stripped + lowercased query."""
+    # Check if it's a greeting or an identity question
+    if text.rstrip("!?.,") in GREETINGS or _PERSONAL_RE.search(text):
+        return _SIMPLE_NO_CONTEXT
 
     # Check for yes/no question (starts with yes/no starter words)
-    if words and words[0] in YES_NO_STARTERS and text.endswith("?"):
-        if word_count < 10:
-            return {"classification": "simple", "model_used": SIMPLE_MODEL}
+    if text.endswith("?") and _YES_NO_RE.match(text) and not _TEN_WORDS_RE.match(text):
+        return _SIMPLE
 
-    for word in words:
-        stripped = word.rstrip("?!.,")
-        if stripped in COMPLEX_KEYWORDS:
-            return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+    if _COMPLEX_RE.search(text):
+        return _COMPLEX
 
     # Check for multiple question marks (indicates complex/multi-part question)
     if text.count("?") >= 2:
-        return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+        return _COMPLEX
 
     # Check word count
-    if word_count >= 10:
-        return {"classification": "complex", "model_used": COMPLEX_MODEL, "requires_context": True}
+    if _TEN_WORDS_RE.match(text):
+        return _COMPLEX
 
     # Default: short simple queries
-    return {"classification": "simple", "model_used": SIMPLE_MODEL, "requires_context": True}
+    return _SIMPLE
+
+
+def classify_query(question):
+    """
+    Classify a query as 'simple' or 'complex' using rule-based logic.
+
+    Returns:
+        dict with 'classification', 'model_used', and 'requires_context'
+        (shared between calls — copy it before modifying)
+    """
+    return _classify(question.strip().lower())
+
+
+def cache_info():
+    """Hits, misses and size of the classification cache."""
+    return _classify.cache_info()._asdict()
@@ -0,0 +1,175 @@
+"""
+Priority Scheduler (Per-Class Admission)
+========================================
+Keeps cheap "simple" queries from waiting behind slow "complex" RAG
+generations during load spikes.
+
+Every request is admitted under the classification router.classify_query
+gives it. Each class has its own bounded queue, its own concurrency cap and
+a weight; all classes share SCHEDULER_MAX_CONCURRENCY pipeline slots.
+
+  - Admission is weighted fair (stride scheduling): when a slot frees up,
+    the class with the least (admitted / weight) so far goes next, so with
+    weights 4:1 simple gets 4 slots for every complex one under contention,
+    and an idle class's share goes to the others.
+  - Deadline-based shedding: a request that cannot start within its
+    class's deadline is rejected — immediately if the queue is full or the
+    expected wait already exceeds the deadline, otherwise when it expires.
+  - Queue wait is tracked per class (/metrics "scheduler").
+
+Runs on the event loop (no locks): acquire() is awaited by the async
+endpoints before they hand the work to the threadpool, so queued requests
+don't hold worker threads.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+from config import SCHEDULER_ENABLED, SCHEDULER_MAX_CONCURRENCY, SCHEDULER_CLASSES
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, cls, reason, retry_after):
+        super().__init__(f"Server busy ({cls} queue {reason}), retry in {retry_after:.1f}s")
+        self.cls = cls
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Class:
+    """Queue, limits and metrics for one classification."""
+
+    def __init__(self, name, concurrency, queue, weight, deadline):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue
+        self.stride = 1.0 / weight
+        self.deadline = deadline
+        self.waiters = deque()      # futures of queued requests, oldest first
+        self.running = 0
+        self.pass_value = 0.0       # stride-scheduling virtual time
+
+        # Metrics
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_deadline = 0
+        self.max_queue_depth = 0
+        self.service_s = None       # moving average of time holding a slot
+        self.waits_ms = deque(maxlen=1000)
+
+    def queued(self):
+        return sum(1 for w in self.waiters if not w.done())
+
+    def expected_wait(self, slots):
+        """Rough time until a newly queued request would start, if no slot is free now."""
+        if self.service_s is None:
+            return 0.0
+        return (self.queued() + 1) * self.service_s / max(1, min(self.concurrency, slots))
+
+
+class PriorityScheduler:
+    def __init__(self, classes=SCHEDULER_CLASSES, max_concurrency=SCHEDULER_MAX_CONCURRENCY):
+        self.classes = {name: _Class(name, **limits) for name, limits in classes.items()}
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.vtime = 0.0
+
+    def _class(self, name):
+        return self.classes.get(name) or self.classes["complex"]
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, lowest pass value first."""
+        while self.running < self.max_concurrency:
+            ready = []
+            for c in self.classes.values():
+                while c.waiters and c.waiters[0].done():
+                    c.waiters.popleft()  # timed out or cancelled
+                if c.waiters and c.running < c.concurrency:
+                    ready.append(c)
+            if not ready:
+                return
+            c = min(ready, key=lambda c: c.pass_value)
+            self.vtime = c.pass_value
+            c.pass_value += c.stride
+            c.running += 1
+            self.running += 1
+            c.waiters.popleft().set_result(time.monotonic())
+
+    async def acquire(self, name):
+        """
+        Wait for a slot for class `name`. Returns the seconds spent queued.
+        Raises Overloaded if the request is shed. Pair with release(name).
+        """
+        if not SCHEDULER_ENABLED:
+            return 0.0
+        c = self._class(name)
+        start = time.monotonic()
+
+        queued = c.queued()
+        if queued >= c.queue_limit:
+            c.shed_full += 1
+            raise Overloaded(c.name, "full", c.deadline)
+        slot_free = not queued and c.running < c.concurrency and self.running < self.max_concurrency
+        expected = 0.0 if slot_free else c.expected_wait(self.max_concurrency)
+        if expected > c.deadline:
+            c.shed_deadline += 1
+            raise Overloaded(c.name, "wait exceeds deadline", expected)
+
+        if not c.waiters:
+            c.pass_value = max(c.pass_value, self.vtime)  # no credit for time spent idle
+        waiter = asyncio.get_running_loop().create_future()
+        c.waiters.append(waiter)
+        c.max_queue_depth = max(c.max_queue_depth, queued + 1)
+        self._dispatch()
+
+        try:
+            await asyncio.wait({waiter}, timeout=c.deadline)
+        except BaseException:
+            # Client went away while queued (or after being admitted)
+            if waiter.done() and not waiter.cancelled():
+                self.release(c.name)
+            else:
+                waiter.cancel()
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            c.shed_deadline += 1
+            raise Overloaded(c.name, "deadline exceeded", c.deadline)
+
+        c.admitted += 1
+        waited = waiter.result() - start
+        c.waits_ms.append(waited * 1000)
+        return waited
+
+    def release(self, name, held_s=None):
+        """Free a slot taken by acquire(); `held_s` updates the class's service time estimate."""
+        if not SCHEDULER_ENABLED:
+            return
+        c = self._class(name)
+        c.running -= 1
+        self.running -= 1
+        if held_s is not None:
+            c.service_s = held_s if c.service_s is None else 0.9 * c.service_s + 0.1 * held_s
+        self._dispatch()
+
+    def get_metrics(self):
+        metrics = {"enabled": SCHEDULER_ENABLED, "running": self.running, "max_concurrency": self.max_concurrency}
+        for name, c in self.classes.items():
+            waits = list(c.waits_ms)
+            p50, p95, p99 = np.percentile(waits, [50, 95, 99]) if waits else (0.0, 0.0, 0.0)
+            metrics[name] = {
+                "running": c.running,
+                "queue_depth": c.queued(),
+                "max_queue_depth": c.max_queue_depth,
+                "admitted": c.admitted,
+                "shed_queue_full": c.shed_full,
+                "shed_deadline": c.shed_deadline,
+                "queue_wait_ms": {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)},
+                "avg_service_ms": round(c.service_s * 1000, 2) if c.service_s is not None else None
+            }
+        return metrics
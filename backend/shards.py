@@ -0,0 +1,158 @@
+"""
+Sharded Index (Scatter-Gather Search)
+=====================================
+For corpora too large for one IndexFlatL2 scan to meet the latency target,
+ingest.py can split a collection's index into INDEX_SHARDS shards.
+
+Chunks are assigned to shards by a hash of their document name, so a
+document's chunks stay together. Each shard is an IndexIDMap2 that keeps
+the chunks' global ids, so metadata, filters and rescoring work unchanged.
+Shards live next to the full index, in "<index path>.shards/".
+
+At query time every shard is searched in its own worker process (one
+single-worker process pool per shard, so each process loads only its own
+shard) and the per-shard top-k lists are merged into a global top-k.
+All shards are exact L2 scans, so merged scores are identical to a single
+index's; ties are broken by chunk id.
+"""
+
+import glob
+import multiprocessing
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+
+SHARD_SUFFIX = ".shards"
+
+
+def shard_dir(index_path):
+    return index_path + SHARD_SUFFIX
+
+
+def shard_paths(index_path):
+    """Shard files for an index, in shard order ([] if it isn't sharded)."""
+    return sorted(glob.glob(os.path.join(shard_dir(index_path), "shard_*.bin")))
+
+
+def shard_of(document, n_shards):
+    """Stable shard number for a document (the same across runs and machines)."""
+    return zlib.crc32(document.encode("utf-8")) % n_shards
+
+
+def write_shard(path, vectors, ids):
+    """Save vectors with their global ids as one shard."""
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), np.asarray(ids, dtype="int64"))
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_shards(index, metadata, index_path, n_shards):
+    """
+    Split a flat index into `n_shards` shards by document and record each
+    chunk's shard in its metadata ("shard"). With n_shards <= 1 any old
+    shards are removed instead, so the full index is used again.
+    """
+    directory = shard_dir(index_path)
+    shutil.rmtree(directory, ignore_errors=True)
+    if n_shards <= 1:
+        for chunk_meta in metadata:
+            chunk_meta.pop("shard", None)
+        return
+
+    os.makedirs(directory)
+    assignment = np.array([shard_of(m["document"], n_shards) for m in metadata], dtype="int64")
+    vectors = index.reconstruct_n(0, index.ntotal)
+    for shard in range(n_shards):
+        ids = np.flatnonzero(assignment == shard)
+        write_shard(os.path.join(directory, f"shard_{shard:03d}.bin"), vectors[ids], ids)
+        print(f"  Shard {shard}: {len(ids)} vectors")
+    for chunk_meta, shard in zip(metadata, assignment):
+        chunk_meta["shard"] = int(shard)
+
+
+def merge_topk(distances, ids, k):
+    """Global top-k from per-shard (n, k) result arrays: smallest distance first, then lowest id."""
+    distances, ids = np.hstack(distances), np.hstack(ids)
+    order = np.lexsort((ids, distances), axis=1)[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+# --- Shard worker (runs in the shard's own process) ---
+
+_shard = None
+
+
+def _init_worker(path, threads):
+    global _shard
+    faiss.omp_set_num_threads(threads)
+    _shard = faiss.read_index(path)
+
+
+def _worker_info():
+    return _shard.ntotal, _shard.d
+
+
+def _worker_search(queries, k, ids):
+    params = None
+    if ids is not None:
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)))
+    return _shard.search(queries, k, params=params)
+
+
+def _worker_reconstruct(ids):
+    return np.vstack([_shard.reconstruct(int(i)) for i in ids])
+
+
+class ShardedIndex:
+    """
+    Scatter-gather search over shard worker processes. Quacks like the
+    parts of a FAISS index the retriever uses (search, reconstruct_batch,
+    ntotal, d), except that filters are passed as an id array.
+    """
+
+    def __init__(self, paths, shard_ids):
+        threads = max(1, (os.cpu_count() or 1) // len(paths))
+        context = multiprocessing.get_context("spawn")
+        self.pools = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker, initargs=(path, threads))
+            for path in paths
+        ]
+        self.shard_ids = np.asarray(shard_ids, dtype="int64")   # shard of every global chunk id
+        infos = [pool.submit(_worker_info).result() for pool in self.pools]
+        self.ntotal = sum(ntotal for ntotal, _ in infos)
+        self.d = infos[0][1]
+
+    def search(self, queries, k, ids=None):
+        """Search every shard (only those holding `ids`, if given) and merge the top k."""
+        futures = []
+        for shard, pool in enumerate(self.pools):
+            shard_ids = None if ids is None else ids[self.shard_ids[ids] == shard]
+            if shard_ids is not None and len(shard_ids) == 0:
+                continue
+            futures.append(pool.submit(_worker_search, queries, k, shard_ids))
+        if not futures:
+            return (np.full((len(queries), k), np.inf, dtype="float32"),
+                    np.full((len(queries), k), -1, dtype="int64"))
+
+        results = [future.result() for future in futures]
+        return merge_topk([d for d, _ in results], [i for _, i in results], k)
+
+    def reconstruct_batch(self, ids):
+        ids = np.asarray(ids, dtype="int64")
+        vectors = np.empty((len(ids), self.d), dtype="float32")
+        owners = self.shard_ids[ids]
+        futures = {shard: self.pools[shard].submit(_worker_reconstruct, ids[owners == shard])
+                   for shard in np.unique(owners)}
+        for shard, future in futures.items():
+            vectors[owners == shard] = future.result()
+        return vectors
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown(wait=False)
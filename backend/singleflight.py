@@ -0,0 +1,119 @@
+"""
+Single-Flight Request Coalescing
+================================
+When many users ask the same thing at once (e.g. during an incident),
+only the first request runs the pipeline (embed → search → LLM); identical
+requests arriving while it is in flight wait for it and share its result.
+
+Requests are grouped by a key — in the API, the normalized question, the
+routed model and the retrieval context (collection + filter) — and only
+history-free requests are coalesced, since a conversation changes the answer.
+
+  - The leader runs the work in its own thread; followers block on it.
+  - If the leader raises, every follower gets the same exception.
+  - Followers wait at most `timeout` seconds (SINGLEFLIGHT_TIMEOUT) and
+    then raise SingleFlightTimeout. A flight older than its timeout is no
+    longer joined: the next request for that key starts a fresh one.
+"""
+
+import threading
+import time
+
+from config import SINGLEFLIGHT_ENABLED, SINGLEFLIGHT_TIMEOUT
+
+
+class SingleFlightTimeout(Exception):
+    """Raised in a follower when the shared call did not finish in time."""
+
+    def __init__(self, timeout):
+        super().__init__(f"Timed out after {timeout:.1f}s waiting for an identical in-flight request")
+        self.timeout = timeout
+
+
+class _Call:
+    """One in-flight execution and everyone waiting on it."""
+
+    def __init__(self, timeout):
+        self.done = threading.Event()
+        self.started = time.monotonic()
+        self.timeout = timeout
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def expired(self, now):
+        return now - self.started > self.timeout
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+
+    def __init__(self, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self.calls = {}
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.shared_errors = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run `fn()` once per in-flight `key`.
+
+        Returns (result, shared): `shared` is True for followers that got
+        the leader's result. The result object is shared — don't modify it.
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None and not call.expired(time.monotonic()):
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                leader = False
+            else:
+                call = _Call(timeout)
+                self.calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(max(0.0, call.started + call.timeout - time.monotonic())):
+                with self.lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(call.timeout)
+            if call.error is not None:
+                with self.lock:
+                    self.shared_errors += 1
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                # An expired flight may already have been replaced by a newer one
+                if self.calls.get(key) is call:
+                    del self.calls[key]
+            call.done.set()
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                "enabled": SINGLEFLIGHT_ENABLED,
+                "in_flight": len(self.calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "shared_errors": self.shared_errors,
+                "max_waiters": self.max_waiters
+            }
@@ -0,0 +1,162 @@
+"""
+Server-Sent Events Streaming
+============================
+Helpers for /query_stream:
+
+  - format_event(): one SSE frame ("event: <type>\ndata: <json>\n\n")
+  - token_frames(): pulls a blocking TokenStream on a worker thread and
+    yields coalesced text frames, with a bounded buffer in between
+    (backpressure: a slow client pauses generation instead of piling up
+    tokens). Closing the generator, e.g. when the client disconnects,
+    closes the upstream Groq stream.
+  - StreamStats / get_metrics(): time-to-first-token and inter-token latency
+
+Event types sent by the API: sources, token, metadata, error, done.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import orjson
+
+from config import STREAM_FRAME_CHARS, STREAM_FRAME_MS, STREAM_BUFFER_TOKENS
+
+# Sentinel the worker thread sends after the last token
+_END = object()
+
+# Recent samples for /metrics
+_lock = threading.Lock()
+_counts = {"streams": 0, "completed": 0, "cancelled": 0, "errors": 0}
+_ttft_ms = deque(maxlen=1000)
+_inter_token_ms = deque(maxlen=10000)
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(list(values), [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+
+class StreamStats:
+    """Timing of one streamed answer, measured from `started` (perf_counter)."""
+
+    def __init__(self, started):
+        self.started = started
+        self.token_times = []
+        self.first_frame_at = None
+        self.frames = 0
+
+    @property
+    def ttft_ms(self):
+        if self.first_frame_at is None:
+            return None
+        return round((self.first_frame_at - self.started) * 1000, 2)
+
+    def inter_token_ms(self):
+        return list(np.diff(self.token_times) * 1000) if len(self.token_times) > 1 else []
+
+    def summary(self):
+        gaps = self.inter_token_ms()
+        return {
+            "ttft_ms": self.ttft_ms,
+            "inter_token_ms": _percentiles(gaps),
+            "tokens": len(self.token_times),
+            "frames": self.frames
+        }
+
+    def record(self, outcome):
+        """Add this stream to the process-wide metrics ("completed", "cancelled" or "errors")."""
+        with _lock:
+            _counts["streams"] += 1
+            _counts[outcome] += 1
+            if self.ttft_ms is not None:
+                _ttft_ms.append(self.ttft_ms)
+            _inter_token_ms.extend(self.inter_token_ms())
+
+
+def get_metrics():
+    with _lock:
+        return {
+            **_counts,
+            "ttft_ms": _percentiles(_ttft_ms),
+            "inter_token_ms": _percentiles(_inter_token_ms)
+        }
+
+
+async def token_frames(tokens, stats, frame_chars=STREAM_FRAME_CHARS, frame_ms=STREAM_FRAME_MS,
+                       buffer=STREAM_BUFFER_TOKENS):
+    """
+    Yield the text of `tokens` (a TokenStream) in frames of up to `frame_chars`.
+
+    The first frame is sent as soon as the first token arrives; later frames
+    wait up to `frame_ms` to collect more tokens. Upstream errors are raised.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=buffer)
+    stop = threading.Event()
+
+    def put(item):
+        """Blocking put from the worker thread; gives up once the consumer has gone."""
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set() or tokens.closed:
+                    future.cancel()
+                    return False
+
+    def produce():
+        try:
+            for token in tokens:
+                stats.token_times.append(time.perf_counter())
+                if stop.is_set() or not put(token):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    finished = None
+    try:
+        while finished is None:
+            frame = [await queue.get()]
+            if stats.frames and frame[0] is not _END and not isinstance(frame[0], Exception):
+                await asyncio.sleep(frame_ms / 1000)
+
+            # Drain whatever has arrived, up to the frame size
+            size = 0
+            text = []
+            while True:
+                item = frame.pop() if frame else queue.get_nowait()
+                if item is _END or isinstance(item, Exception):
+                    finished = item
+                    break
+                text.append(item)
+                size += len(item)
+                if size >= frame_chars or queue.empty():
+                    break
+
+            if text:
+                if stats.first_frame_at is None:
+                    stats.first_frame_at = time.perf_counter()
+                stats.frames += 1
+                yield "".join(text)
+
+        if isinstance(finished, Exception):
+            raise finished
+    finally:
+        # Client gone (or done): stop the worker and cancel generation upstream
+        stop.set()
+        tokens.close()
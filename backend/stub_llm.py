@@ -0,0 +1,85 @@
+"""
+Stub LLM
+========
+Deterministic stand-in for the Groq client, used for benchmarks and offline
+runs (LLM_BACKEND = "stub"). It mimics the parts of the Groq SDK that llm.py
+uses: `client.chat.completions.create(...)`, with and without streaming.
+
+Timing is configurable:
+  STUB_LLM_LATENCY_MS → delay before the first token
+  STUB_LLM_TOKEN_MS   → delay between tokens
+  STUB_LLM_TOKENS     → number of tokens in every answer
+"""
+
+import hashlib
+import time
+from types import SimpleNamespace
+
+from config import STUB_LLM_LATENCY_MS, STUB_LLM_TOKEN_MS, STUB_LLM_TOKENS
+
+# Vocabulary the fake answers are drawn from
+WORDS = (
+    "clearpath", "workflow", "settings", "team", "project", "report", "plan",
+    "support", "integration", "dashboard", "task", "account", "security", "data",
+    "the", "your", "to", "and", "in", "you", "can", "with", "for", "a"
+)
+
+
+def _answer_tokens(messages, n_tokens):
+    """Deterministic tokens derived from the prompt text."""
+    seed = hashlib.sha256(messages[-1]["content"].encode("utf-8")).digest()
+    return [
+        ("" if i == 0 else " ") + WORDS[seed[i % len(seed)] % len(WORDS)]
+        for i in range(n_tokens)
+    ]
+
+
+def _prompt_tokens(messages):
+    return sum(len(m["content"]) // 4 + 4 for m in messages)
+
+
+class _Completions:
+    def __init__(self, latency_ms, token_ms, n_tokens):
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.n_tokens = n_tokens
+
+    def create(self, model, messages, temperature=None, max_tokens=None, stream=False):
+        tokens = _answer_tokens(messages, min(self.n_tokens, max_tokens or self.n_tokens))
+        if stream:
+            return _Stream(tokens, self.latency_ms, self.token_ms)
+
+        time.sleep((self.latency_ms + self.token_ms * len(tokens)) / 1000)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))],
+            usage=SimpleNamespace(prompt_tokens=_prompt_tokens(messages), completion_tokens=len(tokens))
+        )
+
+
+class _Stream:
+    """Iterable of streamed chunks that stops once closed, like groq's Stream."""
+
+    def __init__(self, tokens, latency_ms, token_ms):
+        self.tokens = tokens
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.closed = False
+
+    def __iter__(self):
+        time.sleep(self.latency_ms / 1000)
+        for i, token in enumerate(self.tokens):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            if self.closed:
+                return
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+    def close(self):
+        self.closed = True
+
+
+class StubClient:
+    """Drop-in replacement for `groq.Groq` with deterministic output and timing."""
+
+    def __init__(self, latency_ms=STUB_LLM_LATENCY_MS, token_ms=STUB_LLM_TOKEN_MS, n_tokens=STUB_LLM_TOKENS):
+        self.chat = SimpleNamespace(completions=_Completions(latency_ms, token_ms, n_tokens))
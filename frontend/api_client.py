@@ -0,0 +1,35 @@
+"""
+API Client
+Pooled HTTP session and a reader for the backend's Server-Sent Events stream.
+"""
+
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def make_session(pool_size=10):
+    """A requests session that keeps connections to the API alive between calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def stream_query(session, url, payload, timeout=60):
+    """
+    POST to /query_stream and yield (event, data) pairs as they arrive:
+    sources, token, metadata, error, done.
+    """
+    with session.post(url, json=payload, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        event = None
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+            elif not line:
+                event = None
@@ -0,0 +1,90 @@
+"""
+Render Benchmark
+Measures the per-rerun cost of drawing the chat history against
+conversation length: the old approach (every bubble rebuilt and sent as
+its own st.markdown element on every rerun) vs render.py (bubbles memoized,
+history kept as one pre-joined string, only new messages appended).
+
+Only markup building and element counts are measured, so Streamlit is not
+needed to run it.
+
+Usage:
+  python bench_render.py
+  python bench_render.py --lengths 10,100,1000 --repeat 50
+"""
+
+import argparse
+import timeit
+
+from render import bubble, history_html
+
+
+def legacy_rerun(messages):
+    """The old app.py loop: one f-string and one element per message, every rerun."""
+    elements = []
+    for msg in messages:
+        bubble_type = "user-bubble" if msg["role"] == "user" else "assistant-bubble"
+        label = "Human" if msg["role"] == "user" else "Assistant"
+        elements.append(f'''
+            <div class="chat-bubble {bubble_type}">
+                <div class="bubble-header">{label}</div>
+                {msg["content"]}
+            </div>
+            ''')
+    return elements
+
+
+def incremental_rerun(state, messages):
+    """render.py: append markup for messages not yet rendered, emit one element."""
+    for msg in messages[state["rendered"]:]:
+        state["html"] += bubble(msg["role"], msg["content"])
+    state["rendered"] = len(messages)
+    return [state["html"]]
+
+
+def conversation(n_messages):
+    answer = ("Clearpath workflows let you automate approvals, notifications and task routing. "
+              "Open Settings → Automation to create one.\n") * 4
+    return [
+        {"role": "user", "content": f"Question number {i} about custom workflows?"} if i % 2 == 0
+        else {"role": "assistant", "content": f"{answer} (answer {i})"}
+        for i in range(n_messages)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history render cost vs conversation length")
+    parser.add_argument("--lengths", default="10,50,100,500,1000", help="messages in the conversation")
+    parser.add_argument("--repeat", type=int, default=20, help="reruns timed per length")
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print("Clearpath UI - Render Cost per Rerun")
+    print("=" * 72)
+    print(f"{'messages':>9} | {'legacy µs':>10} | {'elements':>8} | {'cached µs':>10} | {'elements':>8} | {'speedup':>7}")
+    print("-" * 72)
+
+    for n in [int(x) for x in args.lengths.split(",")]:
+        messages = conversation(n)
+
+        legacy_s = timeit.timeit(lambda: legacy_rerun(messages), number=args.repeat) / args.repeat
+
+        # Steady state: history already rendered, one new exchange per rerun
+        bubble.cache_clear()
+        state = {"html": history_html(messages[:-2]), "rendered": n - 2}
+        incremental_rerun(state, messages)
+        cached_s = timeit.timeit(lambda: incremental_rerun(state, messages), number=args.repeat) / args.repeat
+
+        first = incremental_rerun({"html": "", "rendered": 0}, messages)
+        assert len(first) == 1 and first[0] == history_html(messages)
+
+        print(f"{n:>9} | {legacy_s * 1e6:>10.1f} | {n:>8} | {cached_s * 1e6:>10.1f} | {1:>8} | "
+              f"{legacy_s / cached_s:>6.0f}x")
+
+    print("=" * 72)
+    print("Each element is a separate delta Streamlit serializes and sends to the browser,")
+    print("so the element count matters as much as the Python-side build time.")
+
+
+if __name__ == "__main__":
+    main()
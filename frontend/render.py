@@ -0,0 +1,221 @@
+"""
+Chat Rendering
+Markup for the Streamlit UI. Kept free of Streamlit calls so it is built
+once per process and can be timed on its own (see bench_render.py).
+
+Message bubbles are memoized per (role, content); the app keeps the
+history as one pre-joined string and only appends the newest bubbles.
+"""
+
+import html
+from functools import lru_cache
+
+# Static page chrome, built once at import
+STYLE = """
+<style>
+    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=Outfit:wght@300;400;600&display=swap');
+
+    :root {
+        --bg-color: #0d0e12;
+        --card-bg: rgba(23, 25, 35, 0.7);
+        --accent-blue: #3b82f6;
+        --accent-purple: #8b5cf6;
+        --text-primary: #f8fafc;
+        --text-secondary: #94a3b8;
+        --border-color: rgba(255, 255, 255, 0.08);
+    }
+
+    /* Global Overrides */
+    .stApp {
+        background: radial-gradient(circle at top right, #1a1b26, #0d0e12);
+        font-family: 'Inter', sans-serif;
+        color: var(--text-primary);
+    }
+
+    [data-testid="stHeader"] { background: transparent; }
+
+    /* Custom Header */
+    .header-container {
+        display: flex;
+        align-items: center;
+        justify-content: space-between;
+        padding: 1rem 0;
+        margin-bottom: 2rem;
+        border-bottom: 1px solid var(--border-color);
+    }
+    
+    .brand-title {
+        font-family: 'Outfit', sans-serif;
+        font-size: 1.8rem;
+        font-weight: 700;
+        background: linear-gradient(90deg, #60a5fa, #a78bfa);
+        -webkit-background-clip: text;
+        -webkit-text-fill-color: transparent;
+    }
+
+    /* Message Bubbles */
+    .chat-bubble {
+        padding: 1rem 1.25rem;
+        border-radius: 18px;
+        margin-bottom: 1rem;
+        font-size: 0.95rem;
+        line-height: 1.6;
+        max-width: 85%;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+        border: 1px solid var(--border-color);
+        animation: fadeIn 0.4s ease-out forwards;
+    }
+
+    @keyframes fadeIn {
+        from { opacity: 0; transform: translateY(10px); }
+        to { opacity: 1; transform: translateY(0); }
+    }
+
+    .user-bubble {
+        background: linear-gradient(135deg, #1e3a8a 0%, #1e40af 100%);
+        align-self: flex-end;
+        margin-left: auto;
+        color: white;
+        border-bottom-right-radius: 4px;
+    }
+
+    .assistant-bubble {
+        background: var(--card-bg);
+        border-bottom-left-radius: 4px;
+        backdrop-filter: blur(12px);
+    }
+
+    .bubble-header {
+        font-size: 0.75rem;
+        font-weight: 600;
+        text-transform: uppercase;
+        letter-spacing: 0.05em;
+        margin-bottom: 0.4rem;
+        opacity: 0.8;
+    }
+
+    /* Debug Cards */
+    .glass-card {
+        background: var(--card-bg);
+        border: 1px solid var(--border-color);
+        border-radius: 16px;
+        padding: 1.25rem;
+        margin-bottom: 1rem;
+        backdrop-filter: blur(20px);
+    }
+
+    .stat-label {
+        color: var(--text-secondary);
+        font-size: 0.75rem;
+        font-weight: 600;
+        text-transform: uppercase;
+        letter-spacing: 0.05em;
+    }
+
+    .stat-value {
+        color: var(--text-primary);
+        font-size: 1.1rem;
+        font-weight: 700;
+        margin-bottom: 0.5rem;
+    }
+
+    .tag-blue { background: rgba(59, 130, 246, 0.15); color: #60a5fa; padding: 2px 8px; border-radius: 6px; font-size: 0.7rem; font-weight: 700; }
+    .tag-purple { background: rgba(139, 92, 246, 0.15); color: #a78bfa; padding: 2px 8px; border-radius: 6px; font-size: 0.7rem; font-weight: 700; }
+    .tag-green { background: rgba(16, 185, 129, 0.15); color: #34d399; padding: 2px 8px; border-radius: 6px; font-size: 0.7rem; font-weight: 700; }
+
+    /* Hide standard chat elements for custom look */
+    .stChatMessage { display: none !important; }
+
+</style>
+"""
+
+HEADER = '''
+<div class="header-container">
+    <div style="display: flex; align-items: center; gap: 18px;">
+        <svg width="45" height="45" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M12 22C17.5228 22 22 17.5228 22 12C22 6.47715 17.5228 2 12 2C6.47715 2 2 6.47715 2 12C2 17.5228 6.47715 22 12 22Z" fill="#1e3a8a" stroke="#60a5fa" stroke-width="2"/>
+            <path d="M16 8L14 14L8 16L10 10L16 8Z" fill="#a78bfa" stroke="white" stroke-width="1.5"/>
+            <circle cx="12" cy="12" r="1" fill="white"/>
+        </svg>
+        <div class="brand-title" style="font-size: 2rem; letter-spacing: -0.02em;">CLEARPATH</div>
+    </div>
+    <div style="display: flex; gap: 1rem; align-items: center;">
+        <span class="tag-green">● SYSTEM LIVE</span>
+        <span style="color: #64748b; font-size: 0.8rem;">Build 2.0.6</span>
+    </div>
+</div>
+'''
+
+FOOTER = '''
+<div style="position: fixed; bottom: 10px; right: 20px; color: #475569; font-size: 0.7rem; letter-spacing: 0.1em;">
+    CLEARPATH V2.0 // RAG OPS // AI MODULES ACTIVE
+</div>
+'''
+
+TELEMETRY_OFFLINE = '''
+<div class="glass-card" style="opacity: 0.5;">
+    <div class="stat-label">Telemetry Offline</div>
+    <div style="font-size: 0.85rem; color: #64748b; margin-top: 5px;">
+        Citations and engine metadata will populate here once active.
+    </div>
+</div>
+'''
+
+
+def text_html(content):
+    """Escape message text for a bubble, keeping line breaks."""
+    return html.escape(content).replace("\n", "<br/>")
+
+
+@lru_cache(maxsize=4096)
+def bubble(role, content):
+    """Markup for one finished chat bubble (memoized)."""
+    return bubble_uncached(role, content)
+
+
+def bubble_uncached(role, content):
+    """Markup for a bubble that is still changing, e.g. an answer being streamed."""
+    bubble_type = "user-bubble" if role == "user" else "assistant-bubble"
+    label = "Human" if role == "user" else "Assistant"
+    return (
+        f'<div class="chat-bubble {bubble_type}">'
+        f'<div class="bubble-header">{label}</div>'
+        f'{text_html(content)}'
+        f'</div>'
+    )
+
+
+def history_html(messages):
+    """Markup for a whole conversation (one element instead of one per message)."""
+    return "".join(bubble(m["role"], m["content"]) for m in messages)
+
+
+def stats_html(meta):
+    """Model / latency / token cards for the insights column."""
+    tokens = meta.get("tokens", {"input": 0, "output": 0})
+    return f'''
+    <div class="glass-card">
+        <div class="stat-label">Model Engine</div>
+        <div class="stat-value">{meta['model_used']}</div>
+        <div style="display: flex; gap: 0.5rem;">
+            <span class="tag-blue">{meta['classification'].upper()}</span>
+            <span class="tag-purple">{meta['latency_ms']} MS</span>
+        </div>
+    </div>
+    <div class="glass-card">
+        <div class="stat-label">Token Consumption</div>
+        <div class="stat-value">Σ {tokens['input'] + tokens['output']}</div>
+        <div style="font-size: 0.8rem; color: #64748b;">
+            Input: {tokens['input']} | Output: {tokens['output']}
+        </div>
+    </div>
+    '''
+
+
+def source_html(source):
+    return f"""
+    <div style="padding: 8px; border-radius: 8px; background: rgba(255,255,255,0.03); border: 1px solid rgba(255,255,255,0.05); margin-bottom: 8px;">
+        <span style="color: #60a5fa; font-weight: 600; font-size: 0.85rem;">{html.escape(source['document'])}</span><br/>
+        <span style="color: #94a3b8; font-size: 0.75rem;">Page {source['page']} · Relevance: {int(source['relevance_score']*100)}%</span>
+    </div>
+    """